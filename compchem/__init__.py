@@ -5,10 +5,67 @@ import struct #for hex->dec
 import re # regex
 import numpy as np
 import math
+import gzip
+import bz2
+import lzma
+import io
 
 
 
 
+# file helpers
+# compressed inputs are read through large buffered reads
+COMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+READ_BUFFER = 1 << 20
+
+
+def compression(filename):
+  # compression suffix of a file name ('.gz', '.bz2', '.xz') or ''
+  name = filename.lower()
+  for suffix in COMPRESSORS:
+    if name.endswith(suffix):
+      return suffix
+  return ''
+
+
+def strip_compression(filename):
+  # file name without its compression suffix, e.g. to tell the format
+  return filename[:len(filename) - len(compression(filename))]
+
+
+def open_file(filename, index=None):
+  # open a file for reading bytes, decompressing .gz/.bz2/.xz on the fly;
+  #   with a GzipIndex, seeks in a .gz jump to the closest access point
+  #   (and reads add access points to the index)
+  suffix = compression(filename)
+  if suffix == '':
+    return open(filename, 'rb')
+  if suffix == '.gz' and index is not None:
+    return io.BufferedReader(IndexedGzipFile(filename, index), READ_BUFFER)
+  return io.BufferedReader(COMPRESSORS[suffix](filename, 'rb'), READ_BUFFER)
+
+
+def read_chunks(f, chunk=1 << 24):
+  # (offset, data) pieces of an open file, each ending at a line break
+  #   (but the last), for scanning big or compressed files line-wise
+  #   without holding them in memory
+  offset = 0
+  rest = b''
+  while True:
+    data = f.read(chunk)
+    if len(data) == 0:
+      if len(rest) > 0: yield offset, rest
+      return
+    data = rest + data
+    cut = data.rfind(b'\n') + 1
+    if cut == 0:
+      rest = data
+      continue
+    yield offset, data[:cut]
+    offset += cut
+    rest = data[cut:]
+
+
 # calculations & manipualtion functions 
 def rmsd(frame1, frame2):
   diff = frame1 - frame2
@@ -19,24 +76,114 @@ def rmsd(frame1, frame2):
   return round(rms, 3)
 
 
+# Growable typed buffer along the first axis: rows are appended in place
+#   with amortized doubling, and finalize() hands back an array of exactly
+#   the rows filled
+class GrowableArray:
+  def __init__(self, shape=(), dtype=float, capacity=16):
+    self.data = np.empty((max(capacity, 1),) + tuple(shape), dtype=dtype)
+    self.size = 0
+
+  def __len__(self):
+    return self.size
+
+  def reserve(self, n):
+    if n > len(self.data):
+      data = np.empty((max(n, 2*len(self.data)),) + self.data.shape[1:], dtype=self.data.dtype)
+      data[:self.size] = self.data[:self.size]
+      self.data = data
+
+  def append(self, row):
+    self.reserve(self.size + 1)
+    self.data[self.size] = row
+    self.size += 1
+
+  def extend(self, rows):
+    rows = np.asarray(rows)
+    self.reserve(self.size + len(rows))
+    self.data[self.size:self.size + len(rows)] = rows
+    self.size += len(rows)
+
+  def finalize(self):
+    # exact-capacity array of the filled rows; the buffer is released
+    data = self.data
+    if self.size < len(data):
+      data = data[:self.size].copy()
+    self.data = self.data[:0]
+    self.size = 0
+    return data
+
+
+# Per-atom fields of a frame, with the dtype and fill value each starts with
+FRAME_FIELDS = [('chains', '<U1', ''), ('indices', np.int64, 0), ('names', '<U4', ''),
+                ('types', '<U2', ''), ('resnames', '<U4', ''), ('resids', np.int64, 0),
+                ('occupancies', float, 1.), ('temp_factors', float, 0.),
+                ('charges', float, 0.), ('radii', float, 0.)]
+
+
+def empty_field(dtype, shape=(0,)):
+  # shared read-only empty array, so new frames don't allocate anything
+  #   until they're filled
+  key = (np.dtype(dtype).str, shape)
+  if key not in empty_fields:
+    empty_fields[key] = np.zeros(shape, dtype=dtype)
+    empty_fields[key].setflags(write=False)
+  return empty_fields[key]
+
+empty_fields = {}
+
+
+def default_field(field, n):
+  # read-only stand-in for a per-atom field that wasn't loaded (see the
+  #   fields= option of the loaders): n copies of the field's fill value,
+  #   broadcast so it takes no storage. They're shared, by size
+  key = (field, n)
+  if key not in default_fields:
+    if len(default_fields) >= 4096: default_fields.clear()
+    dtype, fill = FIELD_DEFAULTS[field]
+    default_fields[key] = np.broadcast_to(np.array(fill, dtype=dtype), (n,))
+  return default_fields[key]
+
+default_fields = {}
+
+
+def projected_fields(fields):
+  # set of per-atom fields to load, from a loader's fields= argument (all
+  #   of them by default); coordinates are always loaded
+  names = [field for field, dtype, fill in FRAME_FIELDS]
+  if fields is None:
+    return set(names)
+  if isinstance(fields, str): fields = [fields]
+  for field in fields:
+    assert (field in names or field == 'coordinates'), 'Unknown frame field "%s"!' % field
+  return set(fields) - {'coordinates'}
+
+FIELD_DEFAULTS = dict((field, (dtype, fill)) for field, dtype, fill in FRAME_FIELDS)
+# string fields that can be stored integer-coded (see compchem.categorical)
+CATEGORICAL_FIELDS = ['chains', 'names', 'types', 'resnames']
+EMPTY_FRAME = [(field, empty_field(dtype)) for field, dtype, fill in FRAME_FIELDS] + \
+              [('coordinates', empty_field(float, (0, 3))), ('bonds', empty_field(np.int64, (0, 2)))]
+
+
 # Single frame representing a single molecular system's 
-#   conformation and properties
+#   conformation and properties. Every frame holds its own per-atom
+#   arrays (struct of arrays, no per-instance __dict__), sized exactly to
+#   its atoms
 class MolecularFrame:
-  chains = []
-  indices = []
-  names = []
-  types = []
-  resnames = []
-  resids = []
-  occupancies = []
-  temp_factors = []
-  charges = []
-  radii = []
-  coordinates = None
-  bonds = []
-
-  def __init__(self):
-    pass
+  __slots__ = [field for field, dtype, fill in FRAME_FIELDS] + \
+              ['_coordinates', 'pending_transform', 'bonds', 'adjacency', 'neighbor_cache']
+
+  def __init__(self, natoms=0, dtype=float):
+    if natoms == 0 and dtype == float:
+      for field, empty in EMPTY_FRAME:
+        setattr(self, field, empty)
+    else:
+      for field, dtype, fill in FRAME_FIELDS:
+        setattr(self, field, np.full(natoms, fill, dtype=dtype))
+      self.coordinates = np.zeros((natoms, 3), dtype=dtype)
+      self.bonds = EMPTY_FRAME[-1][1]
+    self.adjacency = None
+    self.neighbor_cache = None
 
   def __getitem__(self, key):
     adat = { 'index': self.indices[key],
@@ -53,14 +200,64 @@ class MolecularFrame:
     return adat
 
   def __len__(self):
-    return len(self.names)
+    # every frame has coordinates, whatever other fields were loaded
+    return len(self._coordinates)
+
+  def compact(self, dtype=np.float32, categorical=True):
+    # Storage policy, in place: coordinates in dtype (e.g. float32, which
+    #   still holds the 3 decimals of a PDB file exactly enough) and the
+    #   string fields integer-coded. Geometry keeps the coordinate dtype
+    if dtype is not None:
+      self.coordinates = np.asarray(self.coordinates).astype(dtype, copy=False)
+    if categorical:
+      for field in CATEGORICAL_FIELDS:
+        setattr(self, field, Categorical(getattr(self, field)))
+    return self
+
+  ## Rigid-body moves are deferred: translate, rotate, center and align
+  #   only fuse a 4x4 affine transform (see compchem.transform) into
+  #   pending_transform, and the coordinates are moved in one in-place pass
+  #   when they are next read, or on apply()
+  @property
+  def coordinates(self):
+    if self.pending_transform is not None:
+      self.apply()
+    return self._coordinates
+
+  @coordinates.setter
+  def coordinates(self, coordinates):
+    # new coordinates replace the old ones, and any transform still pending
+    self._coordinates = coordinates
+    self.pending_transform = None
+
+  def transform(self, M):
+    # queue a 4x4 affine transform, after any already pending
+    M = np.asarray(M, dtype=float)
+    if self.pending_transform is None: self.pending_transform = M
+    else: self.pending_transform = self.pending_transform.dot(M)
+
+  def apply(self):
+    # move the coordinates by the pending transform, in place if they're a
+    #   writable float array (so trajectory frames move the trajectory)
+    M = self.pending_transform
+    self.pending_transform = None
+    crd = self._coordinates
+    if M is None or crd is None:
+      return
+    if not (isinstance(crd, np.ndarray) and crd.flags.writeable and crd.dtype.kind == 'f'):
+      crd = np.array(crd, dtype=float)
+    self._coordinates = apply_transform(crd, M)
 
   def measure_center(self):
-    # find mean of each column of coordinates
-    x = np.mean(self.coordinates[:,0])
-    y = np.mean(self.coordinates[:,1])
-    z = np.mean(self.coordinates[:,2])
+    # find mean of each column of the stored coordinates, moved by any
+    #   pending transform (the mean of moved points is the moved mean)
+    crd = self._coordinates
+    x = np.mean(crd[:,0])
+    y = np.mean(crd[:,1])
+    z = np.mean(crd[:,2])
     mean = np.array( (x,y,z) )
+    if self.pending_transform is not None:
+      mean = transform_point(self.pending_transform, mean)
     return mean
 
   def measure_dimensions(self):
@@ -74,68 +271,102 @@ class MolecularFrame:
     return np.array( (maxx-minx, maxy-miny, maxz-minz) )
 
   def translate(self, dx, dy, dz):
-    # add differential to every row of each column
-    self.coordinates[:,0] += dx
-    self.coordinates[:,1] += dy
-    self.coordinates[:,2] += dz
+    self.transform(translation((dx, dy, dz)))
 
   def center(self):
     c = self.measure_center()
     self.translate(-c[0], -c[1], -c[2])
 
   def rotate(self, d0x, d0y, d0z):
-    ## rotate around center of coordinates, so we need to center
-    ## the molecule on the origin before rotation, then translate back
-    c = self.measure_center()
-    self.translate(-c[0], -c[1], -c[2])
+    ## rotate around center of coordinates
     ## NOTE: d0's must be radians; add check TODO
-    # rotate around x-axis
-    cos0 = math.cos(d0x)
-    sin0 = math.sin(d0x)
-    Rx = np.matrix([[1.,0.,0.],[0., cos0, -sin0],[0., sin0, cos0]])
-    # rotate around y-axis
-    cos0 = math.cos(d0y)
-    sin0 = math.sin(d0y)
-    Ry = np.matrix([[cos0, 0., sin0],[0.,1.,0.],[-sin0, 0., cos0]])
-    # rotate around z-axis
-    cos0 = math.cos(d0z)
-    sin0 = math.sin(d0z)
-    Rz = np.matrix([[cos0, -sin0, 0.],[sin0, cos0, 0.],[0.,0.,1.]])
-    # combine to a single rotation matrix
-    Rt = Rx*Ry*Rz
-    # apply rotation matrix to coordinates
-    self.coordinates = np.array(self.coordinates * Rt)
-    # translate molecule back to its original center
-    self.translate(c[0], c[1], c[2])
+    self.transform(rotation(euler_rotation(d0x, d0y, d0z), about=self.measure_center()))
 
   def rotate_matrix(self, Rt, at_origin=False): #rotation matrix
-    # if needed, center on origin
-    c = [0., 0., 0.]
-    if not at_origin:
-      c = self.measure_center()
-      self.center()
-    # rotate
-    self.coordinates = self.coordinates.dot(Rt)
-    # translate back to position if needed
-    if not at_origin:
-      self.translate(c[0], c[1], c[2])
+    # rotate about the center, or about the origin
+    if at_origin:
+      self.transform(rotation(Rt))
+    else:
+      self.transform(rotation(Rt, about=self.measure_center()))
 
   def rmsd(self, other_frame):
     return rmsd(self.coordinates, other_frame.coordinates)
 
-  def align(self, other_frame):
-    X = self.coordinates
-    Y = other_frame.coordinates
+  def align(self, other_frame, mask=None, target_mask=None, weights=None):
+    # Superimpose this frame onto other_frame (Kabsch), moving all of its
+    #   atoms. mask/target_mask pick the fitted atoms (boolean or index
+    #   arrays, in matching order), target_mask defaults to mask, and
+    #   weights are per fitted atom. Returns rotation, translation, RMSD
+    if target_mask is None: target_mask = mask
+    X = np.asarray(other_frame.coordinates)
+    Y = np.asarray(self.coordinates)
+    if target_mask is not None: X = X[target_mask]
+    if mask is not None: Y = Y[mask]
+    R, t, rms = kabsch(Y, X, weights)
+    M = rotation(R)
+    M[3,:3] = t
+    self.transform(M)
+    return R, t, rms
+
+  def neighbor_index(self, cell_size=4.):
+    # Spatial index (CellList) over the current coordinates, for radius,
+    #   k-nearest and all-pairs queries. It is kept on the frame and only
+    #   rebuilt once the coordinates are replaced or changed in place,
+    #   which is spotted from a cheap fingerprint of the array
+    stamp = coordinate_stamp(self.coordinates) + (float(cell_size),)
+    if self.neighbor_cache is None or self.neighbor_cache[0] != stamp:
+      self.neighbor_cache = (stamp, CellList(np.asarray(self.coordinates, dtype=float), cell_size))
+    return self.neighbor_cache[1]
+
+  def perceive_bonds(self, tolerance=0.45):
+    # Fill in bonds from covalent radii (see compchem.bonds): an
+    #   (n_bonds, 2) index array, plus CSR adjacency for bonded()
+    elements = guess_elements(self.types, self.resnames)
+    self.bonds = perceive_bonds(self.coordinates, elements, tolerance, self.neighbor_index)
+    self.adjacency = bond_adjacency(self.bonds, len(self))
+    return self.bonds
+
+  def bonded(self, i):
+    # indices of the atoms bonded to atom i
+    if self.adjacency is None:
+      self.adjacency = bond_adjacency(self.bonds, len(self))
+    indptr, neighbors = self.adjacency
+    return neighbors[indptr[i]:indptr[i+1]]
+
+  def within(self, point, r):
+    # indices of the atoms within r of a point
+    return self.neighbor_index().query_radius(point, r)
+
+  def hierarchy(self):
+    # residue and chain index of this frame's topology (see
+    #   compchem.hierarchy), for per-residue reductions
+    return hierarchy(self)
+
+  def residue_centers(self):
+    return hierarchy(self).centers(self.coordinates)
 
-    ## calculate covariance matrix
-    C = X.T.dot(Y)
+  def residue_min_distances(self, points, cutoff=None):
+    # closest approach of every residue to some points, e.g. a ligand's
+    #   coordinates; inf past the cutoff, if one is given
+    return hierarchy(self).min_distances(self.coordinates, points, cutoff)
 
-    #u,s,vh = np.linalg.svd(C)
+  def select(self, selection):
+    # Boolean mask of the atoms matching a selection string (see
+    #   compchem.select), e.g. "resname LIG and not type H". Selections
+    #   are compiled once and their masks shared by every frame with the
+    #   same topology, so treat the result as read-only
+    if not isinstance(selection, Selection):
+      selection = compile_selection(selection)
+    return selection(self)
 
-    #d = int(np.sign(np.linalg.det(C)))
-    #T = np.matrix('1 0 0; 0 1 0; 0 0 %d' % d)
 
-    #U = vh.T.dot(T).dot(u.T)
-    #mobile.rotate_matrix(U, at_origin=True)
-    #mobile.translate(c[0], c[1], c[2])
-    #target.translate(c[0], c[1], c[2])
+from compchem.gzindex import *
+from compchem.categorical import *
+from compchem.pairwise import *
+from compchem.superpose import *
+from compchem.transform import *
+from compchem.neighbors import *
+from compchem.bonds import *
+from compchem.atommap import *
+from compchem.hierarchy import Hierarchy, hierarchy
+from compchem.select import Selection, compile_selection
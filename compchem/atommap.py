@@ -0,0 +1,318 @@
+import numpy as np
+from compchem.bonds import guess_elements, bond_adjacency
+from compchem.neighbors import CellList
+from compchem.superpose import kabsch
+
+
+## Atom mapping between two molecules by color refinement on the bond
+#   graph (Weisfeiler-Lehman): every atom starts with a label (its element)
+#   and repeatedly takes a new label from its own plus the multiset of its
+#   neighbors' labels. Both molecules are refined together as one graph,
+#   so equal labels mean equivalent atoms across the two
+
+def label_hash(labels):
+  # well-mixed 64-bit hash of integer labels (splitmix64), so sums of
+  #   hashes identify multisets of labels
+  x = labels.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+  x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+  x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+  return x ^ (x >> np.uint64(31))
+
+
+def refine_labels(labels, indptr, neighbors, keep=0):
+  # Refine labels (0..k-1) until the partition stops splitting. Returns
+  #   the stable labels, and the labels of the first keep rounds
+  isolated = np.diff(indptr) == 0
+  early = [labels]
+  while True:
+    # hash of (own label, multiset of neighbor labels) as one 64-bit key;
+    #   a trailing zero keeps reduceat in bounds for isolated atoms
+    hashes = np.append(label_hash(labels[neighbors]), np.uint64(0))
+    signature = np.add.reduceat(hashes, indptr[:-1])
+    signature[isolated] = 0
+    keys = label_hash(labels) * np.uint64(0x2545F4914F6CDD1D) + signature
+    unique, new = np.unique(keys, return_inverse=True)
+    # a refinement never merges classes, so same count means stable
+    if len(unique) == labels.max() + 1:
+      return labels, early[:keep+1]
+    labels = new.ravel()
+    if len(early) <= keep:
+      early.append(labels)
+
+
+def connected_components(indptr, neighbors):
+  # component label (its lowest atom index) of every atom, by min-label
+  #   propagation with pointer jumping
+  n = len(indptr) - 1
+  owner = np.repeat(np.arange(n), np.diff(indptr))
+  component = np.arange(n)
+  while True:
+    new = component.copy()
+    np.minimum.at(new, owner, component[neighbors])
+    new = new[new]
+    if np.array_equal(new, component):
+      return component
+    component = new
+
+
+def class_counts(labels, side):
+  # number of target (row 0) and mobile (row 1) atoms with each label
+  counts = np.zeros((2, labels.max() + 1), dtype=np.int64)
+  np.add.at(counts, (side.astype(int), labels), 1)
+  return counts
+
+
+def unbalanced(labels, side):
+  # number of atoms in classes with different counts on the two sides
+  counts = class_counts(labels, side)
+  return np.abs(counts[0] - counts[1]).sum()
+
+
+def independent_classes(classes, labels, tied, bonds):
+  # One tied class from each connected group of tied atoms, smallest
+  #   classes first. Atoms moved by a symmetry that aren't bonded to each
+  #   other through moved atoms can be swapped independently
+  is_tied = np.zeros(labels.max() + 1, dtype=bool)
+  is_tied[tied] = True
+  bonds = bonds[is_tied[labels[bonds[:,0]]] & is_tied[labels[bonds[:,1]]]]
+  group = connected_components(*bond_adjacency(bonds, len(labels)))
+  used = set()
+  batch = []
+  for members in classes:
+    groups = group[members].tolist()
+    if used.isdisjoint(groups):
+      used.update(groups)
+      batch.append(members)
+  return batch
+
+
+def separate(members, component):
+  # True if every member of a tied class is in a component of its own
+  return len(np.unique(component[members])) == len(members)
+
+
+def pair_nearest(t, m, coordinates):
+  # Pair target atoms t with mobile atoms m closest first: atoms that are
+  #   each other's nearest remaining partner are paired, and the rest go
+  #   round again. Returns the paired target and mobile atoms
+  pt, pm = [t[:0]], [m[:0]]
+  while len(t) > 0 and len(m) > 0:
+    dist, near_m = CellList(coordinates[m]).query_knn(coordinates[t], 1)
+    near_m = near_m[:,0]
+    near_t = CellList(coordinates[t]).query_knn(coordinates[m], 1)[1][:,0]
+    mutual = near_t[near_m] == np.arange(len(t))
+    # the closest pair is always mutual, unless distances tie exactly
+    if not mutual.any():
+      mutual[np.argmin(dist[:,0])] = True
+    pt.append(t[mutual])
+    pm.append(m[near_m[mutual]])
+    left = np.ones(len(m), dtype=bool)
+    left[near_m[mutual]] = False
+    t, m = t[~mutual], m[left]
+  return np.concatenate(pt), np.concatenate(pm)
+
+
+def break_ties(labels, classes, side, component, coordinates=None):
+  # Give one target and one mobile atom of each tied class a fresh label
+  #   of their own. A class with every member in its own component (e.g.
+  #   the waters, or the atoms of identical chains) is paired up all at
+  #   once, component by component in order, so every such class pairs
+  #   the same components. With coordinates, atoms are paired with their
+  #   nearest candidates instead of in order
+  labels = labels.copy()
+  fresh = labels.max() + 1
+  for members in classes:
+    members = members[np.argsort(component[members], kind='stable')]
+    t, m = members[~side[members]], members[side[members]]
+    if not separate(members, component):
+      t = t[:1]
+      if coordinates is not None:
+        m = m[np.argsort(np.sum(np.square(coordinates[m] - coordinates[t[0]]), axis=1), kind='stable')]
+      m = m[:1]
+    elif coordinates is not None:
+      t, m = pair_nearest(t, m, coordinates)
+    labels[t] = labels[m] = fresh + np.arange(len(t))
+    fresh += len(t)
+  return labels
+
+
+def superpose_matched(coordinates, labels, side):
+  # The combined coordinates with the mobile atoms superposed onto the
+  #   target on the atoms already matched one to one, so distances between
+  #   tied atoms compare like with like. Without three such atoms only the
+  #   centroids are matched
+  counts = class_counts(labels, side)
+  matched = np.flatnonzero(((counts[0] == 1) & (counts[1] == 1))[labels])
+  t, m = matched[~side[matched]], matched[side[matched]]
+  t, m = t[np.argsort(labels[t])], m[np.argsort(labels[m])]
+  coordinates = coordinates.copy()
+  if len(t) >= 3:
+    R, shift, rms = kabsch(coordinates[m], coordinates[t])
+    coordinates[side] = coordinates[side].dot(R) + shift
+  else:
+    coordinates[side] += coordinates[~side].mean(axis=0) - coordinates[side].mean(axis=0)
+  return coordinates
+
+
+# The atom mapping in two steps: the refinement of both bond graphs,
+#   which only depends on labels and bonds and is done once, and the
+#   breaking of ties, which depends on coordinates and is done by map()
+#   for each set of them (e.g. every docked pose of one ligand)
+class AtomMapping:
+  def __init__(self, target_labels, target_bonds, mobile_labels, mobile_bonds):
+    self.nt, self.nm = nt, nm = len(target_labels), len(mobile_labels)
+    if nt == 0 or nm == 0: return
+    # both molecules as one graph, mobile atoms numbered after the target's
+    start = np.unique(np.concatenate((np.asarray(target_labels), np.asarray(mobile_labels))), return_inverse=True)[1].ravel()
+    self.bonds = np.concatenate((np.asarray(target_bonds, dtype=np.int64).reshape(-1, 2),
+                                 np.asarray(mobile_bonds, dtype=np.int64).reshape(-1, 2) + nt))
+    self.indptr, self.neighbors = bond_adjacency(self.bonds, nt + nm)
+    self.side = np.arange(nt + nm) >= nt
+    # the first few rounds (like first, second and third shell
+    #   descriptors) are kept for atoms that don't match in the end
+    self.labels, self.history = refine_labels(start, self.indptr, self.neighbors, keep=3)
+    self.component = connected_components(self.indptr, self.neighbors)
+
+  def map(self, target_coordinates=None, mobile_coordinates=None):
+    # see map_atoms
+    nt, nm = self.nt, self.nm
+    if nt == 0 or nm == 0:
+      return np.full(nt, -1, dtype=np.int64)
+    labels, history, side, component = self.labels, self.history, self.side, self.component
+    bonds, indptr, neighbors = self.bonds, self.indptr, self.neighbors
+    coordinates = None
+    if target_coordinates is not None and mobile_coordinates is not None:
+      coordinates = np.concatenate((np.asarray(target_coordinates, dtype=float).reshape(-1, 3),
+                                    np.asarray(mobile_coordinates, dtype=float).reshape(-1, 3)))
+      coordinates = superpose_matched(coordinates, labels, side)
+
+    # Symmetric atoms (e.g. the two oxygens of a carboxylate) end up sharing
+    #   a label. Ties are broken by pairing up a target and a mobile atom of
+    #   a tied class under a fresh label and refining again, which carries
+    #   the choice over to the rest of the graph
+    warned = False
+    while True:
+      counts = class_counts(labels, side)
+      tied = np.flatnonzero((counts[0] == counts[1]) & (counts[0] > 1))
+      if len(tied) == 0:
+        break
+      atoms = np.flatnonzero(np.isin(labels, tied))
+      atoms = atoms[np.argsort(labels[atoms], kind='stable')]
+      classes = sorted(np.split(atoms, np.searchsorted(labels[atoms], tied)[1:]), key=len)
+      # Symmetries in separate parts of the molecule (ring flips in
+      #   different side chains, equivalent waters) are independent, so one
+      #   class from every connected group of tied atoms is broken at once
+      batch = independent_classes(classes, labels, tied, bonds)
+      if coordinates is None and not warned and any(separate(members, component) for members in batch):
+        print('!! compchem.atommap.map_atoms: identical unbonded parts paired in file order, '
+              'give coordinates to pair them by distance')
+        warned = True
+      # Equal labels don't always mean a true symmetry, though. A choice
+      #   that clashes leaves some class unbalanced between the two sides,
+      #   and then the longest run of the batch that doesn't clash is found
+      #   by bisection
+      balance = unbalanced(labels, side)
+      refined, lo, hi = None, 0, len(batch)
+      k = hi
+      while lo < hi:
+        trial = refine_labels(break_ties(labels, batch[:k], side, component, coordinates), indptr, neighbors)[0]
+        if unbalanced(trial, side) <= balance:
+          refined, lo = trial, k
+        else:
+          hi = k - 1
+        k = (lo + hi + 1) // 2
+      if refined is None:
+        # even one class clashes, so pair up a single target atom, trying
+        #   its candidate partners until one keeps both sides balanced
+        members = batch[0]
+        t = members[~side[members]][0]
+        candidates = members[side[members]]
+        if coordinates is not None:
+          candidates = candidates[np.argsort(np.sum(np.square(coordinates[candidates] - coordinates[t]), axis=1),
+                                             kind='stable')]
+        for m in candidates:
+          trial = labels.copy()
+          trial[[t, m]] = labels.max() + 1
+          trial = refine_labels(trial, indptr, neighbors)[0]
+          if refined is None or unbalanced(trial, side) < unbalanced(refined, side):
+            refined = trial
+          if unbalanced(trial, side) <= balance:
+            break
+      labels = refined
+
+    mapping = np.full(nt, -1, dtype=np.int64)
+    # atoms whose label is unique on both sides are matched; if the graphs
+    #   differ somewhere, atoms left over are matched on the coarser labels
+    #   of earlier rounds, as long as those still pair them one to one
+    for labels in [labels] + history[::-1]:
+      free = np.concatenate((mapping == -1, np.ones(nm, dtype=bool)))
+      free[nt + mapping[mapping >= 0]] = False
+      atoms = np.flatnonzero(free)
+      counts = np.zeros((2, labels.max() + 1), dtype=np.int64)
+      np.add.at(counts, (side[atoms].astype(int), labels[atoms]), 1)
+      unique = (counts[0] == 1) & (counts[1] == 1)
+      atoms = atoms[unique[labels[atoms]]]
+      t, m = atoms[~side[atoms]], atoms[side[atoms]]
+      # one of each per label, so sorting by label lines them up
+      t, m = t[np.argsort(labels[t])], m[np.argsort(labels[m])]
+      mapping[t] = m - nt
+    return mapping
+
+
+def map_atoms(target_labels, target_bonds, mobile_labels, mobile_bonds,
+              target_coordinates=None, mobile_coordinates=None):
+  # Map the atoms of a target molecule onto a mobile one, given initial
+  #   labels (e.g. elements) and (n_bonds, 2) bond arrays for each. Returns
+  #   an index array over the target atoms holding the matching mobile
+  #   atom, or -1 where no match could be made. Atoms the bonds can't tell
+  #   apart (symmetric groups, identical unbonded parts) are paired by
+  #   distance when both sets of coordinates are given, after superposing
+  #   the two on the atoms that are told apart
+  mapping = AtomMapping(target_labels, target_bonds, mobile_labels, mobile_bonds)
+  return mapping.map(target_coordinates, mobile_coordinates)
+
+
+def subgraph_bonds(bonds, mask, natoms):
+  # bonds among the atoms selected by mask, renumbered to the selection
+  keep = np.zeros(natoms, dtype=bool)
+  keep[mask] = True
+  renumber = np.cumsum(keep) - 1
+  bonds = np.asarray(bonds, dtype=np.int64).reshape(-1, 2)
+  bonds = bonds[keep[bonds[:,0]] & keep[bonds[:,1]]]
+  return renumber[bonds]
+
+
+# AtomMapping of the selected atoms of two frames (see map_frames), for
+#   pairing the atoms of many frames with the same atoms (docked poses)
+#   without refining their bond graphs again
+class FrameMapping(AtomMapping):
+  def __init__(self, target, mobile, target_mask=None, mask=None):
+    sides = []
+    for frame, sel in ((target, target_mask), (mobile, mask)):
+      if len(frame.bonds) == 0:
+        frame.perceive_bonds()
+      sel = np.arange(len(frame)) if sel is None else np.arange(len(frame))[sel]
+      elements = guess_elements(frame.types, frame.resnames)[sel]
+      sides.append((sel, elements, subgraph_bonds(frame.bonds, sel, len(frame))))
+    (self.target_atoms, telem, tbonds), (self.mobile_atoms, melem, mbonds) = sides
+    AtomMapping.__init__(self, telem, tbonds, melem, mbonds)
+
+  def pairs(self, target_coordinates, mobile_coordinates):
+    # paired (target, mobile) atom indices into the full frames, ties
+    #   broken on these coordinates
+    mapping = self.map(np.asarray(target_coordinates)[self.target_atoms],
+                       np.asarray(mobile_coordinates)[self.mobile_atoms])
+    mapped = mapping >= 0
+    return self.target_atoms[mapped], self.mobile_atoms[mapping[mapped]]
+
+
+def map_frames(target, mobile, target_mask=None, mask=None):
+  # Match the atoms of two frames of the same molecule whatever their
+  #   order, by element and bonding (perceived if the frames have none).
+  #   target_mask/mask restrict the mapping to some atoms, e.g. heavy
+  #   atoms only. Atoms the bonding can't tell apart go to the nearest
+  #   candidate once the frames are superposed on the rest. Returns
+  #   paired (target, mobile) atom indices into the full frames, for e.g.
+  #   MolecularFrame.align
+  mapping = FrameMapping(target, mobile, target_mask, mask)
+  return mapping.pairs(target.coordinates, mobile.coordinates)
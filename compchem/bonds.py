@@ -0,0 +1,79 @@
+import numpy as np
+from compchem.neighbors import CellList
+
+
+# Single-bond covalent radii in Angstroms (Cordero et al., Dalton Trans.
+#   2008), keyed by upper-case element symbol
+COVALENT_RADII = {
+  'H': 0.31, 'LI': 1.28, 'B': 0.84, 'C': 0.76, 'N': 0.71, 'O': 0.66,
+  'F': 0.57, 'NA': 1.66, 'MG': 1.41, 'AL': 1.21, 'SI': 1.11, 'P': 1.07,
+  'S': 1.05, 'CL': 1.02, 'K': 2.03, 'CA': 1.76, 'MN': 1.39, 'FE': 1.32,
+  'CO': 1.26, 'NI': 1.24, 'CU': 1.32, 'ZN': 1.22, 'SE': 1.20, 'BR': 1.20,
+  'I': 1.39, 'HG': 1.32, 'CD': 1.44,
+}
+# radius used for elements missing from the table
+DEFAULT_RADIUS = 0.76
+# atoms closer than this are overlapping copies, not bonded
+MIN_BOND_LENGTH = 0.4
+# Atom names of standard residues that are also element symbols in the
+#   table: a two-letter type made from one of these names (PQR has no
+#   element column) is C-alpha, C-delta, H-gamma or a heme N-A, not Ca,
+#   Cd, Hg or Na. Other known two-letter elements (SE of MSE) are kept
+ORGANIC_NAMES = {'CA': 'C', 'CD': 'C', 'HG': 'H', 'NA': 'N'}
+
+
+def guess_elements(types, resnames=None):
+  # Element symbols (upper case) from atom types. Two-letter types are kept
+  #   when they are known elements, unless they are one of the organic
+  #   atom names above outside a residue of that name, e.g. CA in an ALA
+  #   is carbon, CA in a CA residue is calcium; others are their first letter
+  types = np.asarray(types).astype(object)
+  types[types == None] = ''
+  types = np.char.upper(np.char.strip(types.astype(str)))
+  # work out both readings once per distinct type
+  unique, inverse = np.unique(types, return_inverse=True)
+  inverse = inverse.ravel()
+  literal = np.array([t if t in COVALENT_RADII else t[:1] for t in unique], dtype='<U2')
+  named = np.array([ORGANIC_NAMES.get(t, e) for t,e in zip(unique, literal)], dtype='<U2')
+  elements = named[inverse]
+  if resnames is not None:
+    own = types == np.char.upper(np.char.strip(np.asarray(resnames).astype(str)))
+    elements = np.where(own, literal[inverse], elements)
+  return elements
+
+
+def covalent_radii(elements):
+  # per-atom covalent radii for an array of element symbols
+  unique, inverse = np.unique(elements, return_inverse=True)
+  missing = [e for e in unique if e not in COVALENT_RADII]
+  if len(missing) > 0:
+    print('!! No covalent radius for elements %s, using %.2f A' % (', '.join(missing), DEFAULT_RADIUS))
+  return np.array([COVALENT_RADII.get(e, DEFAULT_RADIUS) for e in unique])[inverse.ravel()]
+
+
+def perceive_bonds(coordinates, elements, tolerance=0.45, index=None):
+  # Bonds between atoms closer than the sum of their covalent radii plus
+  #   tolerance, as an (n_bonds, 2) array of atom indices (i < j, sorted).
+  #   Candidates come from a neighbor search at the largest possible bond
+  #   length; index optionally gives the CellList to use for a cell size
+  #   (e.g. MolecularFrame.neighbor_index, to reuse a cached one)
+  radii = covalent_radii(elements)
+  if len(radii) < 2:
+    return np.zeros((0, 2), dtype=np.int64)
+  cutoff = 2. * radii.max() + tolerance
+  if index is None:
+    index = lambda cell_size: CellList(coordinates, cell_size)
+  pairs, dist = index(cutoff).pairs(cutoff)
+  bonded = (dist < radii[pairs[:,0]] + radii[pairs[:,1]] + tolerance) & (dist > MIN_BOND_LENGTH)
+  return pairs[bonded]
+
+
+def bond_adjacency(bonds, natoms):
+  # CSR adjacency (indptr, neighbors) for a bond list: the atoms bonded
+  #   to atom i are neighbors[indptr[i]:indptr[i+1]], in increasing order
+  bonds = np.asarray(bonds, dtype=np.int64).reshape(-1, 2)
+  both = np.concatenate((bonds, bonds[:, ::-1]))
+  both = both[np.lexsort((both[:,1], both[:,0]))]
+  indptr = np.zeros(natoms + 1, dtype=np.int64)
+  np.cumsum(np.bincount(both[:,0], minlength=natoms), out=indptr[1:])
+  return indptr, both[:,1].copy()
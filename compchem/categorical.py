@@ -0,0 +1,125 @@
+import numpy as np
+
+
+def code_dtype(ncategories):
+  # smallest unsigned integer type that can number the categories
+  for dtype in (np.uint8, np.uint16, np.uint32):
+    if ncategories <= np.iinfo(dtype).max + 1:
+      return dtype
+  return np.int64
+
+
+## Categorical (integer-coded) column for repetitive per-atom strings, like
+#   resnames, chains, types and names: every atom stores a small integer
+#   code into one array of distinct values. It stands in for the unicode
+#   array it replaces: np.asarray() decodes it, indexing with a slice or
+#   mask gives another Categorical, and comparisons against a string are
+#   done once per category instead of once per atom
+class Categorical:
+  __slots__ = ['codes', 'categories']
+  __hash__ = None
+
+  def __init__(self, values=None, codes=None, categories=None):
+    if isinstance(values, Categorical):
+      codes, categories = values.codes, values.categories
+    elif values is not None:
+      values = np.asarray(values)
+      if values.dtype == object:
+        # missing values (None) get a category of their own, at the end
+        missing = np.array([v is None for v in values], dtype=bool)
+        categories, inverse = np.unique(values[~missing].astype(str), return_inverse=True)
+        codes = np.full(len(values), len(categories), dtype=np.int64)
+        codes[~missing] = inverse.ravel()
+        if missing.any():
+          categories = np.append(categories.astype(object), None)
+      else:
+        categories, codes = np.unique(values, return_inverse=True)
+    self.categories = np.asarray(categories)
+    self.codes = np.asarray(codes).ravel().astype(code_dtype(len(self.categories)), copy=False)
+
+  def __repr__(self):
+    return 'Categorical(%s, %d categories)' % (np.asarray(self), len(self.categories))
+
+  def __len__(self):
+    return len(self.codes)
+
+  def __iter__(self):
+    return iter(np.asarray(self))
+
+  @property
+  def shape(self):
+    return self.codes.shape
+
+  @property
+  def ndim(self):
+    return 1
+
+  @property
+  def dtype(self):
+    return self.categories.dtype
+
+  @property
+  def nbytes(self):
+    return self.codes.nbytes + self.categories.nbytes
+
+  def __array__(self, dtype=None, copy=None):
+    values = self.categories[self.codes]
+    return values if dtype is None else values.astype(dtype)
+
+  def astype(self, dtype, copy=True):
+    return np.asarray(self).astype(dtype)
+
+  def tolist(self):
+    return np.asarray(self).tolist()
+
+  def __getitem__(self, key):
+    codes = self.codes[key]
+    if np.ndim(codes) == 0:
+      return self.categories[codes]
+    return Categorical(codes=codes, categories=self.categories)
+
+  def __setitem__(self, key, values):
+    # rare enough to simply decode, assign and recode
+    decoded = np.asarray(self).copy()
+    if decoded.dtype.kind == 'U':
+      width = max(decoded.dtype.itemsize, np.asarray(values).astype(str).dtype.itemsize) // 4
+      decoded = decoded.astype('<U%d' % max(width, 1))
+    decoded[key] = values
+    other = Categorical(decoded)
+    self.codes, self.categories = other.codes, other.categories
+
+  def compare(self, other, op):
+    if isinstance(other, Categorical) and other.categories is self.categories:
+      return op(self.codes, other.codes)
+    if np.ndim(other) == 0:
+      # decide per category, then look that up per atom
+      return op(self.categories, other)[self.codes]
+    return op(np.asarray(self), np.asarray(other))
+
+  def __eq__(self, other):
+    return self.compare(other, np.equal)
+
+  def __ne__(self, other):
+    return self.compare(other, np.not_equal)
+
+  def isin(self, values):
+    # mask of atoms whose value is one of values
+    return np.isin(self.categories, values)[self.codes]
+
+
+def categorical(values):
+  # integer-coded copy of a string column; other columns are left alone
+  if isinstance(values, Categorical):
+    return values
+  values = np.asarray(values)
+  if values.dtype.kind not in 'USO':
+    return values
+  return Categorical(values)
+
+
+def comparable(values):
+  # array whose equal entries are the equal values of a column: the codes
+  #   of a Categorical (no decoding), or the values themselves
+  if isinstance(values, Categorical):
+    return values.codes
+  return np.asarray(values)
@@ -0,0 +1,307 @@
+
+import os, os.path
+import re # regex
+import mmap
+import numpy as np
+from compchem import *
+from compchem.trajectory import *
+from compchem.pdb import format_atoms
+
+
+## Function for loading PDBx/mmCIF files (all models of the first data block)
+#   extra keyword arguments (e.g. dtype=np.float32) are passed on to CIF
+def load_cif(filename, **kwargs):
+  return CIF(filename, **kwargs)
+
+
+ATOM_SITE_LOOP = re.compile(rb'^loop_[ \t]*\r?\n((?:[ \t]*_atom_site\.\S+[ \t]*\r?\n)+)', re.M)
+# a loop's rows run up to the next comment, loop, item or data block
+LOOP_END = [b'\n#', b'\nloop_', b'\n_', b'\ndata_', b'\nsave_']
+# single-row _atom_site written as "_atom_site.name value" pairs
+ATOM_SITE_ITEM = re.compile(rb'^_atom_site\.(\S+)[ \t]+(\S.*?)[ \t]*\r?$', re.M)
+STRUCT_TITLE = re.compile(rb'^_struct\.title[ \t]*(.*?)[ \t]*\r?$', re.M)
+# quoted values may hold spaces; a quote only closes before whitespace
+TOKEN = re.compile(rb"'(?:[^']|'(?=\S))*'|\"(?:[^\"]|\"(?=\S))*\"|\S+")
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[[ord(c) for c in ' \t\r\n']] = True
+
+# _atom_site columns behind each frame field, preferred first; the
+#   author's numbering/naming matches what PDB files carry
+CIF_COLUMNS = {
+  'indices':      ['id'],
+  'names':        ['auth_atom_id', 'label_atom_id'],
+  'resnames':     ['auth_comp_id', 'label_comp_id'],
+  'chains':       ['auth_asym_id', 'label_asym_id'],
+  'resids':       ['auth_seq_id', 'label_seq_id'],
+  'types':        ['type_symbol'],
+  'occupancies':  ['occupancy'],
+  'temp_factors': ['B_iso_or_equiv'],
+  'charges':      ['pdbx_formal_charge'],
+}
+CIF_AXES = ['Cartn_x', 'Cartn_y', 'Cartn_z']
+# unknown ('?') and not applicable ('.') values
+CIF_MISSING = [b'?', b'.']
+
+
+def token_columns(body, ncols, wanted=None, chunk=1 << 24):
+  # Split the rows of a loop into columns of byte strings, for the column
+  #   numbers in wanted (all by default). Rows are tokenized a chunk of
+  #   lines at a time, which bounds the temporary arrays. A row may run
+  #   over several lines, so a chunk that splits one takes more lines
+  wanted = list(range(ncols)) if wanted is None else list(wanted)
+  parts = [[] for k in wanted]
+  start = stop = 0
+  while start < len(body):
+    stop = body.find(b'\n', max(stop, start + chunk))
+    stop = len(body) if stop < 0 else stop + 1
+    columns = chunk_columns(body[start:stop], ncols, wanted, stop == len(body))
+    if columns is None: continue
+    for part, column in zip(parts, columns):
+      part.append(column)
+    start = stop
+  return [np.concatenate(part) if len(part) > 0 else np.zeros(0, dtype='S1') for part in parts]
+
+
+def chunk_columns(body, ncols, wanted, final=True):
+  # Token boundaries are found on the raw bytes with NumPy, and every
+  #   column is gathered into one fixed-width array, so nothing is split
+  #   per token in Python. Quoted values with spaces in them fall back to
+  #   a regex tokenizer
+  buf = np.frombuffer(body, dtype=np.uint8)
+  space = np.concatenate(([True], WHITESPACE[buf], [True]))
+  edge = np.diff(space.view(np.int8))
+  del space
+  starts = np.flatnonzero(edge == -1)
+  ends = np.flatnonzero(edge == 1)
+  del edge
+  if len(starts) > 0:
+    first, last = buf[starts], buf[ends - 1]
+    quoted = (first == ord("'")) | (first == ord('"'))
+    if (quoted & ((ends - starts < 2) | (last != first))).any():
+      table = regex_columns(body, ncols, final)
+      return None if table is None else [table[k] for k in wanted]
+    # a ';' opening a line starts a multi-line text field
+    text = (first == ord(';')) & ((starts == 0) | (buf[np.maximum(starts - 1, 0)] == ord('\n')))
+    assert not text.any(), "Multi-line text fields in _atom_site are not supported!"
+    # drop the quotes around quoted values
+    starts += quoted
+    ends -= quoted
+  if len(starts) % ncols != 0 and not final: return None
+  assert (len(starts) % ncols == 0), "_atom_site loop has %d values for %d columns!" % (len(starts), ncols)
+  starts = starts.reshape(-1, ncols)
+  ends = ends.reshape(-1, ncols)
+  return [gather(buf, starts[:,k], ends[:,k]) for k in wanted]
+
+
+def find_first(data, markers, start=0):
+  # offset of the earliest of several markers (plain finds, no regex scan)
+  found = [data.find(marker, start) for marker in markers]
+  found = [k for k in found if k >= 0]
+  return min(found) + 1 if len(found) > 0 else len(data)
+
+
+def gather(buf, starts, ends):
+  # byte strings buf[start:end] as one fixed-width 'S' array
+  lengths = ends - starts
+  width = max(int(lengths.max()) if len(lengths) > 0 else 1, 1)
+  # one pass per character position, padded so no index runs off the end
+  padded = np.concatenate((buf, np.zeros(width, dtype=np.uint8)))
+  chars = np.empty((len(starts), width), dtype=np.uint8)
+  for j in range(width):
+    chars[:,j] = padded[starts + j]
+  chars[np.arange(width) >= lengths[:, np.newaxis]] = 0
+  return chars.view('S%d' % width).ravel()
+
+
+def regex_columns(body, ncols, final=True):
+  tokens = TOKEN.findall(body)
+  if len(tokens) % ncols != 0 and not final: return None
+  assert (len(tokens) % ncols == 0), "_atom_site loop has %d values for %d columns!" % (len(tokens), ncols)
+  tokens = [t[1:-1] if t[:1] in (b"'", b'"') and len(t) > 1 else t for t in tokens]
+  table = np.array(tokens, dtype=bytes).reshape(-1, ncols)
+  return [table[:,k] for k in range(ncols)]
+
+
+def cif_float(col, default=0.):
+  # vectorized conversion, missing values ('?', '.') take the default
+  col = col.copy()
+  missing = np.isin(col, CIF_MISSING)
+  col[missing] = b'0'
+  values = col.astype(float)
+  values[missing] = default
+  return values
+
+
+def cif_int(col):
+  # integers and a mask of missing values
+  col = col.copy()
+  missing = np.isin(col, CIF_MISSING)
+  col[missing] = b'0'
+  return col.astype(np.int64), missing
+
+
+def cif_string(col):
+  col = col.astype(str)
+  col[np.isin(col, ['?', '.'])] = ''
+  return col
+
+
+# Single model from an mmCIF file, with the same arrays as the PDB frames
+class CIFFrame(MolecularFrame):
+  __slots__ = ()
+
+  def __repr__(self):
+    return format_atoms(self) + "TER\n"
+
+
+## Core mmCIF Parser: only the first data block's _atom_site category (and
+#   its title) are read, every model of it becoming a frame
+class CIF:
+  def __init__(self, filename, dtype=np.float64, categorical=False, fields=None):
+    # check to make sure file exists
+    assert (os.path.isfile(filename)), "File does not exist (%s)!" % filename
+    self.frames = []
+    self.filename = filename
+    self.title = ''
+    # storage policy, as for PDB
+    self.dtype = np.dtype(dtype)
+    self.categorical = categorical
+    # column projection, as for PDB: other columns are never gathered
+    self.fields = projected_fields(fields)
+    self.parse()
+
+  def __repr__(self):
+    rep = '* mmCIF-style object (%s).' % self.filename
+    rep += '\n  + %d frames' % len(self)
+    if self.title != '': rep += '\n  + ' + self.title
+    return rep
+
+  def __len__(self):
+    return len(self.frames)
+
+  def __getitem__(self, indices):
+    return self.frames[indices]
+
+  def trajectory(self):
+    # all models as one shared-topology Trajectory (e.g. NMR ensembles)
+    return Trajectory(frames=self.frames)
+
+  def parse(self):
+    with open_file(self.filename) as f:
+      if compression(self.filename) == '' and os.path.getsize(self.filename) > 0:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      else:
+        data = f.read()
+      # only the first data block
+      second = data.find(b'\ndata_', data.find(b'data_') + 1)
+      block = data[:second + 1] if second >= 0 else data[:]
+      if isinstance(data, mmap.mmap): data.close()
+    self.title = self.parse_title(block)
+    names, columns = self.atom_site(block)
+    if len(names) > 0:
+      self.frames = self.build_frames(dict(zip(names, columns)))
+
+  def parse_title(self, block):
+    m = STRUCT_TITLE.search(block)
+    if m is None: return ''
+    value = m.group(1)
+    if value == b'':
+      # value on the following lines, as a ;-delimited text field
+      rest = block[m.end():].lstrip(b'\r\n')
+      if rest.startswith(b';'):
+        value = rest[1:rest.find(b'\n;')] if rest.find(b'\n;') > 0 else rest[1:]
+      else:
+        value = rest.split(b'\n', 1)[0]
+    value = value.strip()
+    if value[:1] in (b"'", b'"') and value[-1:] == value[:1]:
+      value = value[1:-1]
+    return ' '.join(value.decode('ascii', 'replace').split())
+
+  def atom_site(self, block):
+    # (column names, columns) of the _atom_site category
+    m = ATOM_SITE_LOOP.search(block)
+    if m is None:
+      # a lone atom written as item/value pairs
+      items = ATOM_SITE_ITEM.findall(block)
+      names = [name.decode('ascii') for name, value in items]
+      return names, [regex_columns(value, 1)[0] for name, value in items]
+    names = [line.strip()[len(b'_atom_site.'):].decode('ascii') for line in m.group(1).splitlines() if line.strip()]
+    body = block[m.end():find_first(block, LOOP_END, m.end())]
+    # only the columns frames are built from
+    used = set(CIF_AXES + ['pdbx_PDB_model_num'])
+    for field in self.fields:
+      used.update(CIF_COLUMNS.get(field, []))
+    if 'resids' in self.fields: used.add('label_seq_id')
+    wanted = [k for k,name in enumerate(names) if name in used]
+    return [names[k] for k in wanted], token_columns(body, len(names), wanted)
+
+  def column(self, columns, field):
+    for name in CIF_COLUMNS[field]:
+      if name in columns:
+        return columns[name]
+    return None
+
+  def build_frames(self, columns):
+    N = len(next(iter(columns.values())))
+    for axis in CIF_AXES:
+      assert (axis in columns), "No %s column in _atom_site of %s!" % (axis, self.filename)
+    coordinates = np.empty((N, 3), dtype=self.dtype)
+    for k,axis in enumerate(CIF_AXES):
+      coordinates[:,k] = cif_float(columns[axis])
+    arrays = {'coordinates': coordinates}
+
+    fields = self.fields
+    if 'indices' in fields:
+      col = self.column(columns, 'indices')
+      arrays['indices'] = cif_int(col)[0] if col is not None else np.arange(1, N+1)
+    if 'resids' in fields:
+      col = self.column(columns, 'resids')
+      if col is None:
+        arrays['resids'] = np.ones(N, dtype=np.int64)
+      else:
+        resids, missing = cif_int(col)
+        # the author numbering falls back on the label one where missing
+        if missing.any() and 'label_seq_id' in columns and col is not columns['label_seq_id']:
+          label, label_missing = cif_int(columns['label_seq_id'])
+          use = missing & ~label_missing
+          resids[use] = label[use]
+          missing &= label_missing
+        if missing.any():
+          resids = resids.astype(object)
+          resids[missing] = None
+        arrays['resids'] = resids
+    for field, default in (('names', 'X'), ('resnames', 'X'), ('chains', 'A'), ('types', '')):
+      if field not in fields: continue
+      col = self.column(columns, field)
+      arrays[field] = cif_string(col) if col is not None else np.full(N, default)
+    if 'types' in fields:
+      # elements as written, None where unknown (as from PDB files)
+      untyped = arrays['types'] == ''
+      if untyped.any():
+        arrays['types'] = arrays['types'].astype(object)
+        arrays['types'][untyped] = None
+    for field, default in (('occupancies', 1.), ('temp_factors', 0.), ('charges', 0.)):
+      if field not in fields: continue
+      col = self.column(columns, field)
+      arrays[field] = cif_float(col, default) if col is not None else np.full(N, default)
+    if 'radii' in fields:
+      arrays['radii'] = np.zeros(N)
+
+    # one frame per model, in file order
+    if 'pdbx_PDB_model_num' in columns:
+      model = columns['pdbx_PDB_model_num']
+      cuts = np.flatnonzero(model[1:] != model[:-1]) + 1
+    else:
+      cuts = np.zeros(0, dtype=int)
+    frames = []
+    for start, stop in zip(np.concatenate(([0], cuts)), np.concatenate((cuts, [N]))):
+      frame = CIFFrame()
+      for field, values in arrays.items():
+        setattr(frame, field, values[start:stop])
+      # stand-ins for the fields not loaded
+      for field in FIELD_DEFAULTS:
+        if field not in fields:
+          setattr(frame, field, default_field(field, stop - start))
+      frame.compact(None, self.categorical)
+      frames.append(frame)
+    return frames
@@ -0,0 +1,127 @@
+import io
+import bisect
+import zlib
+
+
+## Random access into gzip files. Inflating is strictly sequential, so
+#   reaching a model near the end of a compressed multi-model file
+#   normally means inflating everything before it. A GzipIndex keeps
+#   access points instead: every span bytes of output, a copy of the
+#   inflater's state along with the compressed and uncompressed offsets it
+#   stands at. A seek then resumes from the closest point at or before the
+#   target. Points are added as the file is read (e.g. by a lazy scan), so
+#   building the index costs no extra pass. Copies of zlib state can't be
+#   written out, so the index lives in memory only
+
+class GzipIndex:
+  def __init__(self, span=1 << 21):
+    self.span = span
+    # (uncompressed offset, compressed offset, inflater) in output order
+    self.offsets = []
+    self.points = []
+
+  def __len__(self):
+    return len(self.points)
+
+  def add(self, uoffset, coffset, inflater):
+    # only points past the last one (and at least a span after it) count
+    if len(self.offsets) > 0 and uoffset < self.offsets[-1] + self.span:
+      return
+    self.offsets.append(uoffset)
+    self.points.append((uoffset, coffset, inflater.copy()))
+
+  def before(self, uoffset):
+    # closest access point at or before uoffset, or None
+    k = bisect.bisect_right(self.offsets, uoffset) - 1
+    return self.points[k] if k >= 0 else None
+
+
+def new_inflater():
+  # gzip header and trailer handled by zlib itself
+  return zlib.decompressobj(wbits=31)
+
+
+# Raw, seekable reader over a gzip file (any number of members) that uses
+#   and extends a GzipIndex; wrap it in io.BufferedReader for line reads
+class IndexedGzipFile(io.RawIOBase):
+  def __init__(self, filename, index, chunk=1 << 20):
+    self.f = open(filename, 'rb')
+    self.index = index
+    self.chunk = chunk
+    self.restart(None)
+
+  def restart(self, point):
+    # continue from an access point, or from the start of the file
+    if point is None:
+      self.pos, coffset, self.inflater = 0, 0, new_inflater()
+    else:
+      self.pos, coffset, inflater = point
+      self.inflater = inflater.copy()
+    self.f.seek(coffset)
+    self.coffset = coffset
+    self.buffer = b''
+    self.eof = False
+
+  def fill(self):
+    # inflate a bit more onto the buffer, at most chunk bytes of output at
+    #   a time, so access points stay span apart however well the data
+    #   compresses. Input held back by zlib (unconsumed_tail) goes first
+    if self.inflater.eof:
+      # next gzip member, if there is one
+      data = self.inflater.unused_data
+      self.inflater = new_inflater()
+      # a member start is a natural access point, needing no state
+      self.index.add(self.pos + len(self.buffer), self.coffset - len(data), self.inflater)
+    else:
+      data = self.inflater.unconsumed_tail
+    if len(data) == 0:
+      data = self.f.read(self.chunk)
+      self.coffset += len(data)
+      if len(data) == 0:
+        self.eof = True
+        return
+    self.buffer += self.inflater.decompress(data, self.chunk)
+    if not self.inflater.eof:
+      # the copy keeps any unconsumed input, so it resumes at coffset
+      self.index.add(self.pos + len(self.buffer), self.coffset, self.inflater)
+
+  def readable(self):
+    return True
+
+  def seekable(self):
+    return True
+
+  def tell(self):
+    return self.pos
+
+  def read(self, n=-1):
+    while not self.eof and (n is None or n < 0 or len(self.buffer) < n):
+      self.fill()
+    if n is None or n < 0: n = len(self.buffer)
+    data, self.buffer = self.buffer[:n], self.buffer[n:]
+    self.pos += len(data)
+    return data
+
+  def readinto(self, b):
+    data = self.read(len(b))
+    b[:len(data)] = data
+    return len(data)
+
+  def seek(self, offset, whence=io.SEEK_SET):
+    if whence == io.SEEK_CUR: offset += self.pos
+    elif whence == io.SEEK_END:
+      self.read()
+      offset += self.pos
+    point = self.index.before(offset)
+    # jump if going backwards, or if a point lies beyond what's buffered
+    if offset < self.pos or (point is not None and point[0] > self.pos + len(self.buffer)):
+      self.restart(point)
+    # then inflate forward to the target
+    while self.pos < offset:
+      skipped = self.read(min(offset - self.pos, self.chunk * 8))
+      if len(skipped) == 0: break
+    return self.pos
+
+  def close(self):
+    self.f.close()
+    io.RawIOBase.close(self)
@@ -0,0 +1,139 @@
+import numpy as np
+from collections import OrderedDict
+from compchem.neighbors import CellList
+from compchem.categorical import comparable
+
+
+# per-atom arrays that make up a frame's topology; frames share a
+#   topology when they hold the very same arrays, as Trajectory frames do
+TOPOLOGY_ARRAYS = ['indices', 'names', 'types', 'chains', 'resnames', 'resids',
+                   'charges', 'occupancies', 'temp_factors', 'radii']
+
+
+def topology_key(frame):
+  return tuple(id(getattr(frame, field)) for field in TOPOLOGY_ARRAYS) + (len(frame),)
+
+
+# Small LRU of values worked out once per topology (selection masks, the
+#   residue hierarchy). The topology arrays are kept with each value, so
+#   their ids can't be reused by other arrays while it's cached
+class TopologyCache:
+  def __init__(self, size=16):
+    self.size = size
+    self.entries = OrderedDict()
+
+  def get(self, frame, compute):
+    key = topology_key(frame)
+    entry = self.entries.get(key)
+    if entry is not None and all(array is getattr(frame, field) for array, field in zip(entry[0], TOPOLOGY_ARRAYS)):
+      self.entries.move_to_end(key)
+      return entry[1]
+    value = compute(frame)
+    self.entries[key] = ([getattr(frame, field) for field in TOPOLOGY_ARRAYS], value)
+    if len(self.entries) > self.size:
+      self.entries.popitem(last=False)
+    return value
+
+
+## Residue and chain hierarchy of a frame: atoms are grouped into runs of
+#   the same (chain, resid, resname), and residues into runs of the same
+#   chain. Per-residue and per-chain values then come from segmented
+#   reductions (ufunc.reduceat) over these runs, with no Python grouping
+class Hierarchy:
+  def __init__(self, frame):
+    n = len(frame)
+    self.n_atoms = n
+    change = np.zeros(n, dtype=bool)
+    chain_change = np.zeros(n, dtype=bool)
+    if n > 0:
+      change[0] = chain_change[0] = True
+      chains = comparable(frame.chains)
+      chain_change[1:] = chains[1:] != chains[:-1]
+      change |= chain_change
+      for field in ('resids', 'resnames'):
+        values = comparable(getattr(frame, field))
+        change[1:] |= values[1:] != values[:-1]
+    # first atom of every residue and chain, plus the atom count at the end
+    self.residue_starts = np.append(np.flatnonzero(change), n)
+    self.chain_starts = np.append(np.flatnonzero(chain_change), n)
+    # residue of every atom, chain of every residue
+    self.residue_index = np.cumsum(change) - 1
+    self.residue_chain = np.cumsum(chain_change)[self.residue_starts[:-1]] - 1
+    first = self.residue_starts[:-1]
+    self.resids = np.asarray(frame.resids)[first]
+    self.resnames = np.asarray(frame.resnames)[first]
+    self.chains = np.asarray(frame.chains)[self.chain_starts[:-1]]
+    for array in (self.residue_starts, self.chain_starts, self.residue_index, self.residue_chain):
+      array.setflags(write=False)
+
+  def __repr__(self):
+    return '* Hierarchy (%d atoms, %d residues, %d chains)' % (self.n_atoms, self.n_residues, self.n_chains)
+
+  @property
+  def n_residues(self):
+    return len(self.residue_starts) - 1
+
+  @property
+  def n_chains(self):
+    return len(self.chain_starts) - 1
+
+  def starts(self, level):
+    assert (level in ('residue', 'chain')), 'Unknown hierarchy level "%s"!' % level
+    return self.residue_starts if level == 'residue' else self.chain_starts
+
+  def sizes(self, level='residue'):
+    # atoms per residue (or chain)
+    return np.diff(self.starts(level))
+
+  def reduce(self, values, ufunc=np.add, level='residue', axis=0, dtype=None):
+    # Segmented reduction of per-atom values along axis (the atom axis,
+    #   e.g. 1 or -2 for (n_frames, n_atoms, 3) trajectory coordinates),
+    #   one result per residue (or chain), accumulated in dtype if given
+    values = np.asarray(values)
+    starts = self.starts(level)
+    if len(starts) == 1:
+      shape = list(values.shape)
+      shape[axis] = 0
+      return np.zeros(shape, dtype=values.dtype if dtype is None else dtype)
+    return ufunc.reduceat(values, starts[:-1], axis=axis, dtype=dtype)
+
+  def mean(self, values, level='residue', axis=0):
+    # sums are accumulated in double precision (without upcasting a copy
+    #   of e.g. float32 coordinates)
+    values = np.asarray(values)
+    sizes = self.sizes(level).reshape((-1,) + (1,) * (values.ndim - (axis % values.ndim) - 1))
+    return self.reduce(values, np.add, level, axis, dtype=float) / sizes
+
+  def centers(self, coordinates, level='residue'):
+    # geometric center of every residue, for (n_atoms, 3) coordinates or
+    #   a (n_frames, n_atoms, 3) trajectory stack
+    return self.mean(coordinates, level, axis=-2)
+
+  def min_distances(self, coordinates, points, cutoff=None, level='residue'):
+    # Closest approach of every residue to a set of points (e.g. ligand
+    #   atoms), from a neighbor index over the points. With a cutoff,
+    #   residues farther than it get inf, which is much cheaper for big
+    #   receptors around a small ligand
+    coordinates = np.asarray(coordinates, dtype=float)
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    nearest = np.full(len(coordinates), np.inf)
+    if len(points) > 0 and len(coordinates) > 0:
+      index = CellList(points, 4. if cutoff is None else max(cutoff, 1.))
+      if cutoff is None:
+        nearest = index.query_knn(coordinates, 1)[0][:,0]
+      else:
+        q, j, d = index.query_pairs(coordinates, cutoff)
+        np.minimum.at(nearest, q, d)
+    return self.reduce(nearest, np.minimum, level)
+
+  def expand(self, values, level='residue'):
+    # per-residue (or chain) values back out to every atom
+    return np.repeat(np.asarray(values), self.sizes(level), axis=0)
+
+
+hierarchies = TopologyCache()
+
+
+def hierarchy(frame):
+  # the residue/chain hierarchy of a frame, worked out once per topology
+  return hierarchies.get(frame, Hierarchy)
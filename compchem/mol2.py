@@ -1,363 +1,285 @@
 
 import os, os.path
-import sys
-import struct #for hex->dec
 import re # regex
 import numpy as np
-import math
+import mmap
+from collections import OrderedDict
+from compchem import *
+from compchem.trajectory import *
+from compchem.pdb import format_atoms
 
 
-# Single frame from MOL2-type file
-class MOL2Frame(MolecularFrame):
-  pass
-'''
-class MOL2Frame:
-  def __init__(self):
-    self.atoms = []
-    self.chains = []
-    self.indices = []
-    self.names = []
-    self.types = []
-    self.resnames = []
-    self.resids = []
-    self.occupancies = []
-    self.temp_factors = []
-    self.charges = []
-    self.radii = []
-    self.coordinates = None
-    self.bonds = []
-
-  def __getitem__(self, key):
-    adat = { 'index': self.indices[key],
-             'name':  self.names[key],
-             'type':  self.types[key],
-             'chain':  self.chains[key],
-             'resname':  self.resnames[key],
-             'resid':  self.resids[key],
-             'coordinates':  self.coordinates[key,:],
-             'occupancy':  self.occupancies[key],
-             'temp_factor':  self.temp_factors[key],
-             'charge':  self.charges[key],
-             'radius':  self.radii[key], }
-    return adat
-
-  def __len__(self):
-    return len(self.names)
-
-  def measure_center(self):
-    # find mean of each column of coordinates
-    x = np.mean(self.coordinates[:,0])
-    y = np.mean(self.coordinates[:,1])
-    z = np.mean(self.coordinates[:,2])
-    mean = np.array( (x,y,z) )
-    return mean
-
-  def translate(self, dx, dy, dz):
-    # add differential to every row of each column
-    self.coordinates[:,0] += dx
-    self.coordinates[:,1] += dy
-    self.coordinates[:,2] += dz
+## Function for loading TRIPOS MOL2 files (single molecules or libraries)
+#   extra keyword arguments (e.g. lazy=True) are passed on to MOL2
+def load_mol2(filename, **kwargs):
+  return MOL2(filename, **kwargs)
 
-  def center(self):
-    c = self.measure_center()
-    self.translate(-c[0], -c[1], -c[2])
 
-  def rotate(self, d0x, d0y, d0z):
-    ## rotate around center of coordinates, so we need to center
-    ## the molecule on the origin before rotation, then translate back
-    c = self.measure_center()
-    self.translate(-c[0], -c[1], -c[2])
-    ## NOTE: d0's must be radians; add check TODO
-    # rotate around x-axis
-    cos0 = math.cos(d0x)
-    sin0 = math.sin(d0x)
-    Rx = np.matrix([[1.,0.,0.],[0., cos0, -sin0],[0., sin0, cos0]])
-    # rotate around y-axis
-    cos0 = math.cos(d0y)
-    sin0 = math.sin(d0y)
-    Ry = np.matrix([[cos0, 0., sin0],[0.,1.,0.],[-sin0, 0., cos0]])
-    # rotate around z-axis
-    cos0 = math.cos(d0z)
-    sin0 = math.sin(d0z)
-    Rz = np.matrix([[cos0, -sin0, 0.],[sin0, cos0, 0.],[0.,0.,1.]])
-    # combine to a single rotation matrix
-    Rt = Rx*Ry*Rz
-    # apply rotation matrix to coordinates
-    self.coordinates = np.array(self.coordinates * Rt)
-    # translate molecule back to its original center
-    self.translate(c[0], c[1], c[2])
+## Streaming access, one molecule at a time in constant memory
+def iter_mol2(filename, **kwargs):
+  return MOL2(filename, stream=True, **kwargs).iter_frames()
 
-  def rotate_matrix(self, Rt, at_origin=False): #rotation matrix
-    # if needed, center on origin
-    c = [0., 0., 0.]
-    if not at_origin:
-      c = self.measure_center()
-      self.center()
-    # rotate
-    self.coordinates = self.coordinates.dot(Rt)
-    # translate back to position if needed
-    if not at_origin:
-      self.translate(c[0], c[1], c[2])
 
-  def rmsd(self, other_frame):
-    return rmsd(self.coordinates, other_frame.coordinates)
+# every molecule starts with this record, at the start of a line
+MOLECULE_RECORD = re.compile(rb'^@<TRIPOS>MOLECULE', re.M)
+# a record can't start this close to the end of text already searched
+MOLECULE_OVERLAP = len(b'@<TRIPOS>MOLECULE') - 1
+SECTION_RECORD = re.compile(rb'^@<TRIPOS>(\w+)[^\n]*\n?', re.M)
 
-  def align(self, other_frame):
-    X = self.coordinates
-    Y = other_frame.coordinates
 
-    ## calculate covariance matrix
-    C = X.T.dot(Y)
-
-    u,s,vh = np.linalg.svd(C)
-
-    #d = int(np.sign(np.linalg.det(C)))
-    #T = np.matrix('1 0 0; 0 1 0; 0 0 %d' % d)
+# Single molecule from a MOL2 file. types holds generic elements, like the
+#   other formats, with the full SYBYL atom types in sybyl_types; bonds
+#   come from the BOND section, with their types in bond_orders
+class MOL2Frame(MolecularFrame):
+  __slots__ = ['title', 'sybyl_types', 'bond_orders']
 
-    #U = vh.T.dot(T).dot(u.T)
-    #mobile.rotate_matrix(U, at_origin=True)
-    #mobile.translate(c[0], c[1], c[2])
-    #target.translate(c[0], c[1], c[2])
+  def __init__(self, natoms=0):
+    MolecularFrame.__init__(self, natoms)
+    self.title = ''
+    self.sybyl_types = empty_field('<U6') if natoms == 0 else np.full(natoms, '', dtype='<U6')
+    self.bond_orders = empty_field('<U2')
 
   def __repr__(self):
-    pdb_atoms = ''
-    for i in range(len(self.indices)):
-      pdb_atoms += 'ATOM  %s  %3s %3s %s %s    %8.3f%8.3f%8.3f  1.00  0.00\n' % (str(self.indices[i]).rjust(5), self.names[i], self.resnames[i], self.chains[i], str(self.resids[i]).rjust(3), self.coordinates[i,0], self.coordinates[i,1], self.coordinates[i,2])
-    pdb_atoms += "TER\n"
-    return pdb_atoms
-'''
+    return format_atoms(self) + "TER\n"
 
 
-## Core MOL2-style Format Parser
+## Core MOL2 Format Parser
 class MOL2:
-  def __init__(self, filename, PQR=False, MOL2QT=False):
+  def __init__(self, filename, lazy=False, cache_size=32, stream=False, dtype=np.float64, categorical=False,
+               fields=None):
     # check to make sure file exists
     assert (os.path.isfile(filename)), "File does not exist (%s)!" % filename
     # assign object variables
     self.frames = []
-    self.current_frame = MOL2Frame()
     self.filename = filename
-    # data storage
-    self.title = ''
-    self.authors = ''
-    self.journal = {}
-    self.journal_string = ''
-    # assign type
-    self.PQR = PQR
-    self.MOL2QT = MOL2QT
-    # parse the file
-    self.parse()
+    # lazy mode only indexes molecules (byte offsets of their MOLECULE
+    #   records), parsing them on first access
+    self.lazy = lazy
+    self.cache_size = cache_size
+    self.cache = OrderedDict()
+    self.offsets = np.zeros(1, dtype=np.int64)
+    # access points into a gzipped file, found while scanning it
+    self.gzip_index = None
+    # storage policy, as for PDB: coordinate dtype and integer-coded
+    #   string fields
+    self.dtype = np.dtype(dtype)
+    self.categorical = categorical
+    # column projection, as for PDB (sybyl_types come with types)
+    self.fields = projected_fields(fields)
+    # parse the file, unless molecules will be streamed through iter_frames
+    self.stream = stream
+    if not stream:
+      self.parse()
 
   def __repr__(self):
-    filetype = 'MOL2'
-    if self.PQR: filetype = 'PQR'
-    if self.MOL2QT: filetype = 'MOL2QT'
-    rep = '* %s-style object (%s).' % (filetype, self.filename)
-    rep += '\n  + %d frames' % len(self.frames)
-    if self.title != '': rep += '\n  + ' + self.title.replace("\n", "\n    ")
-    if self.journal_string != '': rep += '\n  + ' + self.journal_string.replace("\n", "\n    ")
+    rep = '* MOL2-style object (%s).' % self.filename
+    rep += '\n  + %d molecules' % len(self)
     return rep
 
+  def __len__(self):
+    if self.lazy:
+      return len(self.offsets) - 1
+    return len(self.frames)
 
   def __getitem__(self, indices):
-    return self.frames[indices]
-
-
-  def parse_int(self, val):
-    # When MOL2 atom indices or residue IDs get over 9999, it switches to hex
-    # This function figures that out, and returns an int
-    try:
-      if re.search('[a-zA-Z]', val):
-        return int(val, 16)
-      else:
-        return int(val)
-    except ValueError:
-      print('!! parse_int could not resolve either hex or int from string "%s"' % val)
-      return None
-      
+    if not self.lazy:
+      return self.frames[indices]
+    if isinstance(indices, slice):
+      return [self.load_frame(i) for i in range(*indices.indices(len(self)))]
+    i = indices
+    if i < 0: i += len(self)
+    if i < 0 or i >= len(self):
+      raise IndexError('molecule index %d out of range' % indices)
+    return self.load_frame(i)
+
+  def trajectory(self):
+    # all molecules as one shared-topology Trajectory (e.g. conformers)
+    return Trajectory(frames=[frame for frame in self])
 
   def parse(self):
-    # temp vars for empty records
-    _index = 1
-    _findex = False
-    _chain = 'A'
-    _fchain = False
-
-    for i,line in enumerate(open(self.filename)):
-      line = line.rstrip()
-      if len(line) >= 3:
-        ## RECORD
-        record = line[:6].strip()
-        if record == 'TITLE':
-          if self.title != '': self.title += '\n'
-          self.title += line[10:]
-        elif record == 'AUTHOR':
-          if self.title != '': self.title += '\n'
-          self.authors += line[10:]
-        elif record == 'JRNL':
-          key = line[12:17].strip()
-          val = line[19:]
-          try:
-            self.journal[key] += '\n' + val
-          except KeyError:
-            self.journal[key] = val
-        elif record == 'TER':
-          _chain = chr(ord(_chain)+1)
-        elif record == 'END' or record == 'ENDMDL':
-          self.finalize_frame()
-          self.frames.append(self.current_frame)
-          self.current_frame = MOL2Frame()
-        elif record == 'ATOM' or record == 'HETATM':
-          ## ATOM INDEX
-          index = line[6:11].strip()
-          if index == '':
-            _findex = True
-            index = _index
-            _index += 1
-          else:
-            index = self.parse_int(index)
-          self.current_frame.indices.append(index)
-          ## ATOM NAME
-          atomn = line[12:16].strip()
-          if atomn == '': atomn = 'X'
-          self.current_frame.names.append(atomn)
-          type_from_name = ''.join([c for c in atomn if not c.isdigit()])
-          # RESIDUE NAME
-          resna = line[17:21].strip()
-          if resna == '': resna = 'X'
-          self.current_frame.resnames.append(resna)
-          ## CHAIN ID
-          chain = line[21:22].strip()
-          if chain == '':
-            _fchain = True
-            chain = _chain
-          self.current_frame.chains.append(chain)
-          ## RESIDUE NUMBER
-          resnu = line[22:26].strip()
-          if resnu == '':
-            resnu = None
-          else:
-            resnu = self.parse_int(resnu)
-          self.current_frame.resids.append(resnu)
-          ## X, Y, Z Coordinates
-          crdx = line[30:38]
-          assert(crdx != ''), "No coordinate X in MOL2 (strict parsing) line# %d in %s\n%s" % (i, self.filename, line)
-          crdy = line[38:46]
-          assert(crdy != ''), "No coordinate Y in MOL2 (strict parsing) line# %d in %s\n%s" % (i, self.filename, line)
-          crdz = line[46:52]
-          assert(crdz != ''), "No coordinate Z in MOL2 (strict parsing) line# %d in %s\n%s" % (i, self.filename, line)
-          try:
-            crdx = float(crdx)
-            crdy = float(crdy)
-            crdz = float(crdz)
-            extra = line[54:]
-            atom = [crdx, crdy, crdz]
-          except:
-            block = line[30:]
-            d1 = block.find('.')
-            d2 = block.find('.', d1+1)
-            d3 = block.find('.', d2+1)
-            s = int((d2 - d1 - 1) / 2)
-            crdx = float(block[d1-s:d1+s])
-            crdy = float(block[d2-s:d2+s])
-            crdz = float(block[d3-s:d3+s])
-            extra = block[d3+s:]
-            atom = [crdx, crdy, crdz]
-          self.current_frame.atoms.append(atom)
-          # extra columns beyond coordinates
-          if self.PQR or self.MOL2QT:
-            cols = []
-            for c in extra.split():
-              if c != '':
-                cols.append(c)
-            if self.PQR:
-              self.current_frame.charges.append(float(cols[-2]))
-              self.current_frame.radii.append(float(cols[-1]))
-              self.current_frame.types.append(type_from_name)
-            if self.MOL2QT:
-              self.current_frame.charges.append(float(cols[-2]))
-              self.current_frame.radii.append(0.)
-              atomt = cols[-1].strip()
-              if atomt == 'A': atomt = 'C'  # autodock-specific types
-              if atomt == 'OA': atomt = 'O'
-              if atomt == 'NA': atomt = 'N'
-              if atomt == 'HD': atomt = 'H'
-              self.current_frame.types.append(atomt)
-            self.current_frame.occupancies.append(1.)
-            self.current_frame.temp_factors.append(0.)
-          else:
-            try:
-              O = float(line[54:60])
-            except:
-              O = 1.
-            self.current_frame.occupancies.append(O)
-            try:
-              B = float(line[60:66])
-            except:
-              B = 0.
-            self.current_frame.temp_factors.append(B)
-            try:
-              qs = line[78:80]
-              if qs[1] == '+': qs = qs[0]
-              if qs[1] == '-':
-                qs = '-%s' % qs[0]
-              q = float(qs)
-            except:
-              q = 0.
-            self.current_frame.charges.append(q)
-            # try to determine generic type for MOL2 atom
-            atype = line[77:80].strip()
-            atomt = ''
-            if type_from_name == '' and atype == '': atomt = None
-            if type_from_name == '' and atype != '': atomt = atype
-            if type_from_name != '' and atype == '': atomt = type_from_name
-            if type_from_name != '' and atype != '': atomt = atype
-            self.current_frame.types.append(atomt)
-            # no radii, just append a zero (lookup table for generic vdw radii?)
-            self.current_frame.radii.append(0.)
-    if self.current_frame.coordinates == None and len(self.current_frame.atoms) > 0:
-      self.finalize_frame()
-      self.frames.append(self.current_frame)
-
-    # make some data more accessible
-    if len(self.authors) > 0:
-      self.authors = [name.strip() for name in self.authors.split(',')]
-
-  def finalize_frame(self):
-    Natoms = len(self.current_frame.atoms)
-    if Natoms > 0:
-      self.current_frame.coordinates = np.zeros((Natoms, 3))
-      for i,atom in enumerate(self.current_frame.atoms):
-        # store x, y, z data
-        self.current_frame.coordinates[i,0] = self.current_frame.atoms[i][0]
-        self.current_frame.coordinates[i,1] = self.current_frame.atoms[i][1]
-        self.current_frame.coordinates[i,2] = self.current_frame.atoms[i][2]
-      del self.current_frame.atoms
-      #does this need to be numpy?
-      #self.current_frame.charges = np.array(self.current_frame.charges)
-    try: self.journal_string  = self.journal['TITL']
-    except KeyError: pass
-    try: self.journal_string += '\n' + self.journal['AUTH']
-    except KeyError: pass
-    try: self.journal_string += '\n' + self.journal['REF']
-    except KeyError: pass
-    # convert lists to arrays
-    self.current_frame.chains =      np.array(self.current_frame.chains)
-    self.current_frame.indices =     np.array(self.current_frame.indices)
-    self.current_frame.names =       np.array(self.current_frame.names)
-    self.current_frame.types =       np.array(self.current_frame.types)
-    self.current_frame.resnames =    np.array(self.current_frame.resnames)
-    self.current_frame.resids =      np.array(self.current_frame.resids)
-    self.current_frame.occupancies = np.array(self.current_frame.occupancies )
-    self.current_frame.temp_factors =np.array(self.current_frame.temp_factors)
-    self.current_frame.charges =     np.array(self.current_frame.charges)
-    self.current_frame.radii =       np.array(self.current_frame.radii)
-
-
-
-
-#################################
-#for fn in os.listdir('../../MOL2db/'):
-#  pdb = load_pdb('%s%s' % ("../../MOL2db/",fn))
-#  print(pdb)
-
+    if self.lazy:
+      self.scan()
+    else:
+      self.frames = list(self.iter_frames())
+
+  def iter_frames(self, chunk=2**24):
+    # Yield each molecule in turn, reading the file in large chunks and
+    #   cutting them at MOLECULE records, so nothing is kept around
+    with open_file(self.filename) as f:
+      rest = b''
+      starts = []
+      searched = 0
+      while True:
+        data = f.read(chunk)
+        rest += data
+        # only what's new needs searching, from a little before it in case
+        #   a MOLECULE record was cut between chunks
+        starts += [m.start() for m in MOLECULE_RECORD.finditer(rest, max(searched - MOLECULE_OVERLAP, 0))]
+        searched = len(rest)
+        # the last molecule may continue in the next chunk
+        if len(data) > 0: ends = starts[1:]
+        else: ends = starts[1:] + [len(rest)]
+        # streamed frames get their own arrays, rather than slices that
+        #   would keep the whole chunk's arrays alive
+        for frame in self.parse_molecules([rest[start:end] for start, end in zip(starts, ends)], copy=self.stream):
+          yield frame
+        if len(data) == 0:
+          return
+        if len(starts) > 0:
+          rest = rest[starts[-1]:]
+          starts = [0]
+          searched = len(rest)
+
+  def scan(self):
+    # Lazy mode: one pass over the raw file recording the byte offset of
+    #   every MOLECULE record, plus the end of the file. Compressed files
+    #   are scanned in chunks, building a GzipIndex for .gz on the way
+    if compression(self.filename) == '':
+      if os.path.getsize(self.filename) == 0:
+        return
+      with open_file(self.filename) as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = np.fromiter((m.start() for m in MOLECULE_RECORD.finditer(data)), dtype=np.int64)
+        self.offsets = np.append(offsets, len(data))
+        data.close()
+      return
+    self.gzip_index = GzipIndex()
+    offsets = []
+    size = 0
+    with open_file(self.filename, self.gzip_index) as f:
+      for start, data in read_chunks(f):
+        offsets += [start + m.start() for m in MOLECULE_RECORD.finditer(data)]
+        size = start + len(data)
+    self.offsets = np.array(offsets + [size], dtype=np.int64)
+
+  def load_frame(self, i):
+    # Parse a single molecule of a lazy MOL2, caching the most recently used
+    if i in self.cache:
+      self.cache.move_to_end(i)
+      return self.cache[i]
+    with open_file(self.filename, self.gzip_index) as f:
+      f.seek(self.offsets[i])
+      data = f.read(self.offsets[i+1] - self.offsets[i])
+    frame = self.parse_molecule(data)
+    self.cache[i] = frame
+    if len(self.cache) > self.cache_size:
+      self.cache.popitem(last=False)
+    return frame
+
+  def sections(self, data):
+    # {section name: raw bytes} for one molecule's @<TRIPOS> sections
+    marks = list(SECTION_RECORD.finditer(data))
+    ends = [m.start() for m in marks[1:]] + [len(data)]
+    return dict((m.group(1).decode('ascii'), data[m.end():end]) for m, end in zip(marks, ends))
+
+  def section_rows(self, texts, ncols, name):
+    # Whitespace-separated rows of a section in several molecules as one
+    #   (n, ncols) array of byte strings, plus the row count of each,
+    #   padding rows with missing optional columns
+    counts = []
+    rows = []
+    for text in texts:
+      lines = [line.split() for line in text.splitlines()]
+      lines = [line for line in lines if len(line) > 0 and not line[0].startswith(b'#')]
+      counts.append(len(lines))
+      rows += lines
+    if len(rows) == 0:
+      return np.zeros((0, ncols), dtype='S1'), np.array(counts, dtype=int)
+    widths = set(map(len, rows))
+    assert (min(widths) >= min(ncols, 4)), "Short %s record in MOL2 %s" % (name, self.filename)
+    if min(widths) >= ncols:
+      # rows normally all have the optional columns, and go in one go
+      table = np.array([row[:ncols] for row in rows], dtype=bytes)
+    else:
+      table = np.array([(row + [b''] * ncols)[:ncols] for row in rows], dtype=bytes)
+    return table, np.array(counts, dtype=int)
+
+  def parse_molecule(self, data):
+    return self.parse_molecules([data])[0]
+
+  def parse_molecules(self, datas, copy=False):
+    # Parse many molecules at once: the ATOM and BOND rows of all of them
+    #   are decoded together as single arrays, and each frame gets slices
+    #   of those, which keeps per-molecule overhead low for big libraries
+    #   (or copies of the slices with copy=True, for frames that outlive
+    #   the rest of the batch)
+    if len(datas) == 0:
+      return []
+    sections = [self.sections(data) for data in datas]
+
+    ## ATOM: atom_id atom_name x y z atom_type [subst_id [subst_name [charge]]]
+    atoms, natoms = self.section_rows([sec.get('ATOM', b'') for sec in sections], 9, 'ATOM')
+    N = len(atoms)
+    fields = self.fields
+    # indices are needed to resolve bonds, whether kept or not
+    indices = atoms[:,0].astype(int)
+    values = {}
+    if 'names' in fields:
+      values['names'] = atoms[:,1].astype(str)
+    coordinates = atoms[:,2:5].astype(float).astype(self.dtype, copy=False)
+    if 'types' in fields:
+      sybyl_types, inverse = np.unique(atoms[:,5].astype(str), return_inverse=True)
+      # generic element from the SYBYL type, e.g. C.ar -> C, Cl -> CL
+      values['types'] = np.char.upper(np.char.partition(sybyl_types, '.')[:,0])[inverse.ravel()]
+      sybyl_types = sybyl_types[inverse.ravel()]
+    if 'resids' in fields:
+      values['resids'] = np.where(atoms[:,6] == b'', b'1', atoms[:,6]).astype(int)
+    if 'resnames' in fields:
+      values['resnames'] = np.where(atoms[:,7] == b'', b'X', atoms[:,7]).astype(str)
+    if 'charges' in fields:
+      values['charges'] = np.where(atoms[:,8] == b'', b'0', atoms[:,8]).astype(float)
+    if 'indices' in fields:
+      values['indices'] = indices
+
+    ## BOND: bond_id origin_atom_id target_atom_id bond_type
+    bonds, nbonds = self.section_rows([sec.get('BOND', b'') for sec in sections], 4, 'BOND')
+    ids = bonds[:,1:3].astype(int)
+    bond_orders = bonds[:,3].astype(str)
+    # Atom ids to positions within each molecule. Ids are nearly always
+    #   1..n, so that is tried for all molecules at once
+    astart = np.cumsum(natoms) - natoms
+    bstart = np.cumsum(nbonds) - nbonds
+    ends = ids - 1
+    serial = np.array_equal(indices, np.arange(N) - np.repeat(astart, natoms) + 1)
+    if not serial:
+      for k in range(len(datas)):
+        a0, a1, b0, b1 = astart[k], astart[k] + natoms[k], bstart[k], bstart[k] + nbonds[k]
+        order = np.argsort(indices[a0:a1], kind='stable')
+        pos = np.searchsorted(indices[a0:a1], ids[b0:b1], sorter=order)
+        ends[b0:b1] = order[np.minimum(pos, max(natoms[k] - 1, 0))] if natoms[k] > 0 else -1
+    owner = np.repeat(np.arange(len(datas)), nbonds)
+    valid = (ends >= 0) & (ends < natoms[owner][:, np.newaxis])
+    found = np.where(valid, ends + astart[owner][:, np.newaxis], 0)
+    assert valid.all() and np.array_equal(indices[found], ids), \
+           "BOND record refers to a missing atom in MOL2 %s" % self.filename
+    ends = np.sort(ends, axis=1)
+
+    frames = []
+    for k, sec in enumerate(sections):
+      frame = MOL2Frame()
+      header = sec.get('MOLECULE', b'').splitlines()
+      frame.title = header[0].strip().decode('ascii', 'replace') if len(header) > 0 else ''
+      a = slice(astart[k], astart[k] + natoms[k])
+      b = slice(bstart[k], bstart[k] + nbonds[k])
+      for field, array in values.items():
+        setattr(frame, field, array[a].copy() if copy else array[a])
+      frame.coordinates = coordinates[a].copy() if copy else coordinates[a]
+      if 'types' in fields:
+        frame.sybyl_types = sybyl_types[a].copy() if copy else sybyl_types[a]
+      else:
+        frame.sybyl_types = default_field('types', natoms[k])
+      if 'chains' in fields: frame.chains = np.full(natoms[k], 'A')
+      if 'occupancies' in fields: frame.occupancies = np.ones(natoms[k])
+      if 'temp_factors' in fields: frame.temp_factors = np.zeros(natoms[k])
+      if 'radii' in fields: frame.radii = np.zeros(natoms[k])
+      # stand-ins for the fields not loaded
+      for field in FIELD_DEFAULTS:
+        if field not in fields:
+          setattr(frame, field, default_field(field, natoms[k]))
+      # CSR adjacency is built on first use of bonded()
+      frame.bonds = ends[b].copy() if copy else ends[b]
+      frame.bond_orders = bond_orders[b].copy() if copy else bond_orders[b]
+      if self.categorical:
+        frame.compact(None, True)
+      frames.append(frame)
+    return frames
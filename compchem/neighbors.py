@@ -0,0 +1,176 @@
+import itertools
+import numpy as np
+
+
+def expand_ranges(starts, counts):
+  # Concatenated [start, start+count) ranges, and for every element the
+  #   range it came from (a vectorized "for each range, for each item")
+  owner = np.repeat(np.arange(len(counts)), counts)
+  first = np.cumsum(counts) - counts
+  flat = np.arange(counts.sum()) - np.repeat(first, counts) + np.repeat(starts, counts)
+  return owner, flat
+
+
+def coordinate_stamp(coordinates):
+  # cheap fingerprint of a coordinate array, to spot replaced or changed
+  #   coordinates without keeping a copy
+  crd = np.asarray(coordinates, dtype=float)
+  return (id(coordinates), crd.shape, crd.sum(axis=0).tobytes(), np.arange(len(crd)).dot(crd).tobytes())
+
+
+# Spatial index over a set of coordinates using uniform cells. Atoms are
+#   sorted by cell, and only occupied cells are stored, so widely spread
+#   systems don't allocate empty grid space
+class CellList:
+  def __init__(self, coordinates, cell_size=4., chunk=65536):
+    self.coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 3)
+    self.cell_size = float(cell_size)
+    # queries are processed this many points at a time to bound memory
+    self.chunk = chunk
+    N = len(self.coordinates)
+    self.origin = self.coordinates.min(axis=0) if N > 0 else np.zeros(3)
+    cells = self.cell_of(self.coordinates)
+    self.shape = cells.max(axis=0) + 1 if N > 0 else np.ones(3, dtype=np.int64)
+    keys = self.cell_keys(cells)
+    self.order = np.argsort(keys, kind='stable')
+    self.keys, self.starts, self.counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+
+  def __len__(self):
+    return len(self.coordinates)
+
+  def cell_of(self, points):
+    return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+  def cell_keys(self, cells):
+    return cells[:,0] + self.shape[0] * (cells[:,1] + self.shape[1] * cells[:,2])
+
+  def cell_atoms(self, cells, offset):
+    # (query, atom) candidate pairs for the atoms in cell + offset of
+    #   every query cell
+    cells = cells + offset
+    inside = np.flatnonzero(np.all((cells >= 0) & (cells < self.shape), axis=1))
+    keys = self.cell_keys(cells[inside])
+    pos = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+    occupied = self.keys[pos] == keys if len(self.keys) > 0 else np.zeros(len(keys), dtype=bool)
+    inside, pos = inside[occupied], pos[occupied]
+    owner, flat = expand_ranges(self.starts[pos], self.counts[pos])
+    return inside[owner], self.order[flat]
+
+  def offsets(self, r):
+    # every cell offset that can hold atoms within r of a cell, i.e. whose
+    #   closest corner is nearer than r. None once there would be more
+    #   offsets than occupied cells, where checking every atom is cheaper
+    reach = int(np.ceil(r / self.cell_size))
+    if (2*reach + 1)**3 > max(len(self.keys), 27):
+      return None
+    offsets = np.array(list(itertools.product(range(-reach, reach+1), repeat=3)))
+    gap = np.maximum(np.abs(offsets) - 1, 0) * self.cell_size
+    return [tuple(offset) for offset in offsets[np.sum(gap * gap, axis=1) < r * r]]
+
+  def scan_pairs(self, block, r):
+    # (query, atom) pairs closer than r by checking every atom, for radii
+    #   that span more cells than are occupied
+    qs, js, ds = [], [], []
+    step = max(1, self.chunk // max(len(block), 1))
+    for a0 in range(0, len(self), step):
+      d = np.sqrt(np.sum(np.square(block[:, np.newaxis, :] - self.coordinates[np.newaxis, a0:a0+step, :]), axis=2))
+      q, j = np.nonzero(d < r)
+      qs.append(q)
+      js.append(j + a0)
+      ds.append(d[q, j])
+    return qs, js, ds
+
+  def query_pairs(self, points, r):
+    # All (query, atom) pairs closer than r, as index arrays plus their
+    #   distances, grouped by query
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    qs, js, ds = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+    offsets = self.offsets(r)
+    for c0 in range(0, len(points), self.chunk):
+      block = points[c0:c0+self.chunk]
+      if offsets is None:
+        q, j, d = self.scan_pairs(block, r)
+        qs += [x + c0 for x in q]
+        js += j
+        ds += d
+        continue
+      cells = self.cell_of(block)
+      for offset in offsets:
+        q, j = self.cell_atoms(cells, offset)
+        d = np.sqrt(np.sum(np.square(block[q] - self.coordinates[j]), axis=1))
+        keep = d < r
+        qs.append(q[keep] + c0)
+        js.append(j[keep])
+        ds.append(d[keep])
+    q, j, d = np.concatenate(qs), np.concatenate(js), np.concatenate(ds)
+    order = np.argsort(q, kind='stable')
+    return q[order], j[order], d[order]
+
+  def query_radius(self, points, r):
+    # indices of the atoms within r of a point (3,), or a list of index
+    #   arrays for several points (m, 3)
+    single = np.ndim(points) == 1
+    q, j, d = self.query_pairs(points, r)
+    if single: return j
+    bounds = np.searchsorted(q, np.arange(1, len(np.reshape(points, (-1, 3)))))
+    return np.split(j, bounds)
+
+  def query_knn(self, points, k):
+    # Distances and indices (m, k) of the k nearest atoms to every point,
+    #   closest first. The search radius doubles until each point has k
+    #   candidates, so only sparse regions pay for wider searches
+    single = np.ndim(points) == 1
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    k = min(k, len(self))
+    dist = np.full((len(points), k), np.inf)
+    index = np.full((len(points), k), -1, dtype=np.int64)
+    todo = np.arange(len(points))
+    r = self.cell_size
+    while len(todo) > 0 and k > 0:
+      q, j, d = self.query_pairs(points[todo], r)
+      done = np.bincount(q, minlength=len(todo)) >= k
+      keep = done[q]
+      q, j, d = q[keep], j[keep], d[keep]
+      order = np.lexsort((d, q))
+      q, j, d = q[order], j[order], d[order]
+      # rank of each candidate within its query
+      rank = np.arange(len(q)) - np.searchsorted(q, q)
+      first = rank < k
+      dist[todo[q[first]], rank[first]] = d[first]
+      index[todo[q[first]], rank[first]] = j[first]
+      todo = todo[~done]
+      r *= 2.
+    if single: return dist[0], index[0]
+    return dist, index
+
+  def pairs(self, cutoff):
+    # All unique atom pairs (i < j) closer than cutoff, as an (n_pairs, 2)
+    #   index array and their distances. Each pair of cells is visited
+    #   once, using only the "forward" half of the neighboring cells
+    cells = self.cell_of(self.coordinates)
+    offsets = self.offsets(cutoff)
+    ps, ds = [], []
+    for c0 in range(0, len(self), self.chunk):
+      block = np.arange(c0, min(c0 + self.chunk, len(self)))
+      if offsets is None:
+        for q, j, d in zip(*self.scan_pairs(self.coordinates[block], cutoff)):
+          forward = block[q] < j
+          ps.append(np.stack((block[q][forward], j[forward]), axis=1))
+          ds.append(d[forward])
+        continue
+      for offset in offsets:
+        if offset < (0, 0, 0): continue
+        q, j = self.cell_atoms(cells[block], offset)
+        i = block[q]
+        if offset == (0, 0, 0):
+          forward = i < j
+          i, j = i[forward], j[forward]
+        d = np.sqrt(np.sum(np.square(self.coordinates[i] - self.coordinates[j]), axis=1))
+        keep = d < cutoff
+        ps.append(np.sort(np.stack((i[keep], j[keep]), axis=1), axis=1))
+        ds.append(d[keep])
+    if len(ps) == 0:
+      return np.zeros((0, 2), dtype=np.int64), np.zeros(0)
+    p, d = np.concatenate(ps), np.concatenate(ds)
+    order = np.lexsort((p[:,1], p[:,0]))
+    return p[order], d[order]
@@ -0,0 +1,127 @@
+import os
+import sys
+import ctypes
+import numpy as np
+
+## Headless rendering with software GL (Mesa's llvmpipe), so no GPU or
+#   display is needed. The GL context comes from EGL, or from OSMesa when
+#   PyOpenGL is on that platform (PYOPENGL_PLATFORM=osmesa).
+#   PyOpenGL fixes its platform when OpenGL is first imported, so this
+#   module picks EGL before importing it, and only if nothing else chose a
+#   platform: with no display, EGL is told to do without a window system.
+#   It lives outside compchem.view, whose windows (GLUT) would otherwise
+#   be set up first; import it before compchem.view in headless programs
+if 'PYOPENGL_PLATFORM' not in os.environ and 'OpenGL.platform' not in sys.modules:
+  os.environ['PYOPENGL_PLATFORM'] = 'egl'
+  if sys.platform.startswith('linux') and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+    os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+import OpenGL.platform
+from OpenGL.GL import *
+from compchem.transform import *
+from compchem.view.render import *
+
+
+def gl_platform():
+  # 'egl', 'osmesa', ... : the platform PyOpenGL settled on
+  return type(OpenGL.platform.PLATFORM).__name__.replace('Platform', '').lower()
+
+
+class OffscreenContext:
+  def __init__(self, width=800, height=600):
+    self.width = width
+    self.height = height
+    self.context = None
+    self.backend = gl_platform()
+    assert (self.backend in ('egl', 'osmesa')), \
+           "PyOpenGL is on %s, which has no offscreen contexts; import compchem.offscreen before OpenGL!" % self.backend
+    if self.backend == 'osmesa':
+      self.create_osmesa()
+    else:
+      self.create_egl()
+    glViewport(0, 0, width, height)
+
+  def create_osmesa(self):
+    from OpenGL import osmesa, arrays
+    self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+    assert (self.context), "Could not create an OSMesa context!"
+    self.buffer = arrays.GLubyteArray.zeros((self.height, self.width, 4))
+    assert (osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, self.width, self.height)), \
+           "Could not make the OSMesa context current!"
+
+  def create_egl(self):
+    from OpenGL import EGL
+    self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    major, minor = EGL.EGLint(), EGL.EGLint()
+    assert (EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor))), \
+           "Could not initialize EGL (EGL_PLATFORM=surfaceless without a display?)"
+    attributes = [EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8,
+                  EGL.EGL_BLUE_SIZE, 8, EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                  EGL.EGL_NONE]
+    config = EGL.EGLConfig()
+    nconfigs = EGL.EGLint()
+    EGL.eglChooseConfig(self.display, (EGL.EGLint * len(attributes))(*attributes), ctypes.pointer(config), 1,
+                        ctypes.pointer(nconfigs))
+    assert (nconfigs.value > 0), "No EGL configuration for offscreen GL rendering!"
+    size = [EGL.EGL_WIDTH, self.width, EGL.EGL_HEIGHT, self.height, EGL.EGL_NONE]
+    self.surface = EGL.eglCreatePbufferSurface(self.display, config, (EGL.EGLint * len(size))(*size))
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+    assert (EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context)), \
+           "Could not make the EGL context current!"
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def pixels(self):
+    # (height, width, 3) uint8 image of what's been drawn, top row first
+    glFinish()
+    data = glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE)
+    if isinstance(data, bytes):
+      data = np.frombuffer(data, dtype=np.uint8)
+    return np.asarray(data, dtype=np.uint8).reshape(self.height, self.width, 3)[::-1]
+
+  def close(self):
+    if self.context is None:
+      return
+    if self.backend == 'osmesa':
+      from OpenGL import osmesa
+      osmesa.OSMesaDestroyContext(self.context)
+    else:
+      from OpenGL import EGL
+      EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+      EGL.eglDestroySurface(self.display, self.surface)
+      EGL.eglDestroyContext(self.display, self.context)
+      EGL.eglTerminate(self.display)
+    self.context = None
+
+
+def clear(background=(0., 0., 0.)):
+  glClearColor(background[0], background[1], background[2], 1.)
+  glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+
+def render_image(frame, width=800, height=600, R=None, fovy=40., background=(0., 0., 0.)):
+  # Image (height, width, 3) of a frame's atoms, optionally turned by a
+  #   3x3 rotation about their center first (the frame isn't moved)
+  with OffscreenContext(width, height) as context:
+    glEnable(GL_DEPTH_TEST)
+    renderer = Renderer(frame)
+    model, far = fit_camera(frame.coordinates, fovy)
+    if R is not None:
+      model = rotation(R, about=frame.measure_center()).dot(model)
+    clear(background)
+    renderer.draw(model, perspective(fovy, width / height, 0.5, far), height)
+    image = context.pixels()
+    renderer.delete()
+  return image
+
+
+def write_ppm(image, filename):
+  # binary PPM, which needs no imaging library
+  image = np.ascontiguousarray(image, dtype=np.uint8)
+  with open(filename, 'wb') as f:
+    f.write(b'P6\n%d %d\n255\n' % (image.shape[1], image.shape[0]))
+    f.write(image.tobytes())
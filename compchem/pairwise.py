@@ -0,0 +1,136 @@
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from compchem.superpose import fit_weights, qcp_msd
+
+
+def stack_coordinates(frames):
+  # (N, n_atoms, 3) coordinate array from a list of frames, a Trajectory
+  #   or anything already array-like
+  if hasattr(frames, 'coordinates'):
+    return np.asarray(frames.coordinates, dtype=float)
+  if isinstance(frames, np.ndarray):
+    return frames.astype(float, copy=False)
+  return np.array([np.asarray(frame.coordinates if hasattr(frame, 'coordinates') else frame, dtype=float)
+                   for frame in frames])
+
+
+def block_size(ncols, memory, per_pair=3):
+  # rows/columns per tile so that a tile of the result, its temporaries and
+  #   the coordinate rows feeding it stay within the memory budget (bytes)
+  words = memory / 8.
+  # b*b tile of per_pair words each, and 2*b rows of ncols coordinates
+  b = (-2*ncols + math.sqrt(4*ncols*ncols + 4*per_pair*words)) / (2*per_pair)
+  return max(1, int(b))
+
+
+def rmsd_block(X, Y, sx, sy, natoms):
+  # RMSD between every row of X and every row of Y (flattened frames,
+  #   already scaled by the square root of the atom weights), using
+  #   |x - y|^2 = |x|^2 + |y|^2 - 2 x.y so the bulk of the work is one
+  #   matrix product
+  D = X.dot(Y.T)
+  D *= -2.
+  D += sx[:, np.newaxis]
+  D += sy[np.newaxis, :]
+  # near-identical pairs lose most of their digits to cancellation, so
+  #   those few are recomputed directly
+  i, j = np.nonzero(D < 1e-6 * (sx[:, np.newaxis] + sy[np.newaxis, :]))
+  if len(i) > 0:
+    diff = X[i] - Y[j]
+    D[i, j] = np.einsum('ij,ij->i', diff, diff)
+  np.maximum(D, 0., out=D)
+  return np.sqrt(D, out=D)
+
+
+def qcp_block(X, Y, gx, gy, natoms):
+  # RMSD after optimal superposition between every frame in X and every
+  #   frame in Y, both (b, n, 3) and already centered. All the 3x3
+  #   covariances of the tile come out of one matrix product
+  bi, bj = len(X), len(Y)
+  M = X.transpose(0, 2, 1).reshape(bi*3, natoms).dot(Y.transpose(1, 0, 2).reshape(natoms, bj*3))
+  M = M.reshape(bi, 3, bj, 3).transpose(0, 2, 1, 3)
+  G = gx[:, np.newaxis] + gy[np.newaxis, :]
+  return np.sqrt(qcp_msd(M, G, lambda close: (Y[close[1]], X[close[0]])))
+
+
+def rmsd_matrix(frames, others=None, superpose=False, weights=None, memory=256*2**20, processes=None, out=None):
+  # Full-precision RMSD between all pairs of frames, N x N, or N x M
+  #   against a second set of frames.
+  #   frames/others: lists of frames, Trajectories or (N, n_atoms, 3) arrays
+  #   superpose: RMSD after optimal superposition of each pair (QCP)
+  #   weights: optional per-atom weights
+  #   memory: approximate working memory per tile, in bytes
+  #   processes: spread tiles over a process pool of this size
+  #   out: optional preallocated (e.g. memory-mapped) result array
+  X = stack_coordinates(frames)
+  symmetric = others is None
+  Y = X if symmetric else stack_coordinates(others)
+  assert (X.shape[1:] == Y.shape[1:]), "Frames have different numbers of atoms (%d, %d)!" % (X.shape[1], Y.shape[1])
+  N, natoms = X.shape[0], X.shape[1]
+  M = Y.shape[0]
+  w = fit_weights(weights, natoms)
+  if superpose:
+    # center every frame on its own (weighted) centroid
+    X = X - np.einsum('n,fni->fi', w, X)[:, np.newaxis, :]
+    Y = X if symmetric else Y - np.einsum('n,fni->fi', w, Y)[:, np.newaxis, :]
+  else:
+    # move everything to a common origin first, so the expanded square
+    #   in rmsd_block doesn't lose precision far from the origin
+    origin = w.dot(X.mean(axis=0))
+    X = X - origin
+    Y = X if symmetric else Y - origin
+  # fold the weights into the coordinates, so plain inner products give
+  #   weighted (mean) squared deviations
+  X = X * np.sqrt(w)[:, np.newaxis]
+  Y = X if symmetric else Y * np.sqrt(w)[:, np.newaxis]
+  if not superpose:
+    X = X.reshape(N, -1)
+    Y = X if symmetric else Y.reshape(M, -1)
+  sx = np.einsum('ij,ij->i', X.reshape(N, -1), X.reshape(N, -1))
+  sy = sx if symmetric else np.einsum('ij,ij->i', Y.reshape(M, -1), Y.reshape(M, -1))
+  kernel = qcp_block if superpose else rmsd_block
+  if out is None:
+    out = np.empty((N, M))
+
+  if superpose:
+    # QCP keeps ~60 temporaries per pair, and runs fastest on tiles that
+    #   stay close to the CPU caches
+    b = min(block_size(3*natoms, memory, 64), 256)
+  else:
+    b = block_size(X.shape[1], memory)
+  tiles = []
+  for i in range(0, N, b):
+    # only the upper triangle of tiles is needed for a symmetric matrix
+    for j in range(i if symmetric else 0, M, b):
+      tiles.append((i, min(i+b, N), j, min(j+b, M)))
+
+  def store(tile, D):
+    i0, i1, j0, j1 = tile
+    out[i0:i1, j0:j1] = D
+    if symmetric and i0 != j0:
+      out[j0:j1, i0:i1] = D.T
+
+  if processes is None or processes <= 1:
+    for tile in tiles:
+      i0, i1, j0, j1 = tile
+      store(tile, kernel(X[i0:i1], Y[j0:j1], sx[i0:i1], sy[j0:j1], natoms))
+  else:
+    # keep only a couple of tiles per worker in flight, so the pickled
+    #   coordinate blocks don't pile up in memory
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+      pending = {}
+      for tile in tiles:
+        if len(pending) >= 2*processes:
+          done, _ = wait(pending, return_when=FIRST_COMPLETED)
+          for job in done:
+            store(pending.pop(job), job.result())
+        i0, i1, j0, j1 = tile
+        job = pool.submit(kernel, X[i0:i1], Y[j0:j1], sx[i0:i1], sy[j0:j1], natoms)
+        pending[job] = tile
+      for job in pending:
+        store(pending[job], job.result())
+  if symmetric:
+    # exact zeros on the diagonal, rather than rounding noise
+    out[np.arange(N), np.arange(N)] = 0.
+  return out
@@ -4,32 +4,377 @@ import sys
 import struct #for hex->dec
 import re # regex
 import numpy as np
-import math
+import mmap
+import io
+import json
+import hashlib
+import glob
+import csv
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import OrderedDict
 from compchem import *
+from compchem.trajectory import *
 
 ## Function for loading PDB, PQR, PDBQT
-def load_pdb(filename):
-  if filename.lower().endswith('pdbqt'):
-    return PDB(filename, PDBQT=True)
-  elif filename.lower().endswith('pqr'):
-    return PDB(filename, PQR=True)
+#   extra keyword arguments (e.g. lazy=True) are passed on to PDB
+def load_pdb(filename, **kwargs):
+  name = strip_compression(filename).lower()
+  if name.endswith('pdbqt'):
+    return PDB(filename, PDBQT=True, **kwargs)
+  elif name.endswith('pqr'):
+    return PDB(filename, PQR=True, **kwargs)
   #else:
-  return PDB(filename)
+  return PDB(filename, **kwargs)
 
 
-def load_pqr(filename):
-  return PDB(filename, PQR=True)
+## Header records only (title, authors, journal), no frames; counts=True
+#   adds counts of atoms, models, chains and residues (see PDB.count_records)
+def load_header(filename, counts=False, **kwargs):
+  return load_pdb(filename, header_only=True, counts=counts, **kwargs)
 
 
-def load_pdbqt(filename):
-  return PDB(filename, PDBQT=True)
+def load_pqr(filename, **kwargs):
+  return PDB(filename, PQR=True, **kwargs)
 
 
+def load_pdbqt(filename, **kwargs):
+  return PDB(filename, PDBQT=True, **kwargs)
 
-# Single frame from PDB-type file
+
+## Streaming access, one frame at a time in constant memory
+#   file type is picked like load_pdb, or forced with PQR=True/PDBQT=True
+def iter_frames(filename, **kwargs):
+  if 'PQR' in kwargs or 'PDBQT' in kwargs:
+    return PDB(filename, stream=True, **kwargs).iter_frames()
+  return load_pdb(filename, stream=True, **kwargs).iter_frames()
+
+
+def iter_pqr(filename, **kwargs):
+  return PDB(filename, PQR=True, stream=True, **kwargs).iter_frames()
+
+
+def iter_pdbqt(filename, **kwargs):
+  return PDB(filename, PDBQT=True, stream=True, **kwargs).iter_frames()
+
+
+## Multi-model file straight into a shared-topology Trajectory, streaming
+#   so only one frame's metadata is ever held, and coordinates go straight
+#   into one growing (n_frames, n_atoms, 3) buffer
+def load_trajectory(filename, **kwargs):
+  topology = None
+  coordinates = None
+  for i,frame in enumerate(iter_frames(filename, **kwargs)):
+    if topology is None:
+      topology = frame
+      coordinates = GrowableArray(frame.coordinates.shape, dtype=frame.coordinates.dtype)
+    else:
+      assert (same_topology(topology, frame)), "Frame %d of %s does not share the topology of frame 0!" % (i, filename)
+    coordinates.append(frame.coordinates)
+  assert (topology is not None), "No frames in %s!" % filename
+  return Trajectory(topology=topology, coordinates=coordinates.finalize())
+
+
+
+## Records that matter when indexing frames without parsing them
+SCAN_RECORDS = re.compile(rb'^(?:(?P<end>ENDMDL|END)(?![^ \t\r\n])'
+                          rb'|(?P<ter>TER)(?![^ \t\r\n])'
+                          rb'|(?P<blank>(?:ATOM  |HETATM) {5})'
+                          rb'|(?P<header>(?:TITLE |AUTHOR|JRNL  )[^\n]*))', re.M)
+ATOM_RECORD = re.compile(rb'^(?:ATOM|HETATM)', re.M)
+END_RECORD = re.compile(rb'^(?:ENDMDL|END)(?![^ \t\r\n])', re.M)
+## Records for header-only scans
+COORDINATE_RECORDS = (b'MODEL', b'ATOM', b'HETATM')
+ATOM_PREFIXES = (b'ATOM  ', b'HETATM')
+END_PREFIXES = (b'ENDMDL', b'END\n', b'END\r', b'END ', b'END\t')
+# resname, chain, resSeq and iCode of atom lines; empty for TER lines
+RESIDUE_COLUMNS = re.compile(rb'^(?:ATOM  |HETATM).{11}(.{10})|^TER(?![^ \t\r\n])', re.M)
+
+
+def count_lines(data, prefixes):
+  # lines starting with any of prefixes (a line-aligned chunk of a file)
+  n = 0
+  for prefix in prefixes:
+    n += data.count(b'\n' + prefix) + data.startswith(prefix)
+  # a bare END on the last line, with no line break after it
+  if END_PREFIXES[1] in prefixes and (data.endswith(b'\nEND') or data == b'END'):
+    n += 1
+  return n
+
+
+def find_line(data, prefixes, last=False):
+  # offset of the first (or last) line starting with any of prefixes, or -1
+  found = []
+  for prefix in prefixes:
+    k = data.rfind(b'\n' + prefix) if last else data.find(b'\n' + prefix)
+    if k >= 0: found.append(k + 1)
+    if data.startswith(prefix): found.append(0)
+  if data.endswith(b'\nEND') and END_PREFIXES[1] in prefixes: found.append(len(data) - 3)
+  if len(found) == 0: return -1
+  return max(found) if last else min(found)
+
+
+## Bulk decoding of fixed-width records
+#   ATOM/HETATM lines are packed into an (Natoms, width) block of bytes,
+#   and each column is then sliced out and converted for all atoms at once
+def record_block(records):
+  # short lines are padded with NULs, which numpy drops from the end of
+  #   each fixed-width field
+  block = np.array(records, dtype=bytes)
+  width = max(80, block.dtype.itemsize)
+  block = block.astype('S%d' % width)
+  return block.view(np.uint8).reshape(len(records), width)
+
+
+def record_column(block, start, stop):
+  # one column of the block as an array of byte strings
+  col = np.ascontiguousarray(block[:, start:stop])
+  return col.view('S%d' % (stop - start)).ravel()
+
+
+def column_blank(block, start, stop):
+  # fields that are only spaces (or past the end of the line)
+  return (block[:, start:stop] <= 32).all(axis=1)
+
+
+def column_alpha(block, start, stop):
+  # fields that contain a letter
+  lower = block[:, start:stop] | 32
+  return ((lower >= 97) & (lower <= 122)).any(axis=1)
+
+
+def strings_to_float(col, default=None):
+  # Convert an array of byte strings to floats. Blank fields take the
+  #   default, everything unconvertible is flagged as bad
+  values = np.zeros(len(col))
+  bad = np.zeros(len(col), dtype=bool)
+  blank = np.char.strip(col) == b''
+  if default is None:
+    bad |= blank
+  else:
+    values[blank] = default
+  fill = ~blank
+  try:
+    values[fill] = col[fill].astype(float)
+  except ValueError:
+    # only pay for a python loop when something is malformed
+    for j in np.flatnonzero(fill):
+      try:
+        values[j] = float(col[j])
+      except ValueError:
+        values[j] = 0. if default is None else default
+        bad[j] = True
+  return values, bad
+
+
+def record_float(block, start, stop, default=None):
+  return strings_to_float(record_column(block, start, stop), default)
+
+
+def record_string(block, start, stop, default=None):
+  # stripped text field, optionally replacing blanks with a default
+  col = np.char.strip(record_column(block, start, stop)).astype(str)
+  if default is not None:
+    col[col == ''] = default
+  return col
+
+
+
+## Bulk formatting of ATOM records
+#   the per-atom fields are laid out column by column in an object table,
+#   and a layout repeated once per atom formats the whole frame in one go
+ATOM_LAYOUTS = {
+  'pdb':   'ATOM  %5s %-4s %-4s%1s%4s    %8.3f%8.3f%8.3f%6.2f%6.2f          %2s%2s\n',
+  'pdbqt': 'ATOM  %5s %-4s %-4s%1s%4s    %8.3f%8.3f%8.3f%6.2f%6.2f    %6.3f %-2s\n',
+  'pqr':   'ATOM  %5s %-4s %-4s%1s%4s    %8.3f%8.3f%8.3f%8.4f%7.4f\n',
+}
+# (field, width, decimals) of the fixed-width numbers in each layout
+ATOM_NUMBERS = {
+  'pdb':   [('coordinates', 8, 3), ('occupancies', 6, 2), ('temp_factors', 6, 2)],
+  'pdbqt': [('coordinates', 8, 3), ('occupancies', 6, 2), ('temp_factors', 6, 2), ('charges', 6, 3)],
+  'pqr':   [('coordinates', 8, 3), ('charges', 8, 4), ('radii', 7, 4)],
+}
+# values written instead of occupancies and B-factors too wide for their
+#   columns (the same ones the readers use when the columns are missing)
+NUMBER_DEFAULTS = {'occupancies': 1., 'temp_factors': 0.}
+
+
+## Hybrid-36 serial numbers (as in the wwPDB's large-structure files):
+#   values that don't fit width decimal digits go on in base 36, first
+#   with upper-case digits (A0000 = 100000 for width 5), then lower-case
+HYBRID36_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def hybrid36_encode(value, width):
+  if value < 10**width:
+    return '%d' % value
+  value -= 10**width
+  digits = HYBRID36_DIGITS
+  block = 26 * 36**(width-1)
+  if value >= block:
+    value -= block
+    digits = digits.lower()
+  assert (value < block), "Serial number too large for a %d-character hybrid-36 field!" % width
+  value += 10 * 36**(width-1)
+  text = ''
+  while value > 0:
+    value, d = divmod(value, 36)
+    text = digits[d] + text
+  return text
+
+
+def hybrid36_decode(text, width):
+  # None if text isn't a full-width hybrid-36 number
+  if len(text) != width or not text[0].isalpha():
+    return None
+  # upper- and lower-case digits don't mix
+  lower = text[0].islower()
+  if text != (text.lower() if lower else text.upper()):
+    return None
+  try:
+    value = int(text, 36) - 10 * 36**(width-1) + 10**width
+  except ValueError:
+    return None
+  if lower:
+    value += 26 * 36**(width-1)
+  return value
+
+
+def serial_column(values, width):
+  # integers that overflow the field are written in hybrid-36, which
+  #   parse_index reads back; missing values are left blank
+  col = np.asarray(values).astype(object)
+  missing = col == None
+  big = np.zeros(len(col), dtype=bool)
+  big[~missing] = col[~missing].astype(int) >= 10**width
+  col[missing] = ''
+  for j in np.flatnonzero(big):
+    col[j] = hybrid36_encode(int(col[j]), width)
+  return col
+
+
+def number_column(frame, field, width, decimals):
+  # A number too wide for its column would push the rest of the record
+  #   out of place. Coordinates that don't fit are refused; occupancies
+  #   and B-factors that don't fit (often junk read from non-standard
+  #   columns) are replaced by their defaults, and other values clamped
+  #   to what the column can hold, with a warning
+  values = np.asarray(getattr(frame, field), dtype=float)
+  if values.size == 0: return values
+  half = 0.5 * 10.**-decimals
+  top = 10.**(width - decimals - 1) - 2. * half
+  bottom = -(10.**(width - decimals - 2) - 2. * half)
+  # and there's no such thing as a negative occupancy
+  if field == 'occupancies': bottom = 0.
+  if values.min() >= bottom and values.max() <= top:
+    return values
+  assert (field != 'coordinates'), \
+         "%s out of range for a %d-character column (%g to %g)!" % (field, width, values.min(), values.max())
+  if field in NUMBER_DEFAULTS:
+    print('!! compchem.pdb.format_atoms: %s out of range (%g to %g), written as %.2f'
+          % (field, values.min(), values.max(), NUMBER_DEFAULTS[field]), file=sys.stderr)
+    return np.where((values < bottom) | (values > top), NUMBER_DEFAULTS[field], values)
+  print('!! compchem.pdb.format_atoms: %s out of range for a %d-character column (%g to %g), clamped'
+        % (field, width, values.min(), values.max()), file=sys.stderr)
+  return np.clip(values, bottom, top)
+
+
+def element_column(types, resnames):
+  # the element field is two characters wide: longer types (made from
+  #   atom names such as OXT) go out as the element they stand for
+  types = np.asarray(types).astype(object)
+  types[types == None] = ''
+  types = types.astype(str)
+  long = np.char.str_len(types) > 2
+  if long.any():
+    types = types.astype('<U%d' % max(2, types.dtype.itemsize // 4))
+    types[long] = guess_elements(types[long], np.asarray(resnames)[long])
+  return types.astype(object)
+
+
+def charge_column(charges):
+  # formal charges as "2+"/"1-", blank when zero or not integral
+  col = np.full(len(charges), '', dtype=object)
+  q = np.rint(charges)
+  formal = (q != 0) & (np.abs(charges - q) < 1e-6)
+  for j in np.flatnonzero(formal):
+    col[j] = '%d%s' % (abs(q[j]), '+' if q[j] > 0 else '-')
+  return col
+
+
+def format_atoms(frame, style='pdb'):
+  N = len(frame.names)
+  if N == 0: return ''
+  numbers = dict((field, number_column(frame, field, width, decimals))
+                 for field, width, decimals in ATOM_NUMBERS[style])
+  crd = numbers['coordinates']
+  names = np.asarray(frame.names, dtype=str)
+  # atom names shorter than 4 characters start in the second column
+  names = np.where(np.char.str_len(names) < 4, np.char.add(' ', names), names)
+  columns = [serial_column(frame.indices, 5), names, frame.resnames, frame.chains,
+             serial_column(frame.resids, 4), crd[:,0], crd[:,1], crd[:,2]]
+  types = frame.types
+  # PDBQT frames keep their AutoDock types, which are written back as they
+  #   were; other frames get their generic elements, which aren't
+  #   AutoDock types (A, OA, HD...), so such files need typing (e.g. by
+  #   AutoDockTools' prepare_ligand) before they are docked
+  if style == 'pdbqt' and getattr(frame, 'autodock_types', None) is not None:
+    types = np.asarray(frame.autodock_types).astype(object)
+  else:
+    types = element_column(types, frame.resnames)
+  if style == 'pdb':
+    columns += [numbers['occupancies'], numbers['temp_factors'], types, charge_column(frame.charges)]
+  elif style == 'pdbqt':
+    columns += [numbers['occupancies'], numbers['temp_factors'], numbers['charges'], types]
+  elif style == 'pqr':
+    columns += [numbers['charges'], numbers['radii']]
+  table = np.empty((N, len(columns)), dtype=object)
+  for k,col in enumerate(columns):
+    table[:,k] = np.asarray(col).tolist()
+  return (ATOM_LAYOUTS[style] * N) % tuple(table.ravel().tolist())
+
+
+## Writers for PDB, PQR, PDBQT
+#   frames can be a single frame, a PDB, a Trajectory or any iterable of
+#   frames (e.g. iter_frames), which is written out one model at a time.
+#   f is a filename (.gz/.bz2/.xz are compressed) or an open text/binary file handle,
+#   and models are numbered from model on
+def write_pdb(frames, f, style='pdb', model=1):
+  if isinstance(f, str):
+    if compression(f) != '':
+      handle = COMPRESSORS[compression(f)](f, 'wt')
+    else:
+      handle = open(f, 'w')
+    with handle:
+      write_pdb(frames, handle, style, model)
+    return
+  binary = isinstance(f, (io.RawIOBase, io.BufferedIOBase))
+  def write(text):
+    f.write(text.encode('ascii') if binary else text)
+  if isinstance(frames, MolecularFrame):
+    write(format_atoms(frames, style) + 'TER\nEND\n')
+    return
+  for i,frame in enumerate(frames):
+    write('MODEL     %4d\n' % (i+model) + format_atoms(frame, style) + 'TER\nENDMDL\n')
+
+
+def write_pdbqt(frames, f):
+  write_pdb(frames, f, style='pdbqt')
+
+
+def write_pqr(frames, f):
+  write_pdb(frames, f, style='pqr')
+
+
+
+# Single frame from a PDB-style file. For PDBQT, types holds generic
+#   elements like the other formats, with the AutoDock atom types as they
+#   were read (A, OA, HD...) in autodock_types (None for other files)
 class PDBFrame(MolecularFrame):
-  def __init__(self):
-    pass
+  __slots__ = ['autodock_types']
+
+  def __init__(self, natoms=0, dtype=float):
+    MolecularFrame.__init__(self, natoms, dtype)
+    self.autodock_types = None
 
   def __getitem__(self, key):
     adat = { 'index': self.indices[key],
@@ -46,17 +391,43 @@ class PDBFrame(MolecularFrame):
     return adat
 
   def __repr__(self):
-    pdb_atoms = ''
-    for i in range(len(self.indices)):
-      pdb_atoms += 'ATOM  %s  %3s %3s %s %s    %8.3f%8.3f%8.3f  1.00  0.00\n' % (str(self.indices[i]).rjust(5), self.names[i], self.resnames[i], self.chains[i], str(self.resids[i]).rjust(3), self.coordinates[i,0], self.coordinates[i,1], self.coordinates[i,2])
-    pdb_atoms += "TER\n"
-    return pdb_atoms
+    return format_atoms(self) + "TER\n"
+
+
+
+## On-disk cache of parsed files
+#   a small JSON header (source file key, header fields, atoms per frame and
+#   the layout of each array) followed by the raw per-atom arrays of all
+#   frames concatenated, each aligned so it can be memory-mapped
+CACHE_MAGIC = b'COMPCHEM-CACHE 1\n'
+CACHE_FIELDS = ['indices', 'names', 'types', 'chains', 'resnames', 'resids',
+                'occupancies', 'temp_factors', 'charges', 'radii', 'coordinates']
+# stand-ins for missing (None) values, which can't go in a raw array
+CACHE_MISSING = {'resids': 0, 'types': ''}
 
 
+def cache_path(filename, style='pdb', cache_dir=None):
+  # next to the source file, or in cache_dir under a name unique to the
+  #   source's absolute path
+  if cache_dir is None:
+    return '%s.%s.cache' % (filename, style)
+  key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:16]
+  return os.path.join(cache_dir, '%s.%s.%s.cache' % (os.path.basename(filename), key, style))
+
+
+def file_hash(filename):
+  h = hashlib.blake2b(digest_size=16)
+  with open(filename, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      h.update(chunk)
+  return h.hexdigest()
+
 
 ## Core PDB-style Format Parser
 class PDB:
-  def __init__(self, filename, PQR=False, PDBQT=False):
+  def __init__(self, filename, PQR=False, PDBQT=False, lazy=False, cache_size=32, stream=False,
+               disk_cache=False, cache_dir=None, dtype=np.float64, categorical=False,
+               header_only=False, counts=False, fields=None):
     # check to make sure file exists
     assert (os.path.isfile(filename)), "File does not exist (%s)!" % filename
     # assign object variables
@@ -71,8 +442,34 @@ class PDB:
     # assign type
     self.PQR = PQR
     self.PDBQT = PDBQT
-    # parse the file
-    self.parse()
+    # lazy mode only indexes frames, parsing them on first access
+    self.lazy = lazy
+    self.cache_size = cache_size
+    self.cache = OrderedDict()
+    self.offsets = []
+    self.states = []
+    # access points into a gzipped file, found while scanning it
+    self.gzip_index = None
+    # opt-in binary cache of the parsed file, reused while the source
+    #   is unchanged
+    self.disk_cache = disk_cache
+    self.cache_dir = cache_dir
+    # storage policy: coordinate dtype (float32 halves the memory of big
+    #   multi-model files) and integer-coded string fields
+    self.dtype = np.dtype(dtype)
+    self.categorical = categorical
+    # column projection: only these per-atom fields (e.g. ['types']) are
+    #   decoded, the others are read-only stand-ins (see default_field);
+    #   coordinates are always loaded
+    self.fields = projected_fields(fields)
+    # header-only mode reads the header records and stops at the first
+    #   coordinate record, building no frames; counts also tallies atoms,
+    #   models, chains and residues from record prefixes (see count_records)
+    self.header_only = header_only or counts
+    self.counts = {} if counts else None
+    # parse the file, unless frames will be streamed through iter_frames
+    if not stream:
+      self.parse()
 
 
   def __repr__(self):
@@ -80,19 +477,41 @@ class PDB:
     if self.PQR: filetype = 'PQR'
     if self.PDBQT: filetype = 'PDBQT'
     rep = '* %s-style object (%s).' % (filetype, self.filename)
-    rep += '\n  + %d frames' % len(self.frames)
+    rep += '\n  + %d frames' % len(self)
+    if self.counts is not None:
+      rep += '\n  + ' + ', '.join('%d %s' % (self.counts[key], key) for key in ('models', 'atoms', 'chains', 'residues'))
     if self.title != '': rep += '\n  + ' + self.title.replace("\n", "\n    ")
     if self.journal_string != '': rep += '\n  + ' + self.journal_string.replace("\n", "\n    ")
     return rep
 
 
+  def __len__(self):
+    if self.lazy:
+      return len(self.states)
+    return len(self.frames)
+
+
   def __getitem__(self, indices):
-    return self.frames[indices]
+    if not self.lazy:
+      return self.frames[indices]
+    if isinstance(indices, slice):
+      return [self.load_frame(i) for i in range(*indices.indices(len(self)))]
+    i = indices
+    if i < 0: i += len(self)
+    if i < 0 or i >= len(self):
+      raise IndexError('frame index %d out of range' % indices)
+    return self.load_frame(i)
 
 
-  def parse_index(self, val):
+  def parse_index(self, val, width=None):
     # When PDB atom indices or residue IDs get over 9999, it switches to hex
     # This function figures that out, and returns an int
+    # Full-width values starting with a letter are hybrid-36 (see
+    #   hybrid36_encode), as written by write_pdb and the wwPDB
+    if width is not None:
+      value = hybrid36_decode(val, width)
+      if value is not None:
+        return value
     try:
       if re.search('[a-zA-Z]', val):
         return int(val, 16)
@@ -103,188 +522,637 @@ class PDB:
       return None
       
 
+  def trajectory(self):
+    # all frames as one shared-topology Trajectory
+    return Trajectory(frames=[frame for frame in self])
+
+  def style(self):
+    if self.PQR: return 'pqr'
+    if self.PDBQT: return 'pdbqt'
+    return 'pdb'
+
   def parse(self):
+    if self.header_only:
+      self.scan_header()
+      self.finalize_header()
+      return
+    if self.disk_cache:
+      path = cache_path(self.filename, self.style(), self.cache_dir)
+      if self.load_cache(path):
+        # every frame is already at hand (memory-mapped)
+        self.lazy = False
+        return
+    if self.lazy:
+      self.scan()
+    else:
+      with open_file(self.filename) as f:
+        for frame in self.parse_frames(f):
+          self.frames.append(frame)
+    self.finalize_header()
+    # projected frames lack fields a cache has to hold
+    if self.disk_cache and not self.lazy and len(self.fields) == len(FRAME_FIELDS):
+      self.save_cache(path)
+
+  def save_cache(self, path):
+    stat = os.stat(self.filename)
+    header = { 'source': os.path.abspath(self.filename),
+               'size': stat.st_size,
+               'mtime': stat.st_mtime,
+               'hash': file_hash(self.filename),
+               'style': self.style(),
+               'title': self.title,
+               'authors': self.authors,
+               'journal': self.journal,
+               'journal_string': self.journal_string,
+               'natoms': [len(frame.names) for frame in self.frames],
+               'arrays': {} }
+    arrays = {}
+    for field in self.cache_fields():
+      if len(self.frames) > 0:
+        arr = np.concatenate([np.asarray(getattr(frame, field)) for frame in self.frames])
+      else:
+        arr = np.zeros((0, 3) if field == 'coordinates' else 0)
+      if arr.dtype == object:
+        missing = arr == None
+        fill = CACHE_MISSING.get(field, '')
+        arr = np.array([fill if m else v for v,m in zip(arr, missing)])
+        arrays[field + '_missing'] = missing
+      arrays[field] = arr
+    # lay the arrays out after the header, 64-byte aligned
+    offset = 0
+    for name,arr in arrays.items():
+      header['arrays'][name] = {'dtype': arr.dtype.str, 'shape': arr.shape, 'offset': offset}
+      offset += -(-arr.nbytes // 64) * 64
+    text = json.dumps(header).encode()
+    start = -(-(len(CACHE_MAGIC) + 8 + len(text)) // 64) * 64
+    # write to a temporary file first, so concurrent jobs never see half
+    #   a cache
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+      f.write(CACHE_MAGIC + struct.pack('<Q', start) + text)
+      for name,arr in arrays.items():
+        f.seek(start + header['arrays'][name]['offset'])
+        f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp, path)
+
+  def cache_fields(self):
+    # PDBQT frames also keep their AutoDock types
+    if self.PDBQT: return CACHE_FIELDS + ['autodock_types']
+    return CACHE_FIELDS
+
+  def load_cache(self, path):
+    # Fill in frames from a cache file, if it exists and still matches the
+    #   source (same size and mtime, or failing that the same content)
+    if not os.path.isfile(path): return False
+    with open(path, 'rb') as f:
+      if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC: return False
+      start = struct.unpack('<Q', f.read(8))[0]
+      header = json.loads(f.read(start - len(CACHE_MAGIC) - 8).rstrip(b'\0'))
+    stat = os.stat(self.filename)
+    if header['style'] != self.style() or header['size'] != stat.st_size: return False
+    if header['mtime'] != stat.st_mtime and header['hash'] != file_hash(self.filename): return False
+    # a cache made at a lower precision can't serve this one
+    if np.dtype(header['arrays']['coordinates']['dtype']).itemsize < self.dtype.itemsize: return False
+    # nor one without all the fields (e.g. from before autodock_types)
+    if any(field not in header['arrays'] for field in self.cache_fields()): return False
+    arrays = {}
+    for name,layout in header['arrays'].items():
+      shape = tuple(layout['shape'])
+      if np.prod(shape) == 0:
+        arrays[name] = np.zeros(shape, dtype=layout['dtype'])
+      else:
+        # copy-on-write, so frames can still be moved in memory
+        arrays[name] = np.memmap(path, dtype=layout['dtype'], mode='c', offset=start + layout['offset'], shape=shape)
+    self.title = header['title']
+    self.authors = header['authors']
+    self.journal = header['journal']
+    self.journal_string = header['journal_string']
+    self.frames = []
+    first = 0
+    for natoms in header['natoms']:
+      frame = PDBFrame()
+      for field in self.cache_fields():
+        arr = arrays[field][first:first+natoms]
+        if field + '_missing' in arrays:
+          missing = arrays[field + '_missing'][first:first+natoms]
+          if missing.any():
+            arr = arr.astype(object)
+            arr[missing] = None
+        setattr(frame, field, arr)
+      frame.compact(self.dtype, self.categorical)
+      self.frames.append(frame)
+      first += natoms
+    return True
+
+  def iter_frames(self):
+    # Yield each frame as its END/ENDMDL record is read, without keeping
+    #   it around; header fields are filled in as they are passed
+    with open_file(self.filename) as f:
+      for frame in self.parse_frames(f):
+        yield frame
+    self.finalize_header()
+
+  def parse_frames(self, lines, index=1, chain='A', header=True):
+    # Generator over the frames in an iterable of byte lines, each frame
+    #   is yielded as soon as its END/ENDMDL record is reached
     # temp vars for empty records
-    _index = 1
-    _findex = False
-    _chain = 'A'
-    _fchain = False
-    _coords = []
+    self._index = index
+    self._chain = chain
+    # ATOM/HETATM lines of the current frame, collected as raw byte records
+    #   and decoded all at once by finalize_frame
+    _records = []
+    _linenos = []
+    _ters = []
+    # an END straight after an ENDMDL closes the file, not another frame
+    closed = False
 
-    for i,line in enumerate(open(self.filename)):
+    for i,line in enumerate(lines):
       line = line.rstrip()
       if len(line) >= 3:
         ## RECORD
         record = line[:6].strip()
-        if record == 'TITLE':
-          if self.title != '': self.title += '\n'
-          self.title += line[10:]
-        elif record == 'AUTHOR':
-          if self.title != '': self.title += '\n'
-          self.authors += line[10:]
-        elif record == 'JRNL':
-          key = line[12:17].strip()
-          val = line[19:]
-          try:
-            self.journal[key] += '\n' + val
-          except KeyError:
-            self.journal[key] = val
-        elif record == 'TER':
-          _chain = chr(ord(_chain)+1)
-        elif record == 'END' or record == 'ENDMDL':
-          self.finalize_frame(_coords)
-          _coords = []
-          self.frames.append(self.current_frame)
+        if record == b'ATOM' or record == b'HETATM':
+          _records.append(line)
+          _linenos.append(i)
+        elif record == b'TER':
+          # remember where in the frame the chain changes
+          _ters.append(len(_records))
+        elif record == b'END' and closed and len(_records) == 0:
+          closed = False
+        elif record == b'END' or record == b'ENDMDL':
+          closed = record == b'ENDMDL'
+          self.finalize_frame(_records, _linenos, _ters)
+          _records = []
+          _linenos = []
+          _ters = []
+          frame = self.current_frame
           self.current_frame = PDBFrame()
-        elif record == 'ATOM' or record == 'HETATM':
-          ## ATOM INDEX
-          index = line[6:11].strip()
-          if index == '':
-            _findex = True
-            index = _index
-            _index += 1
-          else:
-            index = self.parse_index(index)
-          self.current_frame.indices.append(index)
-          ## ATOM NAME
-          atomn = line[12:16].strip()
-          if atomn == '': atomn = 'X'
-          self.current_frame.names.append(atomn)
-          type_from_name = ''.join([c for c in atomn if not c.isdigit()])
-          # RESIDUE NAME
-          resna = line[17:21].strip()
-          if resna == '': resna = 'X'
-          self.current_frame.resnames.append(resna)
-          ## CHAIN ID
-          chain = line[21:22].strip()
-          if chain == '':
-            _fchain = True
-            chain = _chain
-          self.current_frame.chains.append(chain)
-          ## RESIDUE NUMBER
-          resnu = line[22:26].strip()
-          if resnu == '':
-            resnu = None
-          else:
-            resnu = self.parse_index(resnu)
-          self.current_frame.resids.append(resnu)
-          ## X, Y, Z Coordinates
-          crdx = line[30:38]
-          assert(crdx != ''), "No coordinate X in PDB (strict parsing) line# %d in %s\n%s" % (i, self.filename, line)
-          crdy = line[38:46]
-          assert(crdy != ''), "No coordinate Y in PDB (strict parsing) line# %d in %s\n%s" % (i, self.filename, line)
-          crdz = line[46:52]
-          assert(crdz != ''), "No coordinate Z in PDB (strict parsing) line# %d in %s\n%s" % (i, self.filename, line)
-          try:
-            crdx = float(crdx)
-            crdy = float(crdy)
-            crdz = float(crdz)
-            extra = line[54:]
-            atom_crd = [crdx, crdy, crdz]
-          except:
-            block = line[30:]
-            d1 = block.find('.')
-            d2 = block.find('.', d1+1)
-            d3 = block.find('.', d2+1)
-            s = int((d2 - d1 - 1) / 2)
-            crdx = float(block[d1-s:d1+s])
-            crdy = float(block[d2-s:d2+s])
-            crdz = float(block[d3-s:d3+s])
-            extra = block[d3+s:]
-            atom_crd = [crdx, crdy, crdz]
-          _coords.append(atom_crd)
-          # extra columns beyond coordinates
-          if self.PQR or self.PDBQT:
-            cols = []
-            for c in extra.split():
-              if c != '':
-                cols.append(c)
-            if self.PQR:
-              self.current_frame.charges.append(float(cols[-2]))
-              self.current_frame.radii.append(float(cols[-1]))
-              self.current_frame.types.append(type_from_name)
-            if self.PDBQT:
-              self.current_frame.charges.append(float(cols[-2]))
-              self.current_frame.radii.append(0.)
-              atomt = cols[-1].strip()
-              if atomt == 'A': atomt = 'C'  # autodock-specific types
-              if atomt == 'OA': atomt = 'O'
-              if atomt == 'NA': atomt = 'N'
-              if atomt == 'HD': atomt = 'H'
-              self.current_frame.types.append(atomt)
-            self.current_frame.occupancies.append(1.)
-            self.current_frame.temp_factors.append(0.)
-          else:
-            try:
-              O = float(line[54:60])
-            except:
-              O = 1.
-            self.current_frame.occupancies.append(O)
-            try:
-              B = float(line[60:66])
-            except:
-              B = 0.
-            self.current_frame.temp_factors.append(B)
-            try:
-              qs = line[78:80]
-              if qs[1] == '+': qs = qs[0]
-              if qs[1] == '-':
-                qs = '-%s' % qs[0]
-              q = float(qs)
-            except:
-              q = 0.
-            self.current_frame.charges.append(q)
-            # try to determine generic type for PDB atom
-            atype = line[77:80].strip()
-            atomt = ''
-            if type_from_name == '' and atype == '': atomt = None
-            if type_from_name == '' and atype != '': atomt = atype
-            if type_from_name != '' and atype == '': atomt = type_from_name
-            if type_from_name != '' and atype != '': atomt = atype
-            self.current_frame.types.append(atomt)
-            # no radii, just append a zero (lookup table for generic vdw radii?)
-            self.current_frame.radii.append(0.)
-    if self.current_frame.coordinates == None and len(_coords) > 0:
-      self.finalize_frame(_coords)
-      _coords = []
-      self.frames.append(self.current_frame)
+          yield frame
+        elif header:
+          self.parse_header(record, line)
+    if len(_records) > 0:
+      self.finalize_frame(_records, _linenos, _ters)
+      frame = self.current_frame
+      self.current_frame = PDBFrame()
+      yield frame
 
-    # make some data more accessible
-    if len(self.authors) > 0:
-      self.authors = [name.strip() for name in self.authors.split(',')]
+  def parse_header(self, record, line):
+    if record == b'TITLE':
+      if self.title != '': self.title += '\n'
+      self.title += line[10:].decode('ascii', 'replace')
+    elif record == b'AUTHOR':
+      if self.title != '': self.title += '\n'
+      self.authors += line[10:].decode('ascii', 'replace')
+    elif record == b'JRNL':
+      key = line[12:17].strip().decode('ascii', 'replace')
+      val = line[19:].decode('ascii', 'replace')
+      try:
+        self.journal[key] += '\n' + val
+      except KeyError:
+        self.journal[key] = val
 
-  def finalize_frame(self, coords):
-    Natoms = len(coords)
-    if Natoms > 0:
-      self.current_frame.coordinates = np.zeros((Natoms, 3))
-      for i,atom in enumerate(coords):
-        # store x, y, z data
-        self.current_frame.coordinates[i,0] = coords[i][0]
-        self.current_frame.coordinates[i,1] = coords[i][1]
-        self.current_frame.coordinates[i,2] = coords[i][2]
+  def finalize_header(self):
     try: self.journal_string  = self.journal['TITL']
     except KeyError: pass
     try: self.journal_string += '\n' + self.journal['AUTH']
     except KeyError: pass
     try: self.journal_string += '\n' + self.journal['REF']
     except KeyError: pass
-    # convert lists to arrays
-    self.current_frame.chains =       np.array(self.current_frame.chains)
-    self.current_frame.indices =      np.array(self.current_frame.indices)
-    self.current_frame.names =        np.array(self.current_frame.names)
-    self.current_frame.types =        np.array(self.current_frame.types)
-    self.current_frame.resnames =     np.array(self.current_frame.resnames)
-    self.current_frame.resids =       np.array(self.current_frame.resids)
-    self.current_frame.occupancies =  np.array(self.current_frame.occupancies )
-    self.current_frame.temp_factors = np.array(self.current_frame.temp_factors)
-    self.current_frame.charges =      np.array(self.current_frame.charges)
-    self.current_frame.radii =        np.array(self.current_frame.radii)
+    # make some data more accessible
+    if len(self.authors) > 0:
+      self.authors = [name.strip() for name in self.authors.split(',')]
+
+  def scan(self):
+    # Lazy mode: one pass over the raw file recording the byte offset just
+    #   past every END/ENDMDL line, plus the running TER and blank-serial
+    #   counts needed to parse any frame on its own later. Plain files are
+    #   memory-mapped; compressed ones are scanned in chunks, building a
+    #   GzipIndex for .gz on the way so frames can be reached directly
+    self.offsets = [0]
+    self.states = []
+    if compression(self.filename) == '':
+      if os.path.getsize(self.filename) == 0:
+        return
+      with open_file(self.filename) as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.scan_chunks([(0, data)])
+        data.close()
+    else:
+      if compression(self.filename) == '.gz':
+        self.gzip_index = GzipIndex()
+      with open_file(self.filename, self.gzip_index) as f:
+        self.scan_chunks(read_chunks(f))
+
+  def scan_header(self):
+    # header records come before any coordinates, so reading stops there
+    with open_file(self.filename) as f:
+      for line in f:
+        record = line[:6].strip()
+        if record in COORDINATE_RECORDS:
+          break
+        self.parse_header(record, line.rstrip())
+    if self.counts is not None:
+      with open_file(self.filename) as f:
+        self.count_records(read_chunks(f))
+
+  def count_records(self, chunks):
+    # Counts without decoding columns: atoms and END/ENDMDL records are
+    #   counted as line prefixes over the whole file (models matching the
+    #   frames a full parse would give), and chains and residues from the
+    #   raw residue columns (17-27) of the first model's atom lines
+    atoms = 0
+    ends = 0
+    # whether there are atoms after the last END/ENDMDL
+    trailing = False
+    # whether the last END/ENDMDL was an ENDMDL with no atoms after it
+    #   (an END there closes the file and makes no frame, as in parse_frames)
+    closed = False
+    first = []
+    in_first = True
+    for start, data in chunks:
+      natoms = count_lines(data, ATOM_PREFIXES)
+      atoms += natoms
+      last = find_line(data, END_PREFIXES, last=True)
+      if last < 0:
+        trailing = trailing or natoms > 0
+        closed = closed and natoms == 0
+      else:
+        pos = 0
+        for m in END_RECORD.finditer(data):
+          if not (closed and m.group() == b'END' and not ATOM_RECORD.search(data, pos, m.start())):
+            ends += 1
+          closed = m.group() == b'ENDMDL'
+          pos = m.end()
+        stop = data.find(b'\n', last)
+        trailing = stop >= 0 and count_lines(data[stop+1:], ATOM_PREFIXES) > 0
+        closed = closed and not trailing
+      if in_first:
+        end = find_line(data, END_PREFIXES)
+        first.append(data[:end] if end >= 0 else data[:])
+        in_first = end < 0
+    self.counts['atoms'] = atoms
+    self.counts['models'] = ends + trailing
+    # residue columns of the first model, with TER records in between
+    keys = np.array(RESIDUE_COLUMNS.findall(b''.join(first)), dtype='S10')
+    ter = keys == b''
+    atom = ~ter
+    self.counts['first_model_atoms'] = int(np.count_nonzero(atom))
+    # blank chain ids take a letter per TER counting up from A, as
+    #   finalize_frame gives them (so they can run into explicit ones)
+    segment = np.cumsum(ter)[atom]
+    keys = keys[atom]
+    chain = keys.view(np.uint8).reshape(-1, 10)[:,4] if len(keys) > 0 else np.zeros(0, dtype=np.uint8)
+    chain = np.where(chain == ord(' '), ord('A') + segment, chain)
+    change = np.ones(len(keys), dtype=bool)
+    change[1:] = (keys[1:] != keys[:-1]) | (chain[1:] != chain[:-1])
+    self.counts['chains'] = len(np.unique(chain))
+    self.counts['residues'] = int(np.count_nonzero(change))
+
+  def scan_chunks(self, chunks):
+    # scan (offset, data) pieces of the file that each end at a line break
+    size = 0
+    ters = 0
+    blanks = 0
+    state = (1, 'A')
+    # whether there are atoms after the last END/ENDMDL
+    trailing = False
+    # whether the last END/ENDMDL was an ENDMDL with no atoms after it
+    closed = False
+    for start, data in chunks:
+      last = 0
+      for m in SCAN_RECORDS.finditer(data):
+        if m.lastgroup == 'end':
+          stop = data.find(b'\n', m.end())
+          end = len(data) if stop < 0 else stop + 1
+          if closed and m.group('end') == b'END' and not trailing and not ATOM_RECORD.search(data, last, m.start()):
+            # END closing a file of models: no frame of its own, the last
+            #   frame just reaches past it
+            self.offsets[-1] = start + end
+            last = end
+            closed = False
+            continue
+          closed = m.group('end') == b'ENDMDL'
+          self.states.append(state)
+          last = end
+          self.offsets.append(start + last)
+          state = (1 + blanks, chr(ord('A') + ters))
+          trailing = False
+        elif m.lastgroup == 'ter':
+          ters += 1
+        elif m.lastgroup == 'blank':
+          blanks += 1
+        else:
+          line = m.group().rstrip()
+          self.parse_header(line[:6].strip(), line)
+      if not trailing and ATOM_RECORD.search(data, last):
+        trailing = True
+      size = start + len(data)
+    # atoms after the last END/ENDMDL still make a frame
+    if trailing:
+      self.states.append(state)
+      self.offsets.append(size)
+
+  def load_frame(self, i):
+    # Parse a single frame of a lazy PDB, caching the most recently used
+    if i in self.cache:
+      self.cache.move_to_end(i)
+      return self.cache[i]
+    index, chain = self.states[i]
+    with open_file(self.filename, self.gzip_index) as f:
+      f.seek(self.offsets[i])
+      data = f.read(self.offsets[i+1] - self.offsets[i])
+    frame = next(self.parse_frames(data.splitlines(), index, chain, header=False))
+    self.cache[i] = frame
+    if len(self.cache) > self.cache_size:
+      self.cache.popitem(last=False)
+    return frame
+
+  def parse_coordinates(self, line, i):
+    # Line-by-line coordinate parsing, used as a fallback for records
+    #   that don't follow the fixed columns (e.g. whitespace-delimited PQR)
+    line = line.decode('ascii', 'replace')
+    crdx = line[30:38]
+    assert(crdx != ''), "No coordinate X in PDB (strict parsing) line# %d in %s\n%s" % (i, self.filename, line)
+    crdy = line[38:46]
+    assert(crdy != ''), "No coordinate Y in PDB (strict parsing) line# %d in %s\n%s" % (i, self.filename, line)
+    crdz = line[46:54]
+    assert(crdz != ''), "No coordinate Z in PDB (strict parsing) line# %d in %s\n%s" % (i, self.filename, line)
+    try:
+      crdx = float(crdx)
+      crdy = float(crdy)
+      crdz = float(crdz)
+      extra = line[54:]
+    except:
+      block = line[30:]
+      d1 = block.find('.')
+      d2 = block.find('.', d1+1)
+      d3 = block.find('.', d2+1)
+      s = int((d2 - d1 - 1) / 2)
+      crdx = float(block[d1-s:d1+s])
+      crdy = float(block[d2-s:d2+s])
+      crdz = float(block[d3-s:d3+s])
+      extra = block[d3+s:]
+    # extra columns beyond coordinates
+    cols = [c for c in extra.split() if c != '']
+    return [crdx, crdy, crdz], cols
+
+  def parse_indices(self, block, start, stop):
+    # Decode an atom index / residue number column, resolving hex values
+    #   through parse_index only for the fields that contain letters
+    blank = column_blank(block, start, stop)
+    hexa = column_alpha(block, start, stop)
+    col = record_column(block, start, stop)
+    values = np.zeros(len(col), dtype=int)
+    fill = ~blank & ~hexa
+    values[fill] = col[fill].astype(int)
+    for j in np.flatnonzero(hexa):
+      val = self.parse_index(col[j].decode('ascii', 'replace').strip(), stop - start)
+      values[j] = -1 if val is None else val
+    return values, blank
+
+  def finalize_frame(self, records, linenos=None, ters=()):
+    Natoms = len(records)
+    if linenos is None: linenos = list(range(Natoms))
+    frame = self.current_frame
+    block = record_block(records)
+    # fields to decode (see fields= in __init__), the rest are left alone
+    fields = self.fields
+    values = {}
+
+    ## ATOM INDEX
+    if 'indices' in fields:
+      indices, blank = self.parse_indices(block, 6, 11)
+      nblank = np.count_nonzero(blank)
+      if nblank > 0:
+        indices[blank] = np.arange(self._index, self._index + nblank)
+        self._index += nblank
+      values['indices'] = indices
+    ## ATOM NAME
+    if 'names' in fields:
+      values['names'] = record_string(block, 12, 16, 'X')
+    if 'types' in fields and not self.PDBQT:
+      type_from_name = np.char.translate(record_column(block, 12, 16).copy(), None, b'0123456789')
+      type_from_name = np.char.strip(type_from_name).astype(str)
+    ## RESIDUE NAME
+    if 'resnames' in fields:
+      values['resnames'] = record_string(block, 17, 21, 'X')
+    ## CHAIN ID, blank chains count up from the last one at every TER
+    if 'chains' in fields:
+      chains = record_string(block, 21, 22)
+      blank = chains == ''
+      if blank.any():
+        step = np.searchsorted(np.asarray(ters, dtype=int), np.arange(Natoms), side='right')
+        default = np.array([chr(ord(self._chain) + s) for s in range(len(ters) + 1)])
+        chains[blank] = default[step[blank]]
+      values['chains'] = chains
+    self._chain = chr(ord(self._chain) + len(ters))
+    ## RESIDUE NUMBER
+    if 'resids' in fields:
+      resids, blank = self.parse_indices(block, 22, 26)
+      if blank.any():
+        resids = resids.astype(object)
+        resids[blank] = None
+      values['resids'] = resids
+    ## X, Y, Z Coordinates
+    coordinates = np.zeros((Natoms, 3), dtype=self.dtype)
+    bad = np.zeros(Natoms, dtype=bool)
+    for k,(start, stop) in enumerate( ((30,38), (38,46), (46,54)) ):
+      coordinates[:,k], b = record_float(block, start, stop)
+      bad |= b
+    values['coordinates'] = coordinates
+
+    # extra columns beyond coordinates
+    if self.PQR or self.PDBQT:
+      extras = ['charges', 'radii'] if self.PQR else ['charges', 'types']
+      if fields.intersection(extras):
+        # last two whitespace-separated fields after the coordinates
+        extra = np.char.rstrip(record_column(block, 54, block.shape[1]))
+        extra = np.char.rpartition(extra, b' ')
+        last = np.char.strip(extra[:,2])
+        extra = np.char.rpartition(np.char.rstrip(extra[:,0]), b' ')
+        second = np.char.strip(extra[:,2])
+        if 'charges' in fields:
+          values['charges'], b = strings_to_float(second)
+          bad |= b
+        if self.PQR and 'radii' in fields:
+          values['radii'], b = strings_to_float(last)
+          bad |= b
+        if self.PDBQT and 'types' in fields:
+          frame.autodock_types = last.astype('<U%d' % max(3, last.dtype.itemsize))
+          values['types'] = self.autodock_types(frame.autodock_types)
+      if self.PQR and 'types' in fields:
+        values['types'] = type_from_name
+      if 'occupancies' in fields: values['occupancies'] = np.ones(Natoms)
+      if 'temp_factors' in fields: values['temp_factors'] = np.zeros(Natoms)
+      if self.PDBQT and 'radii' in fields: values['radii'] = np.zeros(Natoms)
+    else:
+      if 'occupancies' in fields:
+        values['occupancies'], b = record_float(block, 54, 60, 1.)
+      if 'temp_factors' in fields:
+        values['temp_factors'], b = record_float(block, 60, 66, 0.)
+      if 'charges' in fields:
+        # formal charge, e.g. "2+" or "1-"
+        charges, b = strings_to_float(np.char.add(record_column(block, 79, 80), record_column(block, 78, 79)), 0.)
+        charges[b] = 0.
+        values['charges'] = charges
+      if 'types' in fields:
+        # try to determine generic type for PDB atom
+        atype = record_string(block, 76, 78)
+        types = np.where(atype != '', atype, type_from_name)
+        untyped = types == ''
+        if untyped.any():
+          types = types.astype(object)
+          types[untyped] = None
+        values['types'] = types
+      # no radii, just a zero (lookup table for generic vdw radii?)
+      if 'radii' in fields: values['radii'] = np.zeros(Natoms)
+
+    # fall back to line-by-line parsing for anything the fixed columns
+    #   couldn't decode
+    for j in np.flatnonzero(bad):
+      crd, cols = self.parse_coordinates(records[j], linenos[j])
+      coordinates[j,:] = crd
+      if 'charges' in values and (self.PQR or self.PDBQT):
+        values['charges'][j] = float(cols[-2])
+      if self.PQR and 'radii' in values:
+        values['radii'][j] = float(cols[-1])
+      if self.PDBQT and 'types' in values:
+        frame.autodock_types[j] = cols[-1].strip()
+        values['types'][j] = self.autodock_types(np.array([cols[-1].strip()]))[0]
+
+    # store arrays on the frame, with stand-ins for the fields not loaded
+    for field, dtype, fill in FRAME_FIELDS:
+      setattr(frame, field, values[field] if field in values else default_field(field, Natoms))
+    frame.coordinates = coordinates
+    if self.categorical:
+      frame.compact(None, True)
+
+  def autodock_types(self, types):
+    # autodock-specific types to generic elements
+    types = types.astype('<U%d' % max(2, types.dtype.itemsize // 4))
+    types[types == 'A'] = 'C'
+    types[types == 'OA'] = 'O'
+    types[types == 'NA'] = 'N'
+    types[types == 'HD'] = 'H'
+    return types
+
+
+
+## Directory-scale ingestion
+#   files (e.g. a local PDB mirror) are parsed on a process pool, a batch of
+#   files per job with a bounded number of jobs in flight, and each gives a
+#   small summary row; files that fail to parse give a row with the error
+#   instead of stopping the run
+STRUCTURE_SUFFIXES = ('.pdb', '.ent', '.pdbqt', '.pqr')
+SUMMARY_COLUMNS = ['filename', 'frames', 'atoms', 'chains', 'residues', 'title', 'center_x', 'center_y',
+                   'center_z', 'size_x', 'size_y', 'size_z', 'error']
+
+
+def structure_files(paths):
+  # sorted structure files from directories (searched recursively), globs
+  #   and file names, compressed (.gz, .bz2, .xz) or not
+  if isinstance(paths, str): paths = [paths]
+  found = []
+  for path in paths:
+    if os.path.isdir(path):
+      for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for fn in sorted(files):
+          if strip_compression(fn).lower().endswith(STRUCTURE_SUFFIXES):
+            found.append(os.path.join(root, fn))
+    elif glob.has_magic(path):
+      found += sorted(glob.glob(path))
+    else:
+      found.append(path)
+  return found
+
+
+def summarize_pdb(filename, header=False, **kwargs):
+  # One summary row for a file: frame count, plus atom, chain and residue
+  #   counts, center and dimensions of the first frame. Only the first
+  #   frame is parsed (lazy). With header=True nothing is parsed at all:
+  #   the counts for the first model come from a header-only scan
+  row = dict((column, '') for column in SUMMARY_COLUMNS)
+  row['filename'] = filename
+  try:
+    if header:
+      pdb = load_header(filename, counts=True, **kwargs)
+      row['title'] = ' '.join(line.strip() for line in pdb.title.split('\n')).strip()
+      row['frames'] = pdb.counts['models']
+      row['atoms'] = pdb.counts['first_model_atoms']
+      row['chains'] = pdb.counts['chains']
+      row['residues'] = pdb.counts['residues']
+      return row
+    pdb = load_pdb(filename, lazy=True, **kwargs)
+    row['frames'] = len(pdb)
+    row['title'] = ' '.join(line.strip() for line in pdb.title.split('\n')).strip()
+    if len(pdb) > 0:
+      frame = pdb[0]
+      row['atoms'] = len(frame)
+      # distinct chain ids (blank ones lettered by the parser), as the
+      #   header scan counts them
+      h = hierarchy(frame)
+      row['chains'] = len(np.unique(comparable(h.chains)))
+      row['residues'] = h.n_residues
+      if len(frame) > 0:
+        row['center_x'], row['center_y'], row['center_z'] = frame.measure_center().tolist()
+        row['size_x'], row['size_y'], row['size_z'] = frame.measure_dimensions().tolist()
+  except Exception as e:
+    row['error'] = '%s: %s' % (e.__class__.__name__, e)
+  return row
+
 
+def summarize_batch(filenames, kwargs):
+  return [summarize_pdb(fn, **kwargs) for fn in filenames]
 
 
+def summarize_pdbs(paths, processes=None, batch=16, output=None, **kwargs):
+  # Summary rows (dicts of SUMMARY_COLUMNS) for every structure file under
+  #   paths, in file order. processes > 1 spreads batches of files over a
+  #   process pool; output writes the rows as a table, CSV or (.npz) one
+  #   array per column. Extra keyword arguments go to load_pdb
+  filenames = structure_files(paths)
+  batches = [filenames[i:i+batch] for i in range(0, len(filenames), batch)]
+  results = {}
+  if processes is None or processes <= 1:
+    for k,files in enumerate(batches):
+      results[k] = summarize_batch(files, kwargs)
+  else:
+    # only a couple of batches per worker in flight, so a huge mirror
+    #   doesn't queue up every job (and its results) at once
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+      pending = {}
+      for k,files in enumerate(batches):
+        if len(pending) >= 2*processes:
+          done, _ = wait(pending, return_when=FIRST_COMPLETED)
+          for job in done:
+            results[pending.pop(job)] = job.result()
+        pending[pool.submit(summarize_batch, files, kwargs)] = k
+      for job in pending:
+        results[pending[job]] = job.result()
+  rows = [row for k in range(len(batches)) for row in results[k]]
+  if output is not None:
+    write_summary(rows, output)
+  return rows
 
-#################################
-#for fn in os.listdir('../../PDBdb/'):
-#  pdb = load_pdb('%s%s' % ("../../PDBdb/",fn))
-#  print(pdb)
 
+def write_summary(rows, output):
+  # output is a filename (.npz for one array per column, CSV otherwise)
+  #   or an open text file, which gets CSV
+  if not isinstance(output, str):
+    table = csv.DictWriter(output, SUMMARY_COLUMNS)
+    table.writeheader()
+    table.writerows(rows)
+  elif output.lower().endswith('.npz'):
+    columns = {}
+    for column in SUMMARY_COLUMNS:
+      values = [row[column] for row in rows]
+      if column in ('frames', 'atoms', 'chains', 'residues'):
+        values = [-1 if v == '' else v for v in values]
+      elif column.startswith('center') or column.startswith('size'):
+        values = [np.nan if v == '' else v for v in values]
+      columns[column] = np.array(values)
+    np.savez(output, **columns)
+  else:
+    with open(output, 'w', newline='') as f:
+      write_summary(rows, f)
@@ -0,0 +1,395 @@
+import re
+import fnmatch
+import numpy as np
+from collections import OrderedDict
+from compchem.bonds import guess_elements
+from compchem.neighbors import coordinate_stamp
+from compchem.categorical import Categorical
+from compchem.hierarchy import topology_key, TopologyCache, hierarchy
+
+
+## Atom selection language, e.g.
+#     chain A and resname LIG and not type H and within 5 of resname LIG
+#   Expressions are parsed once into a tree of vectorized operations over
+#   the per-atom arrays. Parts that only look at the topology (names,
+#   residues, ...) are evaluated once per topology and cached, so frames of
+#   a Trajectory, which share their topology arrays, reuse the same masks;
+#   only coordinate-dependent parts (within, x/y/z) are redone per frame
+#
+#   Keywords:
+#     chain, resname, name, type, element    string values, * and ? wildcards
+#     resid, serial, index                   numbers and ranges (1 to 10)
+#     charge, occupancy, beta, radius, x, y, z
+#                                            also comparisons (x < 5)
+#     all, none, hydrogen, heavy, water, backbone, protein
+#     within R of <sel>, same residue as <sel>
+#     not, and, or, parentheses
+
+# per-atom string fields, by keyword
+STRING_FIELDS = {'chain': 'chains', 'resname': 'resnames', 'name': 'names', 'type': 'types'}
+# per-atom numeric fields, by keyword (index is the 0-based atom position)
+NUMBER_FIELDS = {'resid': 'resids', 'serial': 'indices', 'charge': 'charges',
+                 'occupancy': 'occupancies', 'beta': 'temp_factors', 'radius': 'radii'}
+COORDINATE_FIELDS = {'x': 0, 'y': 1, 'z': 2}
+
+AMINO_ACIDS = 'ALA ARG ASN ASP CYS GLN GLU GLY HIS ILE LEU LYS MET PHE PRO SER THR TRP TYR VAL ' \
+              'HID HIE HIP HSD HSE HSP CYX CYM ASH GLH LYN ACE NME NHE MSE SEC'
+MACROS = {'hydrogen': 'element H',
+          'heavy':    'not element H',
+          'water':    'resname HOH WAT TIP3 TIP4 TIP5 SOL H2O SPC',
+          'backbone': 'name N CA C O and protein',
+          'protein':  'resname ' + AMINO_ACIDS}
+
+COMPARISONS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+               '==': np.equal, '!=': np.not_equal}
+RESERVED = set(['and', 'or', 'not', '(', ')', 'of', 'as', 'to', 'within', 'same', 'all', 'none']) \
+           | set(STRING_FIELDS) | set(NUMBER_FIELDS) | set(COORDINATE_FIELDS) | set(['element', 'index']) \
+           | set(MACROS) | set(COMPARISONS)
+TOKEN = re.compile(r'\s*(?:(\(|\)|<=|>=|==|!=|<|>)|"([^"]*)"|\'([^\']*)\'|([^\s()<>=!"\']+))')
+
+
+def tokenize(text):
+  # words, quoted strings (never keywords) and operators
+  tokens = []
+  pos = 0
+  text = text.strip()
+  while pos < len(text):
+    m = TOKEN.match(text, pos)
+    assert (m is not None and m.end() > pos), 'Selection syntax error at "%s"' % text[pos:]
+    op, dq, sq, word = m.groups()
+    if word is not None: tokens.append(word)
+    elif op is not None: tokens.append(op)
+    else: tokens.append(Quoted(dq if dq is not None else sq))
+    pos = m.end()
+  return tokens
+
+
+class Quoted(str):
+  # a quoted value, taken literally even if it spells a keyword
+  pass
+
+
+## Nodes of a compiled selection. Each evaluates to a boolean mask over the
+#   atoms of a frame; static nodes only depend on the topology
+
+class Node:
+  # subclasses give evaluate(frame)
+  static = True
+
+
+class Constant(Node):
+  def __init__(self, value):
+    self.value = value
+
+  def evaluate(self, frame):
+    return np.full(len(frame), self.value)
+
+
+class StringMatch(Node):
+  # values of a string field, matched on the unique values only
+  def __init__(self, keyword, values):
+    self.keyword = keyword
+    self.values = values
+
+  def evaluate(self, frame):
+    if self.keyword == 'element':
+      column = guess_elements(frame.types, frame.resnames)
+    else:
+      column = getattr(frame, STRING_FIELDS[self.keyword])
+    if isinstance(column, Categorical):
+      # already coded: match the categories, then look up every atom
+      unique, inverse = column.categories.astype(str), column.codes
+    else:
+      unique, inverse = np.unique(np.asarray(column).astype(str), return_inverse=True)
+    hit = np.zeros(len(unique), dtype=bool)
+    for value in self.values:
+      if not isinstance(value, Quoted) and ('*' in value or '?' in value or '[' in value):
+        hit |= np.array([fnmatch.fnmatchcase(u, value) for u in unique], dtype=bool)
+      else:
+        hit |= unique == value
+    return hit[inverse.ravel()]
+
+
+class NumberMatch(Node):
+  # numbers, ranges (lo, hi) or comparisons (op, value) on a numeric field
+  def __init__(self, keyword, terms):
+    self.keyword = keyword
+    self.terms = terms
+    self.static = keyword not in COORDINATE_FIELDS
+
+  def column(self, frame):
+    if self.keyword == 'index':
+      return np.arange(len(frame))
+    if self.keyword in COORDINATE_FIELDS:
+      return np.asarray(frame.coordinates, dtype=float)[:, COORDINATE_FIELDS[self.keyword]]
+    # missing values (e.g. blank resids) become NaN, which match nothing
+    return np.array(getattr(frame, NUMBER_FIELDS[self.keyword]), dtype=float)
+
+  def evaluate(self, frame):
+    column = self.column(frame)
+    mask = np.zeros(len(column), dtype=bool)
+    for kind, a, b in self.terms:
+      if kind == 'value': mask |= column == a
+      elif kind == 'range': mask |= (column >= a) & (column <= b)
+      else: mask |= COMPARISONS[a](column, b)
+    return mask
+
+
+class Not(Node):
+  def __init__(self, child):
+    self.child = child
+    self.static = child.static
+
+  def evaluate(self, frame):
+    return ~self.child.evaluate(frame)
+
+
+class And(Node):
+  def __init__(self, children):
+    self.children = children
+    self.static = all(child.static for child in children)
+
+  def evaluate(self, frame):
+    # static terms first (cached), skipping the rest once nothing is left
+    mask = None
+    for child in sorted(self.children, key=lambda child: not child.static):
+      mask = child.evaluate(frame) if mask is None else mask & child.evaluate(frame)
+      if not mask.any(): break
+    return mask
+
+
+class Or(Node):
+  def __init__(self, children):
+    self.children = children
+    self.static = all(child.static for child in children)
+
+  def evaluate(self, frame):
+    mask = self.children[0].evaluate(frame)
+    for child in self.children[1:]:
+      mask = mask | child.evaluate(frame)
+    return mask
+
+
+class Within(Node):
+  # atoms within r of any atom of the inner selection, by radius queries
+  #   on the frame's neighbor index around the (usually few) inner atoms
+  static = False
+
+  def __init__(self, r, child):
+    self.r = r
+    self.child = child
+
+  def evaluate(self, frame):
+    inner = np.flatnonzero(self.child.evaluate(frame))
+    mask = np.zeros(len(frame), dtype=bool)
+    if len(inner) == 0:
+      return mask
+    points = np.asarray(frame.coordinates, dtype=float)[inner]
+    mask[frame.neighbor_index().query_pairs(points, self.r)[1]] = True
+    mask[inner] = True
+    return mask
+
+
+class SameResidue(Node):
+  # whole residues of the atoms of the inner selection
+  def __init__(self, child):
+    self.child = child
+    self.static = child.static
+
+  def evaluate(self, frame):
+    residues = hierarchy(frame)
+    hit = np.zeros(residues.n_residues, dtype=bool)
+    hit[residues.residue_index[self.child.evaluate(frame)]] = True
+    return hit[residues.residue_index]
+
+
+class Cached(Node):
+  # a static subtree whose mask is kept per topology, so it's worked out
+  #   once for all frames sharing that topology
+  def __init__(self, child):
+    self.child = child
+    self.masks = TopologyCache()
+
+  def evaluate(self, frame):
+    return self.masks.get(frame, self.compute)
+
+  def compute(self, frame):
+    mask = self.child.evaluate(frame)
+    mask.setflags(write=False)
+    return mask
+
+
+## Recursive descent parser
+#   or_expr  := and_expr ('or' and_expr)*
+#   and_expr := not_expr ('and' not_expr)*
+#   not_expr := 'not' not_expr | 'within' R 'of' not_expr
+#               | 'same' 'residue' 'as' not_expr | primary
+#   primary  := '(' or_expr ')' | all | none | macro | keyword values
+
+class Parser:
+  def __init__(self, text):
+    self.text = text
+    self.tokens = tokenize(text)
+    self.pos = 0
+
+  def peek(self):
+    if self.pos < len(self.tokens):
+      return self.tokens[self.pos]
+    return None
+
+  def keyword(self):
+    # next token if it is an (unquoted) keyword
+    token = self.peek()
+    if token is None or isinstance(token, Quoted): return None
+    return token.lower() if token.lower() in RESERVED else None
+
+  def take(self):
+    token = self.peek()
+    assert (token is not None), 'Selection "%s" ends unexpectedly' % self.text
+    self.pos += 1
+    return token
+
+  def expect(self, word):
+    token = self.take()
+    assert (not isinstance(token, Quoted) and token.lower() == word), \
+           'Selection "%s": expected "%s", got "%s"' % (self.text, word, token)
+
+  def number(self):
+    token = self.take()
+    try:
+      return float(token)
+    except ValueError:
+      raise AssertionError('Selection "%s": expected a number, got "%s"' % (self.text, token))
+
+  def parse(self):
+    node = self.or_expr()
+    assert (self.peek() is None), 'Selection "%s": unexpected "%s"' % (self.text, self.peek())
+    return node
+
+  def or_expr(self):
+    children = [self.and_expr()]
+    while self.keyword() == 'or':
+      self.take()
+      children.append(self.and_expr())
+    return children[0] if len(children) == 1 else Or(children)
+
+  def and_expr(self):
+    children = [self.not_expr()]
+    while self.keyword() == 'and':
+      self.take()
+      children.append(self.not_expr())
+    return children[0] if len(children) == 1 else And(children)
+
+  def not_expr(self):
+    word = self.keyword()
+    if word == 'not':
+      self.take()
+      return Not(self.not_expr())
+    if word == 'within':
+      self.take()
+      r = self.number()
+      self.expect('of')
+      return Within(r, self.not_expr())
+    if word == 'same':
+      self.take()
+      self.expect('residue')
+      self.expect('as')
+      return SameResidue(self.not_expr())
+    return self.primary()
+
+  def primary(self):
+    if self.peek() is None: self.take()
+    word = self.keyword()
+    assert (word is not None), 'Selection "%s": unexpected "%s"' % (self.text, self.peek())
+    self.take()
+    if word == '(':
+      node = self.or_expr()
+      self.expect(')')
+      return node
+    if word in ('all', 'none'):
+      return Constant(word == 'all')
+    if word in MACROS:
+      return Parser(MACROS[word]).parse()
+    if word in STRING_FIELDS or word == 'element':
+      values = self.values()
+      assert (len(values) > 0), 'Selection "%s": "%s" needs values' % (self.text, word)
+      return StringMatch(word, values)
+    if word in NUMBER_FIELDS or word in COORDINATE_FIELDS or word == 'index':
+      return NumberMatch(word, self.number_terms(word))
+    assert (False), 'Selection "%s": unexpected "%s"' % (self.text, word)
+
+  def end_of_values(self):
+    # values run up to the next and/or/closing parenthesis, so they may
+    #   spell other keywords (e.g. resname X)
+    token = self.peek()
+    return token is None or (not isinstance(token, Quoted) and token.lower() in ('and', 'or', ')'))
+
+  def values(self):
+    values = []
+    while not self.end_of_values():
+      values.append(self.take())
+    return values
+
+  def number_terms(self, word):
+    if self.keyword() in COMPARISONS:
+      op = self.take()
+      return [('compare', op, self.number())]
+    terms = []
+    while not self.end_of_values():
+      lo = self.number()
+      if self.keyword() == 'to':
+        self.take()
+        terms.append(('range', lo, self.number()))
+      else:
+        terms.append(('value', lo, None))
+    assert (len(terms) > 0), 'Selection "%s": "%s" needs values' % (self.text, word)
+    return terms
+
+
+def cache_static(node):
+  # wrap every largest static subtree in a per-topology cache
+  if node.static:
+    return Cached(node)
+  for name in ('child', 'children'):
+    if hasattr(node, name):
+      value = getattr(node, name)
+      if isinstance(value, list): setattr(node, name, [cache_static(child) for child in value])
+      else: setattr(node, name, cache_static(value))
+  return node
+
+
+# A compiled selection: call it on a frame for a boolean mask over its atoms
+class Selection:
+  def __init__(self, text):
+    self.text = text
+    self.root = cache_static(Parser(text).parse())
+    self.static = self.root.static
+    self.last = None
+
+  def __repr__(self):
+    return '* Selection "%s"' % self.text
+
+  def __call__(self, frame):
+    if self.static:
+      return self.root.evaluate(frame)
+    # coordinate-dependent: keep the mask of the last frame seen, for
+    #   asking the same frame again
+    key = (topology_key(frame), coordinate_stamp(frame.coordinates))
+    if self.last is None or self.last[0] != key:
+      mask = self.root.evaluate(frame)
+      mask.setflags(write=False)
+      self.last = (key, mask)
+    return self.last[1]
+
+
+# compiled selections by text, so each expression is parsed only once
+selections = OrderedDict()
+
+
+def compile_selection(text, size=256):
+  if text not in selections:
+    selections[text] = Selection(text)
+    if len(selections) > size:
+      selections.popitem(last=False)
+  selections.move_to_end(text)
+  return selections[text]
@@ -0,0 +1,142 @@
+import numpy as np
+
+
+# Rotations follow MolecularFrame.rotate_matrix, acting on row vectors:
+#   aligned = coordinates.dot(R) + t
+
+def fit_weights(weights, natoms):
+  # per-atom weights normalized to sum to one (uniform if none given)
+  if weights is None:
+    return np.full(natoms, 1. / natoms)
+  weights = np.asarray(weights, dtype=float)
+  assert (weights.shape == (natoms,)), "Need one weight per fitted atom (%d != %d)!" % (len(weights), natoms)
+  return weights / weights.sum()
+
+
+def kabsch(mobile, target, weights=None):
+  # Optimal (weighted) superposition of mobile onto target, both (n, 3)
+  #   with atoms in the same order. Returns rotation, translation and
+  #   the RMSD after superposition
+  R, t, rmsd = kabsch_batch(np.asarray(mobile)[np.newaxis], target, weights)
+  return R[0], t[0], rmsd[0]
+
+
+def kabsch_batch(mobiles, target, weights=None):
+  # Kabsch for a stack of frames (N, n, 3) onto one target (n, 3), with all
+  #   3x3 SVDs done in a single call. Returns R (N, 3, 3), t (N, 3) and
+  #   the RMSD of each frame after superposition (N,)
+  Y = np.asarray(mobiles, dtype=float)
+  X = np.asarray(target, dtype=float)
+  assert (Y.shape[1:] == X.shape), "Mobile and target frames have different shapes (%s, %s)!" % (Y.shape[1:], X.shape)
+  w = fit_weights(weights, X.shape[0])
+  # weighted centroids
+  xbar = w.dot(X)
+  ybar = np.einsum('n,fni->fi', w, Y)
+  Xc = X - xbar
+  Yc = Y - ybar[:, np.newaxis, :]
+  # covariance of each frame with the target, and its SVD
+  H = np.einsum('fni,nj->fij', Yc * w[np.newaxis, :, np.newaxis], Xc)
+  U, S, Vt = np.linalg.svd(H)
+  # flip the smallest singular vector where needed to avoid reflections
+  d = np.sign(np.linalg.det(np.matmul(U, Vt)))
+  d[d == 0] = 1.
+  U[:, :, 2] *= d[:, np.newaxis]
+  R = np.matmul(U, Vt)
+  t = xbar - np.einsum('fi,fij->fj', ybar, R)
+  diff = np.matmul(Yc, R) - Xc
+  rmsd = np.sqrt(np.einsum('n,fni,fni->f', w, diff, diff))
+  return R, t, rmsd
+
+
+## Quaternion characteristic polynomial (QCP, Theobald 2005)
+#   The RMSD after optimal superposition comes from the largest eigenvalue
+#   of a 4x4 key matrix built from the 3x3 covariance, found by Newton's
+#   method on its characteristic polynomial; no SVD and no rotation needed
+
+def qcp_eigenvalue(M, G):
+  # Largest eigenvalue of the key matrix for covariances M (..., 3, 3),
+  #   given G (...), the summed inner products of both structures
+  Sxx, Sxy, Sxz = M[...,0,0], M[...,0,1], M[...,0,2]
+  Syx, Syy, Syz = M[...,1,0], M[...,1,1], M[...,1,2]
+  Szx, Szy, Szz = M[...,2,0], M[...,2,1], M[...,2,2]
+  Sxx2, Syy2, Szz2 = Sxx*Sxx, Syy*Syy, Szz*Szz
+  Sxy2, Syz2, Sxz2 = Sxy*Sxy, Syz*Syz, Sxz*Sxz
+  Syx2, Szy2, Szx2 = Syx*Syx, Szy*Szy, Szx*Szx
+  # P(l) = l^4 + C2 l^2 + C1 l + C0, C1 = -8 det(M) and C0 = det(K),
+  #   written out in full as in Theobald's reference implementation
+  C2 = -2. * (Sxx2 + Syy2 + Szz2 + Sxy2 + Syx2 + Sxz2 + Szx2 + Syz2 + Szy2)
+  C1 = 8. * (Sxx*Syz*Szy + Syy*Szx*Sxz + Szz*Sxy*Syx - Sxx*Syy*Szz - Syz*Szx*Sxy - Szy*Syx*Sxz)
+  SxzpSzx, SyzpSzy, SxypSyx = Sxz + Szx, Syz + Szy, Sxy + Syx
+  SyzmSzy, SxzmSzx, SxymSyx = Syz - Szy, Sxz - Szx, Sxy - Syx
+  SxxpSyy, SxxmSyy = Sxx + Syy, Sxx - Syy
+  Sxy2Sxz2Syx2Szx2 = Sxy2 + Sxz2 - Syx2 - Szx2
+  Sxx2Syy2Szz2Syz2Szy2 = Syy2 + Szz2 - Sxx2 + Syz2 + Szy2
+  SyzSzymSyySzz2 = 2. * (Syz*Szy - Syy*Szz)
+  C0 = Sxy2Sxz2Syx2Szx2 * Sxy2Sxz2Syx2Szx2 \
+     + (Sxx2Syy2Szz2Syz2Szy2 + SyzSzymSyySzz2) * (Sxx2Syy2Szz2Syz2Szy2 - SyzSzymSyySzz2) \
+     + (-SxzpSzx*SyzmSzy + SxymSyx*(SxxmSyy - Szz)) * (-SxzmSzx*SyzpSzy + SxymSyx*(SxxmSyy + Szz)) \
+     + (-SxzpSzx*SyzpSzy - SxypSyx*(SxxpSyy - Szz)) * (-SxzmSzx*SyzmSzy - SxypSyx*(SxxpSyy + Szz)) \
+     + ( SxypSyx*SyzpSzy + SxzpSzx*(SxxmSyy + Szz)) * (-SxymSyx*SyzmSzy + SxzpSzx*(SxxpSyy + Szz)) \
+     + ( SxypSyx*SyzmSzy + SxzmSzx*(SxxmSyy - Szz)) * (-SxymSyx*SyzpSzy + SxzmSzx*(SxxpSyy - Szz))
+  # Newton from the upper bound G/2 converges onto the largest root;
+  #   only the pairs that haven't converged yet are carried along
+  shape = np.shape(G)
+  C2, C1, C0 = C2.ravel(), C1.ravel(), C0.ravel()
+  l = 0.5 * np.array(G, dtype=float).ravel()
+  active = np.arange(l.size)
+  for i in range(50):
+    la, c2 = l[active], C2[active]
+    l2 = la * la
+    P = l2 * l2 + c2 * l2 + C1[active] * la + C0[active]
+    dP = 4. * l2 * la + 2. * c2 * la + C1[active]
+    step = np.divide(P, dP, out=np.zeros_like(P), where=dP != 0)
+    la -= step
+    l[active] = la
+    active = active[np.abs(step) > 1e-11 * np.abs(la)]
+    if len(active) == 0:
+      break
+  return l.reshape(shape)
+
+
+def superposed_msd(Y, X):
+  # Summed squared deviation after optimal rotation for centered pairs
+  #   (k, n, 3), from the rotated coordinates themselves; used to polish
+  #   the near-identical pairs where G - 2 lambda cancels to rounding noise
+  U, S, Vt = np.linalg.svd(np.einsum('kni,knj->kij', Y, X))
+  d = np.sign(np.linalg.det(np.matmul(U, Vt)))
+  U[:, :, 2] *= np.where(d == 0, 1., d)[:, np.newaxis]
+  diff = np.matmul(Y, np.matmul(U, Vt)) - X
+  return np.einsum('kni,kni->k', diff, diff)
+
+
+def qcp_msd(M, G, pairs):
+  # summed squared deviation after superposition from QCP, with the
+  #   near-identical pairs recomputed exactly; pairs(index) gives the
+  #   centered (mobile, target) coordinates at an index into M and G
+  msd = np.maximum(G - 2. * qcp_eigenvalue(M, G), 0.)
+  close = np.nonzero(msd < 1e-8 * G)
+  if len(close[0]) > 0:
+    msd[close] = superposed_msd(*pairs(close))
+  return msd
+
+
+def qcp_rmsd(mobiles, targets, weights=None):
+  # RMSD after optimal superposition for pairs of structures, without
+  #   the rotation. mobiles and targets are (..., n, 3) and broadcast
+  #   against each other, e.g. (N, n, 3) against one (n, 3) target
+  Y = np.asarray(mobiles, dtype=float)
+  X = np.asarray(targets, dtype=float)
+  w = fit_weights(weights, X.shape[-2])
+  # weighted centering, then sqrt(w) scaling folds the weights into
+  #   plain inner products
+  X = (X - np.einsum('n,...ni->...i', w, X)[..., np.newaxis, :]) * np.sqrt(w)[:, np.newaxis]
+  Y = (Y - np.einsum('n,...ni->...i', w, Y)[..., np.newaxis, :]) * np.sqrt(w)[:, np.newaxis]
+  X, Y = np.broadcast_arrays(X, Y)
+  # a single pair goes through as a batch of one
+  single = (X.ndim == 2)
+  if single:
+    X, Y = X[np.newaxis], Y[np.newaxis]
+  M = np.einsum('...ni,...nj->...ij', Y, X)
+  G = np.einsum('...ni,...ni->...', X, X) + np.einsum('...ni,...ni->...', Y, Y)
+  rmsd = np.sqrt(qcp_msd(M, G, lambda close: (Y[close], X[close])))
+  return rmsd[0] if single else rmsd
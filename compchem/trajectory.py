@@ -0,0 +1,153 @@
+import numpy as np
+from compchem import *
+
+
+# per-atom arrays that must match for frames to share a topology
+TOPOLOGY_FIELDS = ['indices', 'names', 'types', 'chains', 'resnames', 'resids']
+# per-atom arrays stored once along with the topology, taken from the
+#   first frame (they don't change between docking poses)
+ATOM_FIELDS = TOPOLOGY_FIELDS + ['occupancies', 'temp_factors', 'charges', 'radii']
+# connectivity, also shared by every frame
+BOND_FIELDS = ['bonds', 'adjacency']
+# arrays only some frame classes have (PDBQT AutoDock types, MOL2 SYBYL
+#   types and bond orders), shared by every frame when the topology has them
+EXTRA_FIELDS = ['autodock_types', 'sybyl_types', 'bond_orders']
+
+
+def same_topology(frame1, frame2):
+  # True if both frames have the same atoms in the same order
+  if len(frame1.names) != len(frame2.names): return False
+  for field in TOPOLOGY_FIELDS:
+    if not np.array_equal(getattr(frame1, field), getattr(frame2, field)):
+      return False
+  return True
+
+
+# Many frames of one molecular system: per-atom metadata is stored once,
+#   coordinates of every frame live in one (n_frames, n_atoms, 3) array
+class Trajectory:
+  def __init__(self, frames=None, topology=None, coordinates=None):
+    # build either from a list of frames sharing a topology, or from a
+    #   topology frame plus a stacked coordinate array
+    if frames is not None:
+      frames = list(frames)
+      assert (len(frames) > 0), "Trajectory needs at least one frame!"
+      topology = frames[0]
+      for i,frame in enumerate(frames):
+        assert (same_topology(topology, frame)), "Frame %d does not share the topology of frame 0!" % i
+      coordinates = np.array([frame.coordinates for frame in frames])
+    # a slice of a trajectory makes frames of the same class it does
+    if isinstance(topology, Trajectory):
+      self.frame_class = topology.frame_class
+    else:
+      self.frame_class = topology.__class__
+    self.extra_fields = [field for field in EXTRA_FIELDS if getattr(topology, field, None) is not None]
+    for field in ATOM_FIELDS + BOND_FIELDS + self.extra_fields:
+      setattr(self, field, getattr(topology, field))
+    self.coordinates = np.ascontiguousarray(coordinates)
+
+  def compact(self, dtype=np.float32, categorical=True):
+    # same storage policy as MolecularFrame.compact, for all frames
+    if dtype is not None:
+      self.coordinates = self.coordinates.astype(dtype, copy=False)
+    if categorical:
+      for field in CATEGORICAL_FIELDS:
+        setattr(self, field, Categorical(getattr(self, field)))
+    return self
+
+  def __repr__(self):
+    return '* Trajectory (%d frames, %d atoms)' % (len(self), self.n_atoms)
+
+  def __len__(self):
+    return self.coordinates.shape[0]
+
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      return Trajectory(topology=self, coordinates=self.coordinates[key])
+    return self.frame(key)
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self.frame(i)
+
+  @property
+  def n_atoms(self):
+    return self.coordinates.shape[1]
+
+  def frame(self, i):
+    # a frame whose arrays are views into the trajectory, so in-place
+    #   changes (e.g. translate) are seen by the trajectory too, once the
+    #   frame has applied them (see MolecularFrame.apply)
+    frame = self.frame_class()
+    for field in ATOM_FIELDS + BOND_FIELDS + self.extra_fields:
+      setattr(frame, field, getattr(self, field))
+    frame.coordinates = self.coordinates[i]
+    return frame
+
+  def perceive_bonds(self, i=0, tolerance=0.45):
+    # Bonds for the whole trajectory, perceived once from frame i (poses
+    #   of one molecule share their connectivity)
+    frame = self.frame(i)
+    frame.perceive_bonds(tolerance)
+    self.bonds, self.adjacency = frame.bonds, frame.adjacency
+    return self.bonds
+
+  def hierarchy(self):
+    return hierarchy(self.frame(0))
+
+  def residue_centers(self):
+    # (n_frames, n_residues, 3) residue centers of every frame at once
+    return self.hierarchy().centers(self.coordinates)
+
+  def select(self, selection):
+    # Selection mask (see MolecularFrame.select): (n_atoms,) if it only
+    #   depends on the topology, worked out once for the whole trajectory,
+    #   or (n_frames, n_atoms) if it depends on coordinates (within, x/y/z)
+    if not isinstance(selection, Selection):
+      selection = compile_selection(selection)
+    if selection.static:
+      return selection(self.frame(0))
+    return np.array([selection(frame) for frame in self])
+
+  ## whole-trajectory versions of the MolecularFrame measurements,
+  #   with one row per frame
+  def measure_center(self):
+    return self.coordinates.mean(axis=1)
+
+  def measure_dimensions(self):
+    return self.coordinates.max(axis=1) - self.coordinates.min(axis=1)
+
+  def translate(self, dx, dy, dz):
+    self.coordinates += np.array((dx, dy, dz))
+
+  def center(self):
+    # center every frame on the origin
+    self.coordinates -= self.measure_center()[:, np.newaxis, :]
+
+  def transform(self, M):
+    # one 4x4 affine transform (see compchem.transform) for every frame,
+    #   or one per frame (n_frames, 4, 4), applied in place in one pass
+    apply_transform(self.coordinates, M)
+
+  def rmsd(self, other_frame):
+    # RMSD of every frame to one reference frame (no superposition)
+    diff = self.coordinates - other_frame.coordinates
+    return np.sqrt(np.mean(np.sum(np.square(diff), axis=2), axis=1))
+
+  def align(self, other_frame, mask=None, target_mask=None, weights=None):
+    # Superimpose every frame onto other_frame at once (batched Kabsch),
+    #   see MolecularFrame.align. Returns per-frame rotations,
+    #   translations and RMSDs
+    if target_mask is None: target_mask = mask
+    X = np.asarray(other_frame.coordinates)
+    Y = self.coordinates
+    if target_mask is not None: X = X[target_mask]
+    if mask is not None: Y = Y[:, mask]
+    R, t, rms = kabsch_batch(Y, X, weights)
+    M = np.zeros((len(R), 4, 4))
+    M[:, :3, :3] = R
+    M[:, 3, :3] = t
+    M[:, 3, 3] = 1.
+    # in place, so the coordinates keep their dtype (e.g. float32)
+    apply_transform(self.coordinates, M)
+    return R, t, rms
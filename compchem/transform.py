@@ -0,0 +1,70 @@
+import math
+import numpy as np
+
+
+## Rigid-body (affine) transforms as 4x4 matrices, following the row vector
+#   convention of MolecularFrame.rotate_matrix:
+#     [x y z 1] . M  =  [x' y' z' 1],   M = [[R, 0], [t, 1]]
+#   so "A then B" is the product A.dot(B)
+
+def identity():
+  return np.identity(4)
+
+
+def translation(d):
+  M = np.identity(4)
+  M[3,:3] = d
+  return M
+
+
+def rotation(R, about=None):
+  # 3x3 rotation (row vectors: x' = x.dot(R)), optionally about a point
+  M = np.identity(4)
+  M[:3,:3] = R
+  if about is not None:
+    about = np.asarray(about, dtype=float)
+    M[3,:3] = about - about.dot(R)
+  return M
+
+
+def euler_rotation(d0x, d0y, d0z):
+  # the 3x3 rotation of MolecularFrame.rotate: about x, then y, then z
+  #   (angles in radians)
+  cos0, sin0 = math.cos(d0x), math.sin(d0x)
+  Rx = np.array([[1.,0.,0.],[0., cos0, -sin0],[0., sin0, cos0]])
+  cos0, sin0 = math.cos(d0y), math.sin(d0y)
+  Ry = np.array([[cos0, 0., sin0],[0.,1.,0.],[-sin0, 0., cos0]])
+  cos0, sin0 = math.cos(d0z), math.sin(d0z)
+  Rz = np.array([[cos0, -sin0, 0.],[sin0, cos0, 0.],[0.,0.,1.]])
+  return Rx.dot(Ry).dot(Rz)
+
+
+def transform_point(M, point):
+  return np.asarray(point, dtype=float).dot(M[:3,:3]) + M[3,:3]
+
+
+def apply_transform(coordinates, M, chunk=65536):
+  # Transform coordinates in place, (n, 3) or (n_frames, n, 3), by one 4x4
+  #   matrix or one per frame (n_frames, 4, 4). Rows are done in chunks,
+  #   so the whole array is never copied
+  M = np.asarray(M, dtype=float)
+  R = M[..., :3, :3].astype(coordinates.dtype)
+  t = M[..., 3, :3].astype(coordinates.dtype)
+  if coordinates.ndim == 3 and (M.ndim == 3 or not coordinates.flags['C_CONTIGUOUS']):
+    # every frame at once, each by its own matrix (or the one), in chunks
+    #   of atoms across all frames
+    assert (M.ndim == 2 or len(M) == len(coordinates)), "%d matrices for %d frames!" % (len(M), len(coordinates))
+    if M.ndim == 3: t = t[:, np.newaxis, :]
+    step = max(1, chunk // max(1, len(coordinates)))
+    for start in range(0, coordinates.shape[1], step):
+      block = coordinates[:, start:start+step]
+      block[...] = np.matmul(block, R)
+      block += t
+    return coordinates
+  assert (M.ndim == 2), "One matrix per frame needs (n_frames, n, 3) coordinates!"
+  rows = coordinates.reshape(-1, 3)
+  for start in range(0, len(rows), chunk):
+    block = rows[start:start+chunk]
+    block[...] = block.dot(R)
+    block += t
+  return coordinates
@@ -1,9 +1,10 @@
-
 import sys
 from compchem.view.trackball import *
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
+from compchem.transform import *
+from compchem.view.render import *
 
 
 class Mouse:
@@ -18,10 +19,18 @@ class View:
   trackball = Trackball()
   quat = np.array([0., 0., 0., 1.])
 
-  def __init__(self, pdbframe, width=800, height=600):
+  def __init__(self, pdbframe, width=800, height=600, retained=True):
     self.frame = pdbframe
     self.origin = pdbframe.measure_center()
     self.Rm = self.trackball.calculate_rotation(0, 0, 0, 0)
+    # retained mode keeps the atoms in GL buffers (see render.Renderer) and
+    #   turns them with the modelview matrix, leaving the frame unmoved;
+    #   otherwise every atom is drawn as a GLUT sphere on every redraw
+    self.retained = retained
+    # per-atom colors, worked out once from the types
+    self.colors = atom_colors(pdbframe.types)
+    self.width = width
+    self.height = height
 
     glutInit(sys.argv)
     glutInitDisplayMode(GLUT_DOUBLE | GLUT_RGB | GLUT_DEPTH)
@@ -31,6 +40,7 @@ class View:
     glutMouseFunc(self.mouse_buttons)
     glutMotionFunc(self.mouse_motions)
     glutPassiveMotionFunc(None)
+    glutReshapeFunc(self.reshape)
 
     glClearColor(0.,0.,0.,1.)
     glShadeModel(GL_SMOOTH)
@@ -45,6 +55,12 @@ class View:
     glLightf(GL_LIGHT0, GL_LINEAR_ATTENUATION, 0.05)
     glEnable(GL_LIGHT0)
 
+    if self.retained:
+      self.renderer = Renderer(self.frame)
+      self.camera, self.far = fit_camera(self.frame.coordinates)
+      # trackball rotations so far, about the frame's center
+      self.rotation = identity()
+
     glMatrixMode(GL_PROJECTION)
     gluPerspective(40.,1., 1.,1000.)
     glMatrixMode(GL_MODELVIEW)
@@ -69,25 +85,41 @@ class View:
     # trackball rotation
     if self.mouse.buttons[0] == 0:
       self.Rm = self.trackball.calculate_rotation(self.mouse.x, self.mouse.y, x, y)
-      self.frame.rotate_matrix(self.Rm)
+      if self.retained:
+        self.rotation = self.rotation.dot(rotation(self.Rm, about=self.origin))
+      else:
+        self.frame.rotate_matrix(self.Rm)
       glutPostRedisplay();
 
     self.mouse.x = x
     self.mouse.y = y
 
+  def reshape(self, width, height):
+    self.width = width
+    self.height = max(height, 1)
+    glViewport(0, 0, self.width, self.height)
+
+  def update(self):
+    # re-send the frame's coordinates after they change (e.g. stepping
+    #   through a trajectory), then redraw
+    if self.retained:
+      self.renderer.update()
+    glutPostRedisplay()
+
   def draw(self):
     glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
+    if self.retained:
+      projection = perspective(40., self.width / self.height, 0.5, self.far)
+      self.renderer.draw(self.rotation.dot(self.camera), projection, self.height)
+      glutSwapBuffers()
+      return
     glPushMatrix()
     glScalef(0.1, 0.1, 0.1)
 
     #glTranslatef(-self.origin[0], -self.origin[1], -self.origin[2])
 
-    for i in range(len(self.frame.names)):
-      if self.frame.types[i] == 'O': color = [1.,0.,0.,1.]
-      if self.frame.types[i] == 'C': color = [0.,1.,1.,1.]
-      if self.frame.types[i] == 'H': color = [1.,1.,1.,1.]
-      if self.frame.types[i] == 'N': color = [0.,0.,1.,1.]
-      glMaterialfv(GL_FRONT, GL_DIFFUSE, color)
+    for i in range(len(self.frame)):
+      glMaterialfv(GL_FRONT, GL_DIFFUSE, self.colors[i])
       glPushMatrix()
       crd = self.frame.coordinates[i,:]
       glTranslatef(crd[0], crd[1], crd[2])
@@ -0,0 +1,194 @@
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from compchem.transform import *
+from compchem.categorical import Categorical
+
+
+## Retained-mode drawing of a frame's atoms: per-atom positions, colors and
+#   radii live in vertex buffers on the GL side, uploaded once, and every
+#   redraw is a single glDrawArrays of point sprites. The fragment shader
+#   turns each sprite into a lit sphere (a ray-cast impostor, with its own
+#   depth), so no sphere geometry is ever built. Only GLSL 1.20 is needed,
+#   which software GL (OSMesa/llvmpipe) provides
+
+# element colors (RGB), by upper-case type; others get DEFAULT_COLOR
+ELEMENT_COLORS = {
+  'C':  (0., 1., 1.),   'O':  (1., 0., 0.),   'H':  (1., 1., 1.),
+  'N':  (0., 0., 1.),   'S':  (1., 1., 0.),   'P':  (1., .5, 0.),
+  'F':  (.5, 1., .3),   'CL': (.1, .9, .1),   'BR': (.6, .1, .1),
+  'I':  (.6, 0., .7),   'FE': (.9, .4, 0.),   'ZN': (.5, .5, .7),
+  'MG': (0., .6, 0.),   'CA': (.25, .5, .25), 'NA': (.6, .4, .9),
+  'K':  (.55, .25, .85),
+}
+DEFAULT_COLOR = (1., .4, .7)
+
+
+def atom_colors(types, alpha=1.):
+  # (n_atoms, 4) float32 RGBA, looked up once per distinct type and then
+  #   spread over the atoms (integer-coded types need no decoding)
+  if isinstance(types, Categorical):
+    categories, codes = types.categories, types.codes
+  else:
+    categories, codes = np.unique(np.asarray(types).astype(str), return_inverse=True)
+  table = np.array([ELEMENT_COLORS.get(str(t).upper(), DEFAULT_COLOR) + (alpha,) for t in categories],
+                   dtype=np.float32).reshape(-1, 4)
+  return table[np.asarray(codes).ravel()]
+
+
+def perspective(fovy, aspect, near, far):
+  # projection matrix in the row vector convention of compchem.transform
+  #   (the transpose of gluPerspective's), fovy in degrees
+  f = 1. / np.tan(np.radians(fovy) / 2.)
+  P = np.zeros((4,4))
+  P[0,0] = f / aspect
+  P[1,1] = f
+  P[2,2] = (far + near) / (near - far)
+  P[2,3] = -1.
+  P[3,2] = 2. * far * near / (near - far)
+  return P
+
+
+def fit_camera(coordinates, fovy=40., margin=1.1):
+  # model matrix putting the center of the coordinates in front of the
+  #   camera (looking down -z), far enough back for all of it to show,
+  #   and the distance to the far side of it (for the far clip plane)
+  crd = np.asarray(coordinates, dtype=float)
+  if len(crd) == 0:
+    return translation((0., 0., -10.)), 10.
+  center = crd.mean(axis=0)
+  extent = max(np.sqrt(((crd - center)**2).sum(axis=1).max()), 1.) * margin
+  # far enough for a sphere of radius extent to just fit the view
+  distance = extent / np.sin(np.radians(fovy) / 2.)
+  return translation(-center).dot(translation((0., 0., -distance))), distance + 2. * extent
+
+
+VERTEX_SHADER = """
+#version 120
+attribute vec3 position;
+attribute vec4 color;
+attribute float radius;
+uniform mat4 modelview;
+uniform mat4 projection;
+uniform float viewport_height;
+varying vec4 v_color;
+varying vec3 v_center;
+varying float v_radius;
+void main() {
+  vec4 eye = modelview * vec4(position, 1.0);
+  v_color = color;
+  v_center = eye.xyz;
+  v_radius = radius;
+  gl_Position = projection * eye;
+  // sphere diameter in pixels
+  gl_PointSize = viewport_height * projection[1][1] * radius / gl_Position.w;
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 120
+uniform mat4 projection;
+uniform vec3 light;
+varying vec4 v_color;
+varying vec3 v_center;
+varying float v_radius;
+void main() {
+  vec2 p = gl_PointCoord * 2.0 - 1.0;
+  p.y = -p.y;
+  float r2 = dot(p, p);
+  if (r2 > 1.0) discard;
+  vec3 normal = vec3(p, sqrt(1.0 - r2));
+  // depth of the sphere's surface, so spheres cut into each other properly
+  vec4 clip = projection * vec4(v_center + normal * v_radius, 1.0);
+  gl_FragDepth = 0.5 * clip.z / clip.w + 0.5;
+  float diffuse = max(dot(normal, light), 0.0);
+  float specular = pow(max(reflect(-light, normal).z, 0.0), 32.0);
+  gl_FragColor = vec4(v_color.rgb * (0.25 + 0.75 * diffuse) + 0.3 * specular, v_color.a);
+}
+"""
+
+
+def compile_program(vertex, fragment):
+  program = glCreateProgram()
+  for source, kind in ((vertex, GL_VERTEX_SHADER), (fragment, GL_FRAGMENT_SHADER)):
+    shader = glCreateShader(kind)
+    glShaderSource(shader, source)
+    glCompileShader(shader)
+    assert (glGetShaderiv(shader, GL_COMPILE_STATUS)), "Shader did not compile: %s" % glGetShaderInfoLog(shader)
+    glAttachShader(program, shader)
+    glDeleteShader(shader)
+  glLinkProgram(program)
+  assert (glGetProgramiv(program, GL_LINK_STATUS)), "Shaders did not link: %s" % glGetProgramInfoLog(program)
+  return program
+
+
+# GL-side copy of a frame's atoms. Needs a current GL context (a GLUT
+#   window, or an OffscreenContext) for everything but its construction
+#   arguments. Coordinates that change (trajectory playback) are re-sent
+#   with update(); colors and radii stay put while the topology does
+class Renderer:
+  def __init__(self, frame, radius=0.8, light=(0.4, 0.4, 0.8)):
+    self.program = compile_program(VERTEX_SHADER, FRAGMENT_SHADER)
+    self.locations = dict((name, glGetAttribLocation(self.program, name)) for name in ('position', 'color', 'radius'))
+    self.uniforms = dict((name, glGetUniformLocation(self.program, name))
+                         for name in ('modelview', 'projection', 'viewport_height', 'light'))
+    self.light = np.asarray(light, dtype=np.float32) / np.linalg.norm(light)
+    self.buffers = dict(zip(('position', 'color', 'radius'), glGenBuffers(3)))
+    self.natoms = 0
+    self.radius = radius
+    self.set_frame(frame)
+
+  def upload(self, name, data, usage=GL_STATIC_DRAW):
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    glBindBuffer(GL_ARRAY_BUFFER, self.buffers[name])
+    glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, usage)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+  def set_frame(self, frame):
+    # new atoms: positions, plus colors and radii from the frame's types
+    self.frame = frame
+    self.natoms = len(frame)
+    self.upload('position', frame.coordinates, GL_DYNAMIC_DRAW)
+    self.upload('color', atom_colors(frame.types))
+    radii = np.asarray(frame.radii, dtype=np.float32)
+    if not radii.any():
+      radii = np.full(self.natoms, self.radius, dtype=np.float32)
+    self.upload('radius', radii)
+
+  def update(self, coordinates=None):
+    # new positions for the same atoms, written over the old ones
+    crd = np.ascontiguousarray(self.frame.coordinates if coordinates is None else coordinates, dtype=np.float32)
+    assert (len(crd) == self.natoms), "Renderer has %d atoms, not %d!" % (self.natoms, len(crd))
+    glBindBuffer(GL_ARRAY_BUFFER, self.buffers['position'])
+    glBufferSubData(GL_ARRAY_BUFFER, 0, crd.nbytes, crd)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+  def draw(self, modelview, projection, viewport_height):
+    # every atom in one call; matrices in the compchem.transform (row
+    #   vector) convention, which is just GL's column-major layout
+    glUseProgram(self.program)
+    glEnable(GL_VERTEX_PROGRAM_POINT_SIZE)
+    try:
+      glEnable(GL_POINT_SPRITE)
+    except GLError:
+      # core profiles have sprites always on
+      pass
+    glUniformMatrix4fv(self.uniforms['modelview'], 1, GL_FALSE, np.asarray(modelview, dtype=np.float32))
+    glUniformMatrix4fv(self.uniforms['projection'], 1, GL_FALSE, np.asarray(projection, dtype=np.float32))
+    glUniform1f(self.uniforms['viewport_height'], float(viewport_height))
+    glUniform3fv(self.uniforms['light'], 1, self.light)
+    for name, size in (('position', 3), ('color', 4), ('radius', 1)):
+      location = self.locations[name]
+      if location < 0: continue
+      glBindBuffer(GL_ARRAY_BUFFER, self.buffers[name])
+      glEnableVertexAttribArray(location)
+      glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, 0, ctypes.c_void_p(0))
+    glDrawArrays(GL_POINTS, 0, self.natoms)
+    for location in self.locations.values():
+      if location >= 0: glDisableVertexAttribArray(location)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+    glUseProgram(0)
+
+  def delete(self):
+    glDeleteBuffers(3, list(self.buffers.values()))
+    glDeleteProgram(self.program)
@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+
+import os.path
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+
+# Regression checks for compchem.atommap: a shuffled copy of a docked pose
+#   (ligand plus flexible side chains, several of them identical) maps
+#   back onto the original atom for atom, and one FrameMapping pairs the
+#   symmetric atoms of every pose the way map_frames does pose by pose
+
+here = os.path.dirname(os.path.abspath(__file__))
+filename = os.path.join(here, 'out-methyl-L-ph.pdbqt')
+target = load_pdbqt(filename)[0]
+mobile = load_pdbqt(filename)[0]
+order = np.random.default_rng(1).permutation(len(mobile))
+for field in ('indices', 'names', 'types', 'chains', 'resnames', 'resids',
+              'occupancies', 'temp_factors', 'charges', 'radii', 'coordinates'):
+  setattr(mobile, field, np.asarray(getattr(mobile, field))[order])
+
+t, m = map_frames(target, mobile)
+assert (len(t) == len(target) and np.array_equal(order[m], t))
+assert (qcp_rmsd(np.asarray(mobile.coordinates)[m], np.asarray(target.coordinates)[t]) < 1e-9)
+
+# heavy atoms only
+t, m = map_frames(target, mobile, target.select('not element H'), mobile.select('not element H'))
+assert (len(t) == np.count_nonzero(target.select('not element H')) and np.array_equal(order[m], t))
+
+# without coordinates the bonds still give a consistent (if not the
+#   geometric) mapping: same elements, and bonded atoms stay bonded
+mapping = map_atoms(guess_elements(target.types, target.resnames), target.bonds,
+                    guess_elements(mobile.types, mobile.resnames), mobile.bonds)
+assert ((mapping >= 0).all() and len(np.unique(mapping)) == len(mapping))
+assert (np.array_equal(np.asarray(target.types), np.asarray(mobile.types)[mapping]))
+bonded = set(map(tuple, np.sort(mobile.bonds, axis=1).tolist()))
+assert (all(tuple(sorted(pair)) in bonded for pair in mapping[target.bonds].tolist()))
+
+# a mapping made on one pose, reused for all of them
+poses = load_pdbqt(filename)
+mapping = FrameMapping(poses[0], mobile)
+for pose in poses:
+  t, m = mapping.pairs(pose.coordinates, mobile.coordinates)
+  t1, m1 = map_frames(pose, mobile)
+  assert (np.array_equal(t, t1) and np.array_equal(m, m1))
+
+print('atommap: OK')
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+import os, os.path
+import gzip
+import tempfile
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+from compchem.cif import *
+
+# Regression checks for compchem.cif: an mmCIF copy of 1mx5 (written here,
+#   with two models, quoted values, a row split over two lines and a
+#   second data block that must be ignored) reads back like the PDB file
+
+here = os.path.dirname(os.path.abspath(__file__))
+pdb = load_pdb(os.path.join(here, '1mx5.pdb'))
+frame = pdb[0]
+N = len(frame)
+names = np.asarray(frame.names).astype(object)
+# values that need quoting
+names[0] = "\"O5'\""
+names[1] = "'C A'"
+columns = ['group_PDB', 'id', 'type_symbol', 'label_atom_id', 'label_comp_id', 'label_asym_id',
+           'label_seq_id', 'Cartn_x', 'Cartn_y', 'Cartn_z', 'occupancy', 'B_iso_or_equiv',
+           'pdbx_formal_charge', 'auth_seq_id', 'auth_asym_id', 'pdbx_PDB_model_num']
+rows = []
+for model, shift in ((1, 0.), (2, 1.5)):
+  crd = np.asarray(frame.coordinates) + shift
+  for i in range(N):
+    rows.append('ATOM %d %s %s %s %s %s %.3f %.3f %.3f %.2f %.2f ? %d %s %d' %
+                (frame.indices[i], frame.types[i] or '?', names[i], frame.resnames[i], frame.chains[i],
+                 frame.resids[i], crd[i,0], crd[i,1], crd[i,2], frame.occupancies[i], frame.temp_factors[i],
+                 frame.resids[i], frame.chains[i], model))
+# a row may run over two lines
+rows[5] = rows[5].replace(' ? ', '\n? ')
+text = ('data_1MX5\n#\n_struct.title "%s"\n#\nloop_\n' % pdb.title.replace('\n', ' ').strip()
+        + ''.join('_atom_site.%s\n' % c for c in columns) + '\n'.join(rows) + '\n#\n'
+        + 'data_OTHER\nloop_\n_atom_site.id\n_atom_site.Cartn_x\n_atom_site.Cartn_y\n_atom_site.Cartn_z\n1 0 0 0\n')
+
+handle, filename = tempfile.mkstemp(suffix='.cif')
+with os.fdopen(handle, 'w') as f:
+  f.write(text)
+try:
+  with open(filename, 'rb') as f, gzip.open(filename + '.gz', 'wb') as g:
+    g.write(f.read())
+  for name in (filename, filename + '.gz'):
+    cif = load_cif(name)
+    assert (len(cif) == 2 and len(cif[0]) == N and len(cif[1]) == N)
+    assert (cif.title == ' '.join(pdb.title.split()))
+    a = cif[0]
+    assert (a.names[0] == "O5'" and a.names[1] == 'C A')
+    assert (np.array_equal(a.names[2:], frame.names[2:]))
+    for field in ('indices', 'types', 'resnames', 'chains', 'resids', 'occupancies', 'temp_factors'):
+      assert (np.array_equal(np.asarray(getattr(a, field)), np.asarray(getattr(frame, field)))), field
+    assert (not np.asarray(a.charges).any())
+    assert (np.allclose(a.coordinates, frame.coordinates))
+    assert (np.allclose(cif[1].coordinates, np.asarray(frame.coordinates) + 1.5))
+    assert (np.allclose(cif.trajectory().coordinates[1], cif[1].coordinates))
+
+  # column projection: only the coordinates (and model numbers) are read
+  projected = load_cif(filename, fields=[], dtype=np.float32)
+  assert (projected[0].coordinates.dtype == np.float32 and not np.asarray(projected[0].names).any())
+  assert (np.allclose(projected[1].coordinates, cif[1].coordinates, atol=1e-3))
+finally:
+  os.remove(filename)
+  if os.path.exists(filename + '.gz'): os.remove(filename + '.gz')
+
+print('cif: OK')
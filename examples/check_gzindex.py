@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+import io
+import os, os.path
+import gzip
+import tempfile
+import numpy as np
+from compchem import *
+from compchem.gzindex import *
+from compchem.pdb import *
+
+# Regression checks for compchem.gzindex: seeks and reads anywhere in a
+#   gzip file (one member or several) give the same bytes as the
+#   uncompressed data, going forwards or backwards
+
+rng = np.random.default_rng(3)
+lines = ['ATOM  %5d  CA  ALA A%4d    %8.3f%8.3f%8.3f  1.00 %5.2f           C\n' % ((i % 99999) + 1, i % 9999, x, y, z, b)
+         for i, (x, y, z, b) in enumerate(rng.uniform(-99, 99, (100000, 4)))]
+data = ''.join(lines).encode()
+
+handle, filename = tempfile.mkstemp(suffix='.gz')
+os.close(handle)
+try:
+  for members in (1, 3):
+    # several members, as from concatenated gzip files
+    with open(filename, 'wb') as f:
+      for part in np.array_split(np.arange(len(data)), members):
+        f.write(gzip.compress(data[part[0]:part[-1]+1]))
+    index = GzipIndex(span=1 << 16)
+    with open_file(filename, index) as f:
+      assert (f.read() == data)
+    # (points are at least the 1 MB read chunk apart)
+    assert (len(index) >= len(data) // (1 << 20)), "%d access points" % len(index)
+    with open_file(filename, index) as f:
+      for offset in rng.integers(0, len(data), 200).tolist() + [0, len(data) - 1, len(data)]:
+        f.seek(offset)
+        assert (f.tell() == offset)
+        size = int(rng.integers(1, 5000))
+        assert (f.read(size) == data[offset:offset+size]), (members, offset, size)
+      f.seek(-10, io.SEEK_END)
+      assert (f.read() == data[-10:])
+    # an index that's filled in while seeking, not by a full read first
+    index = GzipIndex(span=1 << 16)
+    with open_file(filename, index) as f:
+      for offset in sorted(rng.integers(0, len(data), 50).tolist(), reverse=True):
+        f.seek(offset)
+        assert (f.read(100) == data[offset:offset+100])
+
+  # lazy parses of a .gz index the file while scanning it
+  with open(filename, 'wb') as f:
+    f.write(gzip.compress(data))
+  lazy = load_pdb(filename, lazy=True)
+  assert (lazy.gzip_index is not None and len(lazy[0]) == len(lines))
+finally:
+  os.remove(filename)
+
+print('gzindex: OK')
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+import os.path
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+
+# Regression checks for compchem.hierarchy and compchem.categorical:
+#   residues and chains, their centers and closest approaches agree with
+#   plain Python grouping, on unicode and on integer-coded fields
+
+here = os.path.dirname(os.path.abspath(__file__))
+frame = load_pdb(os.path.join(here, '1mx5.pdb'))[0]
+compact = load_pdb(os.path.join(here, '1mx5.pdb'), categorical=True)[0]
+crd = np.asarray(frame.coordinates)
+
+# residues by hand: runs of the same (chain, resid, resname)
+keys = list(zip(frame.chains, frame.resids, frame.resnames))
+starts = [i for i in range(len(keys)) if i == 0 or keys[i] != keys[i-1]] + [len(keys)]
+chain_starts = [i for i in range(len(keys)) if i == 0 or keys[i][0] != keys[i-1][0]] + [len(keys)]
+
+for f in (frame, compact):
+  h = hierarchy(f)
+  assert (h is hierarchy(f)), "hierarchy not cached per topology"
+  assert (h.n_residues == len(starts) - 1 and h.n_chains == len(chain_starts) - 1)
+  assert (np.array_equal(h.residue_starts, starts) and np.array_equal(h.chain_starts, chain_starts))
+  centers = np.array([crd[a:b].mean(axis=0) for a, b in zip(starts[:-1], starts[1:])])
+  assert (np.allclose(h.centers(crd), centers))
+  assert (np.allclose(f.residue_centers(), centers))
+  assert (np.array_equal(h.expand(np.arange(h.n_residues)), np.repeat(np.arange(h.n_residues), np.diff(starts))))
+
+# closest approach of every residue to a ligand, with and without a cutoff
+h = hierarchy(frame)
+ligand = crd[np.asarray(frame.resnames) == 'HTQ']
+d = np.sqrt(((crd[:, np.newaxis, :] - ligand[np.newaxis, :, :])**2).sum(axis=2)).min(axis=1)
+closest = np.minimum.reduceat(d, starts[:-1])
+assert (np.allclose(h.min_distances(crd, ligand), closest))
+cut = h.min_distances(crd, ligand, cutoff=6.)
+assert (np.allclose(cut[closest < 6.], closest[closest < 6.]) and np.all(np.isinf(cut[closest >= 6.])))
+
+# integer-coded fields behave like the arrays they stand for
+for field in CATEGORICAL_FIELDS:
+  a, b = getattr(frame, field), getattr(compact, field)
+  assert (isinstance(b, Categorical) and np.array_equal(np.asarray(b), np.asarray(a))), field
+assert (np.array_equal(compact.resnames == 'HOH', np.asarray(frame.resnames) == 'HOH'))
+assert (np.array_equal(np.asarray(compact.names[10:20]), np.asarray(frame.names[10:20])))
+assert (compact.resnames.nbytes < np.asarray(frame.resnames).nbytes // 4)
+
+# a trajectory's residue centers, frame by frame
+t = load_pdbqt(os.path.join(here, 'out-methyl-L-ph.pdbqt')).trajectory()
+ht = t.hierarchy()
+assert (np.allclose(t.residue_centers()[3], ht.centers(t[3].coordinates)))
+
+print('hierarchy: OK')
@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+
+import os, os.path
+import tempfile
+import numpy as np
+from compchem import *
+from compchem.mol2 import *
+
+# Regression checks for compchem.mol2: eager, lazy and streamed parses of
+#   a small library agree, streamed frames own their arrays, and molecules
+#   cut between read chunks are put back together
+
+MOLECULE = '''@<TRIPOS>MOLECULE
+mol%d
+ 3 2 0 0 0
+SMALL
+GASTEIGER
+
+@<TRIPOS>ATOM
+      1 O1          %.4f    0.0000    0.0000 O.3     1  HOH1       -0.8000
+      2 H1          %.4f    0.9572    0.0000 H       1  HOH1        0.4000
+      3 H2          %.4f   -0.2400    0.9266 H       1  HOH1        0.4000
+@<TRIPOS>BOND
+     1     1     2    1
+     2     1     3    1
+'''
+
+handle, filename = tempfile.mkstemp(suffix='.mol2')
+with os.fdopen(handle, 'w') as f:
+  for i in range(50):
+    f.write(MOLECULE % (i, float(i), float(i), float(i)))
+
+try:
+  eager = load_mol2(filename)
+  lazy = load_mol2(filename, lazy=True)
+  assert (len(eager) == 50 and len(lazy) == 50)
+  # tiny chunks, so records get cut between reads
+  streamed = list(MOL2(filename, stream=True).iter_frames(chunk=100))
+  assert (len(streamed) == 50), "%d molecules streamed" % len(streamed)
+  for i in range(50):
+    for frame in (lazy[i], streamed[i]):
+      assert (frame.title == 'mol%d' % i)
+      assert (np.array_equal(frame.coordinates, eager[i].coordinates))
+      assert (np.array_equal(frame.types, ['O', 'H', 'H']))
+      assert (np.array_equal(frame.sybyl_types, eager[i].sybyl_types))
+      assert (np.array_equal(frame.bonds, [[0, 1], [0, 2]]))
+  # streamed frames don't hold on to their batch's arrays
+  streamed = list(iter_mol2(filename))
+  for frame in streamed:
+    for field in ('coordinates', 'names', 'types', 'sybyl_types', 'bonds', 'bond_orders'):
+      assert (getattr(frame, field).base is None), "streamed %s is a view" % field
+  assert (np.allclose(load_mol2(filename).trajectory().coordinates[:,0,0], np.arange(50)))
+finally:
+  os.remove(filename)
+
+print('mol2: OK')
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+
+import os.path
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+
+# Regression checks for compchem.neighbors and compchem.bonds: CellList
+#   pairs and queries agree with brute force, bond perception agrees with
+#   the distance rule applied to all pairs, and frames cache their index;
+#   elements guessed from atom names keep two-letter elements (Se of MSE)
+#   apart from organic names (C-alpha, H-gamma)
+
+rng = np.random.default_rng(5)
+points = np.concatenate((rng.uniform(-20, 20, (1500, 3)),
+                         # a far-off cluster, so most cells are empty
+                         rng.uniform(500, 510, (200, 3))))
+d = np.sqrt(((points[:, np.newaxis, :] - points[np.newaxis, :, :])**2).sum(axis=2))
+upper = np.triu(np.ones(d.shape, dtype=bool), 1)
+
+for cell_size in (2., 4., 7.5):
+  index = CellList(points, cell_size)
+  for cutoff in (1.5, 4., 9.):
+    pairs, dist = index.pairs(cutoff)
+    assert (np.all(pairs[:,0] < pairs[:,1]))
+    expected = set(zip(*np.nonzero(upper & (d < cutoff))))
+    assert (set(map(tuple, pairs.tolist())) == expected), (cell_size, cutoff)
+    assert (np.allclose(dist, d[pairs[:,0], pairs[:,1]]))
+  queries = rng.uniform(-25, 25, (50, 3))
+  dq = np.sqrt(((queries[:, np.newaxis, :] - points[np.newaxis, :, :])**2).sum(axis=2))
+  for found, row in zip(index.query_radius(queries, 3.), dq):
+    assert (set(found.tolist()) == set(np.flatnonzero(row < 3.).tolist()))
+  dist, nearest = index.query_knn(queries, 4)
+  assert (np.allclose(dist, np.sort(dq, axis=1)[:, :4]))
+  assert (np.allclose(dq[np.arange(len(queries))[:, np.newaxis], nearest], dist))
+
+# bonds of a real structure against the rule on every pair
+here = os.path.dirname(os.path.abspath(__file__))
+frame = load_pdbqt(os.path.join(here, 'out-methyl-L-ph.pdbqt'))[0]
+bonds = frame.perceive_bonds()
+crd = np.asarray(frame.coordinates)
+radii = covalent_radii(guess_elements(frame.types, frame.resnames))
+d = np.sqrt(((crd[:, np.newaxis, :] - crd[np.newaxis, :, :])**2).sum(axis=2))
+rule = np.triu((d < radii[:, np.newaxis] + radii[np.newaxis, :] + 0.45) & (d > MIN_BOND_LENGTH), 1)
+assert (set(map(tuple, bonds.tolist())) == set(zip(*np.nonzero(rule))))
+# every hydrogen has exactly one bond
+hydrogens = np.flatnonzero(guess_elements(frame.types, frame.resnames) == 'H')
+assert (all(len(frame.bonded(h)) == 1 for h in hydrogens))
+assert (frame.neighbor_index() is frame.neighbor_index())
+assert (set(frame.within(crd[0], 3.).tolist()) == set(np.flatnonzero(d[0] < 3.).tolist()))
+
+# elements from atom names, as PQR files and element-less PDBs give them
+names = ['SE', 'SD', 'SG', 'CA', 'CA', 'CD1', 'HG', 'HG', 'NE', 'ZN']
+resnames = ['MSE', 'MET', 'CYS', 'ALA', 'CA', 'ILE', 'SER', 'HG', 'ARG', 'ZN']
+assert (list(guess_elements(names, resnames)) == ['SE', 'S', 'S', 'C', 'CA', 'C', 'H', 'HG', 'N', 'ZN'])
+records = [b'HETATM    1  CG  MSE A   1       0.000   0.000   0.000  1.00  0.00',
+           b'HETATM    2 SE   MSE A   1       1.950   0.000   0.000  1.00  0.00',
+           b'HETATM    3  CE  MSE A   1       2.600   1.840   0.000  1.00  0.00']
+mse = next(PDB(os.path.join(here, '1mx5.pdb'), stream=True).parse_frames(records))
+assert (list(guess_elements(mse.types, mse.resnames)) == ['C', 'SE', 'C'])
+assert (np.allclose(covalent_radii(guess_elements(mse.types, mse.resnames)), [0.76, 1.20, 0.76]))
+assert (mse.perceive_bonds().tolist() == [[0, 1], [1, 2]])
+
+print('neighbors: OK')
@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+
+import os, os.path
+import tempfile
+import numpy as np
+# first, so PyOpenGL is set up for offscreen contexts
+from compchem.offscreen import *
+from compchem import *
+from compchem.pdb import *
+
+# Regression checks for headless rendering (needs PyOpenGL and Mesa): the
+#   structure fills the middle of the image, colors follow the elements,
+#   and a turned structure gives a different picture
+
+here = os.path.dirname(os.path.abspath(__file__))
+frame = load_pdb(os.path.join(here, '1mx5.pdb'))[0]
+image = render_image(frame, 200, 150)
+assert (image.shape == (150, 200, 3) and image.dtype == np.uint8)
+drawn = image.any(axis=2)
+assert (drawn.mean() > 0.05), "only %.1f%% of the image drawn" % (100. * drawn.mean())
+# the view is fitted: nothing touches the edges
+assert (not drawn[0].any() and not drawn[-1].any() and not drawn[:,0].any() and not drawn[:,-1].any())
+# mostly carbon (cyan) and oxygen (red) in a protein
+pixels = image[drawn].astype(int)
+assert (np.mean(pixels[:,1] + pixels[:,2] > 2 * pixels[:,0]) > 0.3)
+assert (np.mean(pixels[:,0] > pixels[:,1] + pixels[:,2]) > 0.05)
+
+turned = render_image(frame, 200, 150, R=euler_rotation(0., np.pi / 2., 0.))
+assert (not np.array_equal(turned, image))
+# a half turn about the view axis mirrors the silhouette
+flipped = render_image(frame, 200, 150, R=euler_rotation(0., 0., np.pi)).any(axis=2)
+assert (np.mean(flipped[::-1, ::-1] == drawn) > 0.97)
+
+handle, filename = tempfile.mkstemp(suffix='.ppm')
+os.close(handle)
+try:
+  write_ppm(image, filename)
+  with open(filename, 'rb') as f:
+    assert (f.read(15) == b'P6\n200 150\n255\n')
+    assert (np.array_equal(np.frombuffer(f.read(), dtype=np.uint8).reshape(150, 200, 3), image))
+finally:
+  os.remove(filename)
+
+print('offscreen: OK')
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+
+import os, os.path
+import shutil
+import tempfile
+import gzip, bz2, lzma
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+
+# Regression checks for the PDB-style readers: eager, lazy (offset index)
+#   and streamed parses agree, also on compressed files; the disk cache
+#   is used when it matches and rebuilt when the source changes; header
+#   scans and column projection agree with full parses
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+def same_frames(frames1, frames2):
+  frames1, frames2 = list(frames1), list(frames2)
+  assert (len(frames1) == len(frames2)), "%d != %d frames" % (len(frames1), len(frames2))
+  for a, b in zip(frames1, frames2):
+    for field, dtype, fill in FRAME_FIELDS:
+      assert (np.array_equal(np.asarray(getattr(a, field)), np.asarray(getattr(b, field)))), field
+    assert (np.array_equal(a.coordinates, b.coordinates))
+
+tmp = tempfile.mkdtemp()
+try:
+  # a multi-model PDB closed by an END (as wwPDB files are), plain and
+  #   compressed
+  pdbqt = load_pdbqt(os.path.join(here, 'out-methyl-L-ph.pdbqt'))
+  filename = os.path.join(tmp, 'poses.pdb')
+  write_pdb(pdbqt, filename)
+  with open(filename, 'a') as f:
+    f.write('END\n')
+  with open(filename, 'rb') as f:
+    data = f.read()
+  for suffix, module in (('.gz', gzip), ('.bz2', bz2), ('.xz', lzma)):
+    with module.open(filename + suffix, 'wb') as f:
+      f.write(data)
+
+  eager = load_pdb(filename)
+  assert (len(eager) == len(pdbqt))
+  # (PDB files hold formal charges, not the PDBQT's partial charges)
+  for a, b in zip(eager, pdbqt):
+    assert (np.array_equal(a.coordinates, b.coordinates) and np.array_equal(a.names, b.names))
+  for name in (filename, filename + '.gz', filename + '.bz2', filename + '.xz'):
+    same_frames(load_pdb(name), eager)
+    same_frames(iter_frames(name), eager)
+    lazy = load_pdb(name, lazy=True, cache_size=2)
+    assert (len(lazy) == len(eager))
+    # out of order, and negative indices
+    for i in [5, 0, 8, -1, 3, 5]:
+      same_frames([lazy[i]], [eager[i]])
+    same_frames(lazy, eager)
+
+  # streamed straight into a trajectory
+  trajectory = load_trajectory(filename + '.gz')
+  assert (np.array_equal(trajectory.coordinates, np.array([frame.coordinates for frame in eager])))
+  same_frames(trajectory, eager)
+  same_frames(load_pdb(filename).trajectory(), eager)
+
+  # a single big model
+  pdb = load_pdb(os.path.join(here, '1mx5.pdb'))
+  assert (len(pdb) == 1 and len(pdb[0]) == 26960)
+  same_frames(load_pdb(os.path.join(here, '1mx5.pdb'), lazy=True), pdb)
+
+  # disk cache: written once, then read back; a changed source is parsed again
+  cache_dir = os.path.join(tmp, 'cache')
+  os.mkdir(cache_dir)
+  same_frames(load_pdb(filename, disk_cache=True, cache_dir=cache_dir), eager)
+  assert (len(os.listdir(cache_dir)) == 1)
+  cached = load_pdb(filename, disk_cache=True, cache_dir=cache_dir)
+  same_frames(cached, eager)
+  assert (isinstance(np.asarray(cached[0].names).base, np.memmap) or isinstance(cached[0].names, np.memmap))
+  shutil.copy(os.path.join(here, '1mx5.pdb'), filename)
+  same_frames(load_pdb(filename, disk_cache=True, cache_dir=cache_dir), pdb)
+  write_pdb(pdbqt, filename)
+
+  # header-only scans, with and without a closing END
+  header = load_header(filename, counts=True)
+  assert (header.counts['models'] == len(eager))
+  with open(filename, 'a') as f:
+    f.write('END\n')
+  assert (load_header(filename, counts=True).counts['models'] == len(eager))
+  assert (load_header(filename + '.gz', counts=True).counts['models'] == len(eager))
+  assert (header.counts['atoms'] == sum(len(frame) for frame in eager))
+  assert (header.counts['first_model_atoms'] == len(eager[0]))
+  assert (load_header(os.path.join(here, '1mx5.pdb')).title == pdb.title)
+
+  # column projection and storage policy
+  projected = load_pdb(filename, fields=['names'])
+  assert (np.array_equal(projected[0].names, eager[0].names))
+  assert (np.array_equal(projected[0].coordinates, eager[0].coordinates))
+  assert (not np.asarray(projected[0].charges).any())
+  compact = load_pdb(filename, dtype=np.float32, categorical=True)
+  assert (compact[0].coordinates.dtype == np.float32)
+  assert (np.allclose(compact[0].coordinates, eager[0].coordinates, atol=1e-3))
+  assert (np.array_equal(np.asarray(compact[0].names), np.asarray(eager[0].names)))
+finally:
+  shutil.rmtree(tmp)
+
+print('pdb readers: OK')
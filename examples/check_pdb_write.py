@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+import io
+import tempfile
+import os.path
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+
+# Regression checks for the PDB/PDBQT/PQR writers: PDBQT keeps its
+#   AutoDock types, large serials go out in hybrid-36 and come back, and
+#   occupancies and B-factors too wide for their columns are written as
+#   their defaults (coordinates refused), and elements stay two characters
+
+here = os.path.dirname(os.path.abspath(__file__))
+filename = os.path.join(here, 'out-methyl-L-ph.pdbqt')
+
+def atom_types(lines):
+  return [line[77:].strip() for line in lines if line.startswith('ATOM') or line.startswith('HETATM')]
+
+with open(filename) as f:
+  source = atom_types(f.read().splitlines())
+pdbqt = load_pdbqt(filename)
+assert ('A' in source and 'HD' in source)
+
+# AutoDock types survive frames, trajectories and the disk cache
+out = io.StringIO()
+write_pdbqt(pdbqt, out)
+assert (atom_types(out.getvalue().splitlines()) == source)
+out = io.StringIO()
+write_pdbqt(pdbqt.trajectory()[:], out)
+assert (atom_types(out.getvalue().splitlines()) == source)
+assert (np.array_equal(pdbqt[0].types[:2], ['C', 'C']) and 'A' not in pdbqt[0].types)
+with tempfile.TemporaryDirectory() as cache_dir:
+  for i in range(2):
+    cached = load_pdbqt(filename, disk_cache=True, cache_dir=cache_dir)
+    out = io.StringIO()
+    write_pdbqt(cached, out)
+    assert (atom_types(out.getvalue().splitlines()) == source)
+
+# large serial numbers, written and read back
+frame = pdbqt[0]
+frame.indices = frame.indices + 131071
+frame.resids = np.full(len(frame), 10**4 + 5)
+out = io.StringIO()
+write_pdb(frame, out)
+lines = out.getvalue().splitlines()
+assert (lines[0][6:11] == 'A0NZ4' and lines[0][22:26] == 'A005'), lines[0]
+parsed = next(PDB(filename, PDBQT=True, stream=True).parse_frames([line.encode() for line in lines]))
+assert (np.array_equal(parsed.indices, frame.indices))
+assert (np.array_equal(parsed.resids, frame.resids))
+
+# numbers that don't fit their columns
+frame.temp_factors = np.full(len(frame), 1000.)
+frame.temp_factors[0] = 12.5
+frame.occupancies = np.full(len(frame), -100.)
+out = io.StringIO()
+write_pdb(frame, out)
+lines = [line for line in out.getvalue().splitlines() if line.startswith('ATOM') or line.startswith('HETATM')]
+assert (lines[0][54:66] == '  1.00 12.50'), lines[0]
+assert (all(line[54:66] == '  1.00  0.00' for line in lines[1:])), lines[1]
+assert (all(len(line) == len(lines[0]) for line in lines))
+frame.temp_factors = np.full(len(frame), 999.99)
+frame.occupancies = np.ones(len(frame))
+out = io.StringIO()
+write_pdb(frame, out)
+assert (out.getvalue().splitlines()[0][60:66] == '999.99')
+
+# types longer than the element field (made from names like OXT)
+records = [b'ATOM      1  OXT ALA A   1       1.000   2.000   3.000  1.00  0.00',
+           b'HETATM    2 CA    CA A   2       4.000   5.000   6.000  1.00  0.00']
+oxt = next(PDB(filename, stream=True).parse_frames(records))
+assert (list(oxt.types) == ['OXT', 'CA']), oxt.types
+lines = format_atoms(oxt).splitlines()
+assert ([line[76:78] for line in lines] == [' O', 'CA']), lines
+assert (all(len(line) == 80 for line in lines)), lines
+frame.coordinates = frame.coordinates + 1e5
+try:
+  write_pdb(frame, io.StringIO())
+  assert (False), "coordinates of 1e5 were written"
+except AssertionError as e:
+  assert ('coordinates' in str(e)), e
+
+print('pdb writers: OK')
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+import os.path
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+from compchem.select import *
+
+# Regression checks for the selection language: masks agree with the
+#   same conditions written out on the per-atom arrays, and bad
+#   selections fail with an assertion
+
+here = os.path.dirname(os.path.abspath(__file__))
+frame = load_pdb(os.path.join(here, '1mx5.pdb'))[0]
+crd = np.asarray(frame.coordinates)
+chains, resnames, names = np.asarray(frame.chains), np.asarray(frame.resnames), np.asarray(frame.names)
+resids = np.asarray(frame.resids)
+
+expected = {
+  'all':                          np.ones(len(frame), dtype=bool),
+  'none':                         np.zeros(len(frame), dtype=bool),
+  'chain A':                      chains == 'A',
+  'chain A B and resname HOH':    np.isin(chains, ['A', 'B']) & (resnames == 'HOH'),
+  'name CA and resid 10 to 20':   (names == 'CA') & (resids >= 10) & (resids <= 20),
+  'name C* and not name CA':      (np.char.startswith(names.astype(str), 'C')) & (names != 'CA'),
+  'x < 0 or (z >= 10)':           (crd[:,0] < 0) | (crd[:,2] >= 10),
+  'index 0 5 7':                  np.isin(np.arange(len(frame)), [0, 5, 7]),
+  'resname "AND"':                resnames == 'AND',
+}
+for text, mask in expected.items():
+  assert (np.array_equal(frame.select(text), mask)), 'Selection "%s"' % text
+
+# within and same residue, against brute force
+ligand = frame.select('resname HTQ and chain A')
+d = np.sqrt(((crd[:, np.newaxis, :] - crd[ligand][np.newaxis, :, :])**2).sum(axis=2)).min(axis=1)
+assert (np.array_equal(frame.select('within 4 of (resname HTQ and chain A)'), d <= 4.))
+near = frame.select('same residue as (name CA and resid 5)')
+keys = set(zip(chains[frame.select('name CA and resid 5')], resids[frame.select('name CA and resid 5')]))
+assert (np.array_equal(near, np.array([(c, r) in keys for c, r in zip(chains, resids)])))
+
+# compiled once, static parts cached per topology
+assert (compile_selection('chain A') is compile_selection('chain A'))
+assert (compile_selection('chain A').static and not compile_selection('x > 1').static)
+
+for text in ('chain A and', 'resid', 'within of chain A', '(chain A', 'chain A )', 'x <'):
+  try:
+    frame.select(text)
+  except AssertionError:
+    continue
+  assert (False), 'Selection "%s" should fail' % text
+
+print('select: OK')
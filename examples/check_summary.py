@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+import os, os.path
+import tempfile
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+
+# Regression checks for directory ingestion: header-only counts agree
+#   with full parses (also for models closed by an END and for blank chain
+#   ids next to explicit ones), full parses fill in chains and residues
+#   too, and summaries write out as CSV and .npz
+
+here = os.path.dirname(os.path.abspath(__file__))
+full = summarize_pdbs([here])
+header = summarize_pdbs([here], header=True)
+assert (len(full) == 3 and [row['filename'] for row in full] == [row['filename'] for row in header])
+for a, b in zip(full, header):
+  assert (a['error'] == '' and b['error'] == ''), (a['error'], b['error'])
+  for column in ('frames', 'atoms', 'chains', 'residues'):
+    assert (a[column] != '' and a[column] == b[column]), (a['filename'], column, a[column], b[column])
+frame = load_pdb(os.path.join(here, '1mx5.pdb'))[0]
+row = summarize_pdb(os.path.join(here, '1mx5.pdb'))
+assert (row['residues'] == hierarchy(frame).n_residues and row['chains'] == 6)
+
+# processes and batches don't change the rows
+assert (summarize_pdbs([here], processes=2, batch=1) == full)
+
+with tempfile.TemporaryDirectory() as tmp:
+  summarize_pdbs([here], output=os.path.join(tmp, 'summary.csv'))
+  with open(os.path.join(tmp, 'summary.csv')) as f:
+    assert (len(f.read().splitlines()) == 4)
+  summarize_pdbs([here], output=os.path.join(tmp, 'summary.npz'))
+  table = np.load(os.path.join(tmp, 'summary.npz'))
+  assert (np.array_equal(table['residues'], [row['residues'] for row in full]))
+
+  # four models and an END; a blank chain id after chain A is read as A,
+  #   and the one after a TER as B
+  atoms = ['ATOM      1  N   ALA A   1       0.000   0.000   0.000  1.00  0.00           N',
+           'ATOM      2  N   GLY     2       1.000   0.000   0.000  1.00  0.00           N',
+           'TER',
+           'ATOM      3  N   SER B   3       2.000   0.000   0.000  1.00  0.00           N',
+           'ATOM      4  N   CYS     4       3.000   0.000   0.000  1.00  0.00           N']
+  filename = os.path.join(tmp, 'models.pdb')
+  with open(filename, 'w') as f:
+    for i in range(4):
+      f.write('MODEL     %4d\n' % (i+1) + '\n'.join(atoms) + '\nENDMDL\n')
+    f.write('END\n')
+  a, b = summarize_pdb(filename), summarize_pdb(filename, header=True)
+  assert (a['error'] == '' and b['error'] == ''), (a['error'], b['error'])
+  for column, value in (('frames', 4), ('atoms', 4), ('chains', 2), ('residues', 4)):
+    assert (a[column] == b[column] == value), (column, a[column], b[column])
+
+print('summary: OK')
@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+
+import numpy as np
+from compchem import *
+from compchem.superpose import *
+from compchem.pairwise import *
+
+# Regression checks for compchem.superpose and compchem.pairwise: QCP
+#   RMSDs agree with Kabsch, including the near-identical pairs that QCP
+#   polishes, and mirror images aren't superposed by a reflection
+
+rng = np.random.default_rng(7)
+X = rng.normal(size=(40, 3)) * 5.
+Ys = []
+for i in range(20):
+  R = np.linalg.qr(rng.normal(size=(3, 3)))[0]
+  R *= np.sign(np.linalg.det(R))
+  Ys.append(X.dot(R) + rng.normal(size=3) * 10. + rng.normal(size=X.shape) * 0.1 * (i % 4))
+Ys = np.array(Ys)
+
+R, t, rms = kabsch_batch(Ys, X)
+assert (np.allclose(qcp_rmsd(Ys, X), rms, atol=1e-9))
+# rotated and moved copies superpose exactly
+assert (np.allclose(rms[::4], 0., atol=1e-9))
+assert (np.allclose(np.matmul(Ys[::4], R[::4]) + t[::4, np.newaxis], X, atol=1e-9))
+# a mirror image stays apart
+assert (qcp_rmsd(X * [1, 1, -1], X) > 1.)
+# weights
+w = rng.uniform(0.5, 2., len(X))
+assert (np.allclose(qcp_rmsd(Ys, X, w), kabsch_batch(Ys, X, w)[2], atol=1e-9))
+
+# the pairwise matrix against the pair by pair values
+D = rmsd_matrix(Ys, superpose=True)
+assert (np.allclose(D, D.T) and np.allclose(np.diag(D), 0., atol=1e-7))
+assert (np.allclose(D[0], qcp_rmsd(Ys, Ys[0]), atol=1e-9))
+D = rmsd_matrix(Ys, [X])
+assert (np.allclose(D[:,0], np.sqrt(((Ys - X)**2).sum(axis=2).mean(axis=1))))
+
+print('superpose: OK')
@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+
+import os.path
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+
+# Regression checks for compchem.trajectory: slices of a trajectory are
+#   trajectories that still make proper frames
+
+here = os.path.dirname(os.path.abspath(__file__))
+t = load_pdbqt(os.path.join(here, 'out-methyl-L-ph.pdbqt')).trajectory()
+assert (len(t) > 4), "Expected a multi-model PDBQT!"
+
+s = t[2:5]
+assert (len(s) == 3)
+assert (s.frame_class is t.frame_class)
+assert (isinstance(s[0], t.frame_class))
+assert (np.array_equal(s[0].coordinates, t[2].coordinates))
+assert (np.array_equal(s[0].names, t[2].names))
+for i,frame in enumerate(s):
+  assert (np.array_equal(frame.coordinates, t[2 + i].coordinates))
+assert (np.array_equal(s.select('not hydrogen'), t.select('not hydrogen')))
+# slices of slices too
+assert (np.array_equal(s[1:][0].coordinates, t[3].coordinates))
+
+print('trajectory: OK')
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+
+import os.path
+import numpy as np
+from compchem import *
+from compchem.pdb import *
+from compchem.transform import *
+
+# Regression checks for compchem.transform and the deferred moves of
+#   frames and trajectories: fused transforms move atoms like the same
+#   steps done one at a time, trajectory frames move the trajectory, and
+#   one matrix per frame moves every frame like its own transform
+
+here = os.path.dirname(os.path.abspath(__file__))
+frame = load_pdbqt(os.path.join(here, 'out-methyl-L-ph.pdbqt'))[0]
+start = np.array(frame.coordinates)
+
+# "A then B" is A.dot(B), for row vectors
+R = euler_rotation(0.3, -1.1, 2.0)
+assert (np.allclose(R.dot(R.T), np.identity(3)) and np.isclose(np.linalg.det(R), 1.))
+A, B = rotation(R, about=(1., 2., 3.)), translation((4., -5., 6.))
+expected = (start.dot(R) + (np.array((1., 2., 3.)) - np.array((1., 2., 3.)).dot(R))) + (4., -5., 6.)
+assert (np.allclose(transform_point(A.dot(B), start), expected))
+crd = start.copy()
+assert (apply_transform(crd, A.dot(B)) is crd and np.allclose(crd, expected))
+assert (np.allclose(transform_point(rotation(R, about=start[0]), start[0]), start[0]))
+
+# moves are queued, then done in one pass when the coordinates are read
+center = frame.measure_center()
+frame.translate(1., 2., 3.)
+frame.rotate(0.3, -1.1, 2.0)
+assert (frame.pending_transform is not None)
+assert (np.allclose(frame.measure_center(), center + (1., 2., 3.)))
+moved = (start + (1., 2., 3.) - (center + (1., 2., 3.))).dot(R) + center + (1., 2., 3.)
+assert (np.allclose(frame.coordinates, moved) and frame.pending_transform is None)
+frame.center()
+assert (np.allclose(frame.measure_center(), 0.))
+
+# aligning undoes a rigid move
+frame.coordinates = start.copy()
+other = load_pdbqt(os.path.join(here, 'out-methyl-L-ph.pdbqt'))[0]
+other.rotate(1., 2., 3.)
+other.translate(10., 0., -5.)
+R, t, rms = other.align(frame)
+assert (rms < 1e-9 and np.allclose(other.coordinates, start))
+
+# one transform per trajectory frame, and frames that move their trajectory
+traj = load_pdbqt(os.path.join(here, 'out-methyl-L-ph.pdbqt')).trajectory()
+before = traj.coordinates.copy()
+M = np.array([rotation(euler_rotation(0.1 * i, 0., 0.), about=(1., 1., 1.)) for i in range(len(traj))])
+traj.transform(M)
+for i in range(len(traj)):
+  assert (np.allclose(traj.coordinates[i], transform_point(M[i], before[i])))
+f = traj[2]
+f.translate(0., 0., 1.)
+f.apply()
+assert (np.allclose(traj.coordinates[2], transform_point(M[2], before[2]) + (0., 0., 1.)))
+traj.center()
+assert (np.allclose(traj.measure_center(), 0.))
+R, t, rms = traj.align(traj[0])
+assert (np.allclose(rms[0], 0.) and rms.shape == (len(traj),))
+
+# one matrix per frame, on a float32 block and a strided view
+M = np.array([rotation(euler_rotation(0.1*i, 0.2, -0.3*i), about=(1., 0., 2.)).dot(translation((i, -i, 0.5)))
+              for i in range(len(traj))])
+coordinates = np.asarray(traj.coordinates, dtype=float)
+expected = np.array([apply_transform(crd.copy(), m) for crd, m in zip(coordinates, M)])
+block = coordinates.astype(np.float32)
+assert (apply_transform(block, M, chunk=50) is block and np.allclose(block, expected, atol=1e-4))
+padded = np.zeros(coordinates.shape[:1] + (2*coordinates.shape[1], 3))
+padded[:, ::2] = coordinates
+apply_transform(padded[:, ::2], M)
+assert (np.allclose(padded[:, ::2], expected) and not padded[:, 1::2].any())
+
+print('transform: OK')
@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+
+import sys
+import os, os.path
+import csv
+import glob
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from compchem import *
+from compchem.pdb import *
+from compchem.trajectory import *
+
+# Batch version of align_amber_to_vina.py: aligns an AMBER ligand onto many
+#   docked poses in one run. Every PDBQT's poses are aligned together, the
+#   bond graphs are matched once per ligand and pose topology (symmetric
+#   atoms are still paired pose by pose, like the single-pose script),
+#   and the files are spread over a process pool. Aligned ligands are
+#   streamed to a multi-model PDB (in input order), RMSDs to a CSV
+
+
+# per-process caches, so every worker parses each ligand and maps each
+#   topology only once
+ligands = {}
+mappings = {}
+
+
+def load_ligand(ligand_fn):
+  if ligand_fn not in ligands:
+    ligands[ligand_fn] = load_pdb(ligand_fn)[0]
+  return ligands[ligand_fn]
+
+
+def atom_mapping(ligand_fn, poses):
+  # (pose, ligand) heavy atom mapping, shared by all PDBQTs whose poses
+  #   have the same atoms in the same order. Only the bond graph part is
+  #   shared: symmetric atoms are paired on each pose's own coordinates
+  key = (ligand_fn, np.asarray(poses.names).astype(str).tobytes(), np.asarray(poses.types).astype(str).tobytes())
+  if key not in mappings:
+    ligand = load_ligand(ligand_fn)
+    mappings[key] = FrameMapping(poses[0], ligand, poses.select('not type H'), ligand.select('not type H'))
+  return mappings[key]
+
+
+def align_poses(ligand_fn, pdbqt_fn, frames=None):
+  # Ligand moved onto each pose (all poses of the PDBQT if frames is
+  #   None). Returns frame numbers, mapped atom count, initial and final
+  #   RMSDs, and the aligned ligand coordinates (n_frames, n_atoms, 3)
+  ligand = load_ligand(ligand_fn)
+  docked = load_pdbqt(pdbqt_fn, lazy=True)
+  if frames is None:
+    frames = range(len(docked))
+  frames = list(frames)
+  poses = Trajectory(frames=[docked[i] for i in frames])
+  # Poses pair the same ligand atoms, but symmetric ones may go to
+  #   different pose atoms, so the pose atoms are put in ligand order
+  mapping = atom_mapping(ligand_fn, poses)
+  pairs = [mapping.pairs(pose, ligand.coordinates) for pose in poses.coordinates]
+  mmapped = np.sort(pairs[0][1])
+  for tmapped, m in pairs:
+    assert (np.array_equal(np.sort(m), mmapped)), "Poses of %s map different ligand atoms!" % pdbqt_fn
+  order = np.array([tmapped[np.argsort(m)] for tmapped, m in pairs])
+  X = poses.coordinates[np.arange(len(frames))[:, np.newaxis], order]
+  Y = np.asarray(ligand.coordinates)[mmapped]
+  # initial RMSD as align_amber_to_vina.py reports it, both centered
+  diff = (X - poses.measure_center()[:, np.newaxis, :]) - (Y - ligand.measure_center())
+  initial = np.sqrt(np.mean(np.sum(np.square(diff), axis=2), axis=1))
+  # Batched Kabsch fits every pose onto the one ligand; inverting those
+  #   moves the ligand onto each pose instead (same RMSD)
+  R, t, final = kabsch_batch(X, Y)
+  Rinv = R.transpose(0, 2, 1)
+  coordinates = np.matmul(np.asarray(ligand.coordinates)[np.newaxis] - t[:, np.newaxis, :], Rinv)
+  return frames, len(mmapped), initial, final, coordinates
+
+
+def run_job(job):
+  # worker side of one (ligand, pdbqt, frames) job; errors are reported
+  #   back rather than stopping the batch
+  try:
+    return align_poses(*job)
+  except Exception as e:
+    return '%s: %s' % (e.__class__.__name__, e)
+
+
+def read_manifest(manifest_fn):
+  # jobs from lines of "ligand.pdb docked.pdbqt [frame ...]", where the
+  #   PDBQT may be a glob and no frames means every frame
+  jobs = []
+  for line in open(manifest_fn):
+    fields = line.split('#')[0].split()
+    if len(fields) == 0: continue
+    assert (len(fields) >= 2), 'Manifest line needs a PDB and a PDBQT: "%s"' % line.strip()
+    frames = [int(x) for x in fields[2:]] if len(fields) > 2 else None
+    for pdbqt_fn in expand(fields[1]):
+      jobs.append((fields[0], pdbqt_fn, frames))
+  return jobs
+
+
+def expand(pattern):
+  # files matching a glob, or the name itself if it's not a pattern
+  matches = sorted(glob.glob(pattern))
+  if len(matches) == 0 and not glob.has_magic(pattern):
+    return [pattern]
+  return matches
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Align an AMBER ligand onto many AutoDock Vina poses.')
+  parser.add_argument('ligand', nargs='?', help='AMBER ligand PDB (mobile)')
+  parser.add_argument('pdbqts', nargs='*', help='docked PDBQT files or globs; every frame is aligned')
+  parser.add_argument('-m', '--manifest', help='file of "ligand.pdb docked.pdbqt [frame ...]" lines')
+  parser.add_argument('-o', '--output', default='ALIGNED.pdb', help='multi-model PDB of aligned ligands')
+  parser.add_argument('-c', '--csv', default='ALIGNED.csv', help='CSV of initial and final RMSDs')
+  parser.add_argument('-j', '--processes', type=int, default=os.cpu_count(), help='worker processes')
+  args = parser.parse_args()
+
+  jobs = []
+  if args.manifest is not None:
+    jobs += read_manifest(args.manifest)
+  if args.ligand is not None:
+    for pattern in args.pdbqts:
+      jobs += [(args.ligand, pdbqt_fn, None) for pdbqt_fn in expand(pattern)]
+  if len(jobs) == 0:
+    parser.print_usage()
+    sys.exit()
+  for ligand_fn in set(job[0] for job in jobs):
+    if not os.path.exists(ligand_fn):
+      print('Error: PDB file "%s" does not exist. Quitting.' % ligand_fn)
+      sys.exit()
+
+  with open(args.output, 'w') as out, open(args.csv, 'w', newline='') as rmsd_out:
+    table = csv.writer(rmsd_out)
+    table.writerow(['model', 'ligand', 'pdbqt', 'frame', 'mapped_atoms', 'initial_rmsd', 'final_rmsd'])
+    model = [1]
+
+    def emit(job, result):
+      # write one job's aligned poses and RMSDs, in input order
+      ligand_fn, pdbqt_fn, frames = job
+      if isinstance(result, str):
+        print('!! Skipping %s: %s' % (pdbqt_fn, result), file=sys.stderr)
+        return
+      frames, mapped, initial, final, coordinates = result
+      write_pdb(Trajectory(topology=load_ligand(ligand_fn), coordinates=coordinates), out, model=model[0])
+      for i,frame in enumerate(frames):
+        table.writerow([model[0] + i, ligand_fn, pdbqt_fn, frame, mapped, '%.3f' % initial[i], '%.3f' % final[i]])
+      model[0] += len(frames)
+
+    if args.processes <= 1:
+      for job in jobs:
+        emit(job, run_job(job))
+    else:
+      # a couple of jobs per worker in flight, collected in submission
+      #   order so the output is streamed as it's finished
+      with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        pending = deque()
+        for job in jobs:
+          pending.append((job, pool.submit(run_job, job)))
+          if len(pending) >= 2*args.processes:
+            job, result = pending.popleft()
+            emit(job, result.result())
+        while len(pending) > 0:
+          job, result = pending.popleft()
+          emit(job, result.result())
+
+
+if __name__ == '__main__':
+  main()
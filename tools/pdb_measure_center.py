@@ -4,7 +4,8 @@ from compchem import *
 from compchem.pdb import *
 import sys
 
-a = load_pdb(sys.argv[1])
+# only coordinates are needed, so no other column is decoded
+a = load_pdb(sys.argv[1], lazy=True, fields=[])
 frame0 = a[0]
 
 print(frame0.measure_center())
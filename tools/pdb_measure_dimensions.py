@@ -4,7 +4,7 @@ from compchem import *
 from compchem.pdb import *
 import sys
 
-a = load_pdb(sys.argv[1])
+a = load_pdb(sys.argv[1], lazy=True)
 frame0 = a[0]
 
 print(frame0.measure_dimensions())
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+import time
+import argparse
+# first, so PyOpenGL is set up for offscreen contexts
+from compchem.offscreen import *
+from compchem import *
+from compchem.pdb import *
+from compchem.transform import *
+
+# Render the first frame of a structure file headless (EGL, or OSMesa with
+#   PYOPENGL_PLATFORM=osmesa; software GL, no GPU or display needed) to a
+#   PPM image, and optionally time redraws of the retained-mode renderer
+#   while turning the structure
+
+parser = argparse.ArgumentParser(description='Render a PDB/PDBQT/PQR file offscreen.')
+parser.add_argument('filename', help='structure file')
+parser.add_argument('-o', '--output', default='render.ppm', help='output image (PPM)')
+parser.add_argument('-s', '--size', default='800x600', help='image size, WIDTHxHEIGHT')
+parser.add_argument('-b', '--benchmark', type=int, default=0, help='number of redraws to time')
+args = parser.parse_args()
+
+width, height = [int(n) for n in args.size.lower().split('x')]
+frame = load_pdb(args.filename, lazy=True, fields=['types', 'radii'])[0]
+
+with OffscreenContext(width, height) as context:
+  glEnable(GL_DEPTH_TEST)
+  start = time.time()
+  renderer = Renderer(frame)
+  print('%d atoms uploaded in %.1f ms' % (len(frame), 1000. * (time.time() - start)))
+  camera, far = fit_camera(frame.coordinates)
+  projection = perspective(40., width / height, 0.5, far)
+  center = frame.measure_center()
+  clear()
+  renderer.draw(camera, projection, height)
+  write_ppm(context.pixels(), args.output)
+  if args.benchmark > 0:
+    step = rotation(euler_rotation(0., 0.05, 0.), about=center)
+    model = identity()
+    glFinish()
+    start = time.time()
+    for i in range(args.benchmark):
+      model = model.dot(step)
+      clear()
+      renderer.draw(model.dot(camera), projection, height)
+    glFinish()
+    print('%.2f ms per redraw' % (1000. * (time.time() - start) / args.benchmark))
+  renderer.delete()
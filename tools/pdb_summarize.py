@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import argparse
+from compchem import *
+from compchem.pdb import *
+
+# Summarize every structure file in directories/globs (e.g. a local PDB
+#   mirror): frames, atoms, title, center and dimensions per file, as CSV
+#   (or .npz columns) to -o, or CSV on stdout. --header catalogs titles and
+#   counts without parsing any coordinates. Files that fail to parse are
+#   listed with the error on stderr
+
+parser = argparse.ArgumentParser(description='Summarize a directory of PDB/PDBQT/PQR files.')
+parser.add_argument('paths', nargs='+', help='directories (searched recursively), globs or files')
+parser.add_argument('-o', '--output', help='summary table, .csv or .npz (CSV on stdout if not given)')
+parser.add_argument('--header', action='store_true', help='header records and counts only (no coordinates)')
+parser.add_argument('-j', '--processes', type=int, default=os.cpu_count(), help='worker processes')
+args = parser.parse_args()
+
+output = sys.stdout if args.output is None else args.output
+rows = summarize_pdbs(args.paths, processes=args.processes, output=output, header=args.header)
+errors = [row for row in rows if row['error'] != '']
+print('%d files, %d failed' % (len(rows), len(errors)), file=sys.stderr)
+for row in errors:
+  print('!! %s: %s' % (row['filename'], row['error']), file=sys.stderr)